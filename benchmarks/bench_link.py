@@ -0,0 +1,73 @@
+'''
+Microbenchmark Link header parsing against the previous two-regex parser.
+
+Run like:
+
+  poetry run python benchmarks/bench_link.py [n]
+'''
+
+import re
+import sys
+import timeit
+import igsn_lib
+
+HEADER_VALUE_SPLIT = re.compile("(?:[\"<].*?[\">]|[^,])+")
+HEADER_PROPERTY_SPLIT = re.compile("(?:[\"<].*?[\">]|[^;])+")
+
+HEADERS = [
+    '<meta.rdf>;rel="meta"',
+    '<https://one.example.com>; rel="preconnect", <https://two.example.com>; rel="preconnect", <https://three.example.com>; rel="preconnect"',
+    '<https://app.geosamples.org/webservices/display.php?igsn=IEEJR000M>; rel="describedby"; type="application/ld+json", '
+    '<https://app.geosamples.org/sample/igsn/IEEJR000M>; rel="alternate"; type="text/html"; title="Landing page"',
+]
+
+
+def _uriValue(v):
+    v = v.strip()
+    if v[0] != '<' and v[-1] != '>':
+        raise ValueError(f"Not a URI: '{v}'")
+    return v[1:-1]
+
+
+def _propValue(v):
+    v = v.strip()
+    try:
+        return _uriValue(v)
+    except:
+        pass
+    if v[0] != '"' and v[-1] != '"':
+        raise ValueError(f"Expected quoted value: '{v}'")
+    return v[1:-1]
+
+
+def legacyParseLinkHeader(hv):
+    res = []
+    vals = re.findall(HEADER_VALUE_SPLIT, hv)
+    for val in vals:
+        entry = {}
+        try:
+            props = re.findall(HEADER_PROPERTY_SPLIT, val)
+            entry['href'] = _uriValue(props[0])
+            for prop in props[1:]:
+                k, v = prop.strip().split("=", 1)
+                entry[k] = _propValue(v)
+            res.append(entry)
+        except ValueError as e:
+            pass
+    return res
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for i, hv in enumerate(HEADERS):
+        assert igsn_lib.parseLinkHeader(hv) == legacyParseLinkHeader(hv)
+        for name, func in (
+            ("parseLinkHeader", igsn_lib.parseLinkHeader),
+            ("legacy", legacyParseLinkHeader),
+        ):
+            elapsed = timeit.timeit(lambda: func(hv), number=n)
+            print(f"header {i} {name:>16}: {1.0e6 * elapsed / n:8.2f} us/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+'''
+Benchmark oaiRecordToDict parsing engines.
+
+Reports records per second for each engine on a set of synthetic IGSN
+OAI-PMH records. Run like:
+
+  poetry run python benchmarks/bench_oai.py [n_records]
+'''
+
+import sys
+import time
+import igsn_lib.oai
+
+RECORD_TEMPLATE = """<record xmlns="http://www.openarchives.org/OAI/2.0/" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+<header>
+    <identifier>oai:registry.igsn.org:{n}</identifier>
+    <datestamp>2019-10-15T06:{m:02d}:{s:02d}Z</datestamp>
+    <setSpec>IEDA</setSpec>
+    <setSpec>IEDA.SESAR</setSpec>
+</header>
+<metadata>
+    <sample xmlns="http://igsn.org/schema/kernel-v.1.0"
+            xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+            xsi:schemaLocation="http://igsn.org/schema/kernel-v.1.0 http://doidb.wdc-terra.org/igsn/schemas/igsn.org/schema/1.0/igsn.xsd">
+        <sampleNumber identifierType="igsn">10273/BSU{n:06d}</sampleNumber>
+        <registrant>
+            <registrantName>IEDA</registrantName>
+        </registrant>
+        <log>
+            <logElement event="submitted" timeStamp="2019-10-15T04:{m:02d}:{s:02d}Z"/>
+            <logElement event="updated" timeStamp="2020-01-01T00:{m:02d}:{s:02d}Z"/>
+        </log>
+        <relatedResourceIdentifiers>
+            <relatedIdentifier relatedIdentifierType="IGSN" relationType="IsPartOf">BSU{p:06d}</relatedIdentifier>
+        </relatedResourceIdentifiers>
+    </sample>
+</metadata>
+</record>"""
+
+
+def records(n):
+    return [
+        RECORD_TEMPLATE.format(n=i, m=(i // 60) % 60, s=i % 60, p=i // 10)
+        for i in range(n)
+    ]
+
+
+def bench(raws, **kwargs):
+    t0 = time.perf_counter()
+    for raw in raws:
+        igsn_lib.oai.oaiRecordToDict(raw, **kwargs)
+    return len(raws) / (time.perf_counter() - t0)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    raws = records(n)
+    for engine in (igsn_lib.oai.ENGINE_XMLTODICT, igsn_lib.oai.ENGINE_ETREE):
+        # warm up
+        bench(raws[:50], engine=engine)
+        print(f"{engine:>10}: {bench(raws, engine=engine):10.0f} records/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+'''
+Benchmark resolver latency per identifier with and without a pooled session.
+
+A local stand-in server answers the igsn.org -> handle -> landing page chain.
+Since handshakes on localhost are nearly free, an optional delay is added to
+each new connection to emulate the TCP+TLS setup cost of remote hosts.
+Run like:
+
+  poetry run python benchmarks/bench_resolve.py [n_identifiers] [connect_delay_ms]
+'''
+
+import sys
+import time
+import threading
+import http.server
+import requests
+import igsn_lib
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connect_delay = 0.0
+
+    def setup(self):
+        time.sleep(self.connect_delay)
+        super().setup()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        route, ident = self.path.strip("/").split("/", 1)
+        base = f"http://{self.server.server_address[0]}:{self.server.server_address[1]}"
+        if route == "igsn":
+            self.send_response(302)
+            self.send_header("Location", f"{base}/hdl/{ident}")
+        elif route == "hdl":
+            self.send_response(302)
+            self.send_header("Location", f"{base}/landing/{ident}")
+        else:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+def bench(identifiers, session):
+    t0 = time.perf_counter()
+    for identifier in identifiers:
+        igsn_lib.resolve(identifier, session=session)
+    return (time.perf_counter() - t0) / len(identifiers)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    Handler.connect_delay = (float(sys.argv[2]) if len(sys.argv) > 2 else 0.0) / 1000.0
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    igsn_lib.IGSN_RESOLVER_URL = f"http://127.0.0.1:{server.server_address[1]}/igsn/"
+    identifiers = [f"BSU{i:06d}" for i in range(n)]
+    # requests module level functions open a new connection per call
+    cases = [
+        ("requests.head", requests),
+        ("pooled session", igsn_lib.createHttpSession()),
+    ]
+    for name, session in cases:
+        print(f"{name:>16}: {1000.0 * bench(identifiers, session):8.2f} ms/identifier")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+'''
+Microbenchmark Julian date conversion against astropy.
+
+Run like:
+
+  poetry run python benchmarks/bench_time.py [n]
+'''
+
+import sys
+import datetime
+import timeit
+import astropy.time
+import igsn_lib.time
+
+
+def astropyDatetimeToJD(dt):
+    return astropy.time.Time(dt).jd
+
+
+def astropyJdToDateTime(jd):
+    return astropy.time.Time(jd, format="jd").to_datetime(datetime.timezone.utc)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    dt = igsn_lib.time.dtnow()
+    jd = igsn_lib.time.datetimeToJD(dt)
+    cases = [
+        ("datetimeToJD", lambda: igsn_lib.time.datetimeToJD(dt)),
+        ("astropy Time(dt).jd", lambda: astropyDatetimeToJD(dt)),
+        ("jdToDateTime", lambda: igsn_lib.time.jdToDateTime(jd)),
+        ("astropy Time(jd).to_datetime", lambda: astropyJdToDateTime(jd)),
+    ]
+    for name, func in cases:
+        elapsed = timeit.timeit(func, number=n)
+        print(f"{name:>30}: {1.0e6 * elapsed / n:10.2f} us/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,13 @@
 Utility methods for working with IGSNs and dates.
 """
 import logging
+import json
+import hashlib
+import threading
+import concurrent.futures
 import urllib.parse
-import requests
 import re
+from time import perf_counter
 
 __version__ = "0.1.0"
 
@@ -28,49 +32,155 @@ DEFAULT_RESOLVE_HEADERS = {
 """Default headers for talking to the resolver
 """
 
-HEADER_VALUE_SPLIT = re.compile("(?:[\"<].*?[\">]|[^,])+")
-HEADER_PROPERTY_SPLIT = re.compile("(?:[\"<].*?[\">]|[^;])+")
+DEFAULT_POOL_CONNECTIONS = 10
+"""Number of per-host connection pools kept by the resolver HTTP session
+"""
 
-# Note: rel may contain multiple values: https://tools.ietf.org/html/rfc8288#section-3.3
-def _uriValue(v):
-    v = v.strip()
-    if v[0] != '<' and v[-1] != '>':
-        raise ValueError(f"Not a URI: '{v}'")
-    return v[1:-1]
+DEFAULT_POOL_MAXSIZE = 10
+"""Maximum number of connections kept alive per host by the resolver HTTP session
+"""
 
+DEFAULT_RESOLVE_WORKERS = 10
+"""Number of concurrent resolutions made by resolveMany
+"""
 
-def _propValue(v):
-    v = v.strip()
-    try:
-        return _uriValue(v)
-    except:
-        pass
-    # Not a URI so must be a quoted thing.
-    if v[0] != '"' and v[-1] != '"':
-        raise ValueError(f"Expected quoted value: '{v}'")
-    return v[1:-1]
+HOP_HEADERS = (
+    "Location",
+    "Content-Type",
+    "Content-Length",
+    "ETag",
+    "Last-Modified",
+    "Link",
+    "Retry-After",
+)
+"""Response headers retained in a Hop
+"""
+
+DEFAULT_BODY_MEDIA_TYPES = (
+    "application/json",
+    "application/ld+json",
+    "text/json",
+)
+"""Media types of bodies worth retrieving, for use as ``body_types``
+"""
+
+BODY_CHUNK_BYTES = 65536
+"""Size of chunks read when streaming a response body
+"""
 
+DRAIN_BODY_BYTES = 16384
+"""Unwanted bodies up to this size are read so the connection can be reused
+"""
 
+_http_session = None
+_http_session_lock = threading.Lock()
+
+IGSN_PREFIX_PATTERN = re.compile("^[A-Z]+")
+
+LINK_HEADER_TOKEN = re.compile(
+    r'\s*(?:<(?P<href>[^>]*)>'
+    r'|(?P<key>[^\s=;,<>"]+)\s*(?:=\s*(?:"(?P<quoted>[^"]*)"|<(?P<uri>[^>]*)>|(?P<token>[^\s;,"<>]*)))?'
+    r'|(?P<sep>[;,])'
+    r'|(?P<junk>\S))'
+)
+"""Tokens of a Link header value: a <URI>, a parameter, a separator or anything else
+"""
+
+LINK_FOLLOW_RELS = ("describedby", "alternate")
+"""Link relations followed to metadata, in order of preference
+"""
+
+
+# Note: rel may contain multiple values: https://tools.ietf.org/html/rfc8288#section-3.3
 def parseLinkHeader(hv):
+    """
+    Parse the value of a Link header.
+
+    The value is tokenized in a single pass. Parameter names are lower case
+    and values may be quoted strings, <URIs> or bare tokens. Links that are
+    malformed are ignored.
+
+    Args:
+        hv: Link header value
+
+    Returns:
+        list of dict, each with ``href`` and the link parameters
+
+    Examples:
+
+        .. jupyter-execute::
+
+           import igsn_lib
+
+           print(igsn_lib.parseLinkHeader(
+               '<meta.json>; rel="describedby"; type="application/ld+json", <next>; rel=next'
+           ))
+    """
     res = []
-    # split by comma, but not within <> or ""
-    vals = re.findall(HEADER_VALUE_SPLIT, hv)
-    for val in vals:
-        entry = {}
-        try:
-            # Split by semi-colon
-            props = re.findall(HEADER_PROPERTY_SPLIT, val)
-            entry['href'] = _uriValue(props[0])
-            for prop in props[1:]:
-                k, v = prop.strip().split("=", 1)
-                entry[k] = _propValue(v)
-            res.append(entry)
-        except ValueError as e:
-            # Invalid header value, ignore
-            pass
+    entry = None
+    valid = False
+    for m in LINK_HEADER_TOKEN.finditer(hv):
+        href, key, sep = m.group("href", "key", "sep")
+        if href is not None:
+            if entry is not None and valid:
+                # Missing comma between links
+                valid = False
+            else:
+                entry = {"href": href}
+                valid = True
+        elif key is not None:
+            if entry is None:
+                valid = False
+                continue
+            quoted, uri, token = m.group("quoted", "uri", "token")
+            if quoted is not None:
+                entry[key.lower()] = quoted
+            elif uri is not None:
+                entry[key.lower()] = uri
+            elif token is not None:
+                entry[key.lower()] = token
+        elif sep == ",":
+            if entry is not None and valid:
+                res.append(entry)
+            entry = None
+            valid = False
+        elif sep is None:
+            valid = False
+    if entry is not None and valid:
+        res.append(entry)
     return res
 
 
+def metadataLink(response, media_types=None):
+    """
+    URL of a metadata document advertised in the Link header of a response.
+
+    Links with a relation in LINK_FOLLOW_RELS and a type in media_types are
+    considered, preferring relations earlier in LINK_FOLLOW_RELS.
+
+    Args:
+        response: response with headers and url
+        media_types: accepted media types, defaults to DEFAULT_BODY_MEDIA_TYPES
+
+    Returns:
+        absolute URL string or None
+    """
+    hv = response.headers.get("Link")
+    if hv is None:
+        return None
+    if media_types is None:
+        media_types = DEFAULT_BODY_MEDIA_TYPES
+    candidates = {}
+    for entry in parseLinkHeader(hv):
+        if mediaType(entry.get("type")) not in media_types:
+            continue
+        for rel in entry.get("rel", "").lower().split():
+            candidates.setdefault(rel, entry["href"])
+    for rel in LINK_FOLLOW_RELS:
+        if rel in candidates:
+            return urllib.parse.urljoin(response.url, candidates[rel])
+    return None
+
 
 def normalize(igsn_str):
     """
@@ -129,101 +239,816 @@ def normalize(igsn_str):
     return igsn_str
 
 
-def _doResolveStep(url, include_body=False, headers=None, timeout=5):
+def igsnPrefix(igsn_value):
+    """
+    Return the prefix of an IGSN value.
+
+    The prefix is the leading letters of the value, which include the
+    registrant namespace. Identifiers with the same prefix generally resolve
+    to the same provider.
+
+    Args:
+        igsn_value: pre-normalized IGSN string
+
+    Returns:
+        string, or None if the value does not start with a letter
+
+    Examples:
+
+        .. jupyter-execute::
+
+           import igsn_lib
+
+           print(igsn_lib.igsnPrefix("IEEJR000M"))
+           print(igsn_lib.igsnPrefix("prr047915"))
+    """
+    match = IGSN_PREFIX_PATTERN.match(igsn_value.upper())
+    if match is None:
+        return None
+    return match.group(0)
+
+
+def createHttpSession(
+    pool_connections=DEFAULT_POOL_CONNECTIONS,
+    pool_maxsize=DEFAULT_POOL_MAXSIZE,
+    pool_block=False,
+):
+    """
+    Create a requests.Session with connection pooling for resolving identifiers.
+
+    Connections are kept alive and reused across resolve calls, avoiding a new
+    TCP and TLS handshake for every hop. The session may be shared between
+    threads.
+
+    Args:
+        pool_connections: (int) Number of per-host connection pools to cache
+        pool_maxsize: (int) Maximum connections to keep alive per host
+        pool_block: (bool) If True, wait for a free connection rather than
+            opening one beyond pool_maxsize
+
+    Returns:
+        requests.Session
+    """
+    import requests
+    import requests.adapters
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=pool_block,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def getHttpSession():
+    """
+    The shared HTTP session used by the resolver when none is provided.
+
+    Created with :func:`createHttpSession` defaults on first use.
+
+    Returns:
+        requests.Session
+    """
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                _http_session = createHttpSession()
+    return _http_session
+
+
+def mediaType(content_type):
+    """
+    Media type part of a Content-Type header value, lower case.
+
+    Args:
+        content_type: header value, e.g. "text/html; charset=UTF-8"
+
+    Returns:
+        string or None
+
+    Examples:
+
+        .. jupyter-execute::
+
+           import igsn_lib
+
+           print(igsn_lib.mediaType("application/LD+JSON; charset=utf-8"))
+    """
+    if content_type is None:
+        return None
+    return content_type.split(";", 1)[0].strip().lower()
+
+
+def _releaseBody(response):
+    """
+    Discard the unread body of a streamed response.
+
+    Small bodies are read so the connection can be reused, larger ones are
+    abandoned by closing the connection.
+    """
+    try:
+        length = int(response.headers.get("Content-Length", -1))
+    except ValueError:
+        length = -1
+    if 0 <= length <= DRAIN_BODY_BYTES:
+        for chunk in response.iter_content(chunk_size=DRAIN_BODY_BYTES):
+            pass
+    response.close()
+
+
+def _readBody(response, max_body=None):
+    """
+    Read the body of a streamed response, up to max_body bytes.
+
+    Returns:
+        (content, truncated), truncated is True if the body was longer
+    """
+    chunks = []
+    n = 0
+    truncated = False
+    for chunk in response.iter_content(chunk_size=BODY_CHUNK_BYTES):
+        chunks.append(chunk)
+        n += len(chunk)
+        if max_body is not None and n > max_body:
+            truncated = True
+            break
+    content = b"".join(chunks)
+    if truncated:
+        content = content[:max_body]
+        response.close()
+    return content, truncated
+
+
+def _bodyResponse(response, content, truncated):
+    """
+    FakeResponse of a streamed response with the body that was read.
+
+    The body of a streamed requests.Response can not be replaced once its
+    connection has been released, so the content is held by a FakeResponse,
+    as for :mod:`igsn_lib.aio`. ``truncated`` is True if content is shorter
+    than the body and ``sha256`` is the hex digest of content, or None if
+    there is no content.
+    """
+    encoding = response.encoding or "utf-8"
+    return FakeResponse(
+        {
+            "status_code": response.status_code,
+            "url": response.url,
+            "headers": response.headers,
+            "encoding": encoding,
+            "text": content.decode(encoding, errors="replace"),
+            "content": content,
+            "request": response.request,
+            "elapsed": response.elapsed,
+            "truncated": truncated,
+            "sha256": hashlib.sha256(content).hexdigest() if content else None,
+        }
+    )
+
+
+def _doResolveStep(
+    url,
+    include_body=False,
+    headers=None,
+    timeout=5,
+    session=None,
+    max_body=None,
+    body_types=None,
+):
+    """
+    Make one request of a resolution chain.
+
+    The response has ``ttfb``, the seconds until the response headers were
+    received (including connecting), and ``duration``, the seconds until the
+    body was read or discarded. A GET response is a FakeResponse holding the
+    body that was read, see _bodyResponse.
+    """
     L = logging.getLogger("igsn_lib")
-    if include_body:
-        return requests.get(
+    if session is None:
+        session = getHttpSession()
+    t0 = perf_counter()
+    if not include_body:
+        response = session.head(
             url, headers=headers, allow_redirects=False, timeout=timeout
         )
-    return requests.head(url, headers=headers, allow_redirects=False, timeout=timeout)
+        response.ttfb = response.elapsed.total_seconds()
+        response.duration = perf_counter() - t0
+        return response
+    # The body is only read for a 2xx response of an accepted media type
+    response = session.get(
+        url, headers=headers, allow_redirects=False, timeout=timeout, stream=True
+    )
+    ttfb = response.elapsed.total_seconds()
+    content = b""
+    truncated = False
+    if not (200 <= response.status_code < 300) or (
+        body_types is not None
+        and mediaType(response.headers.get("Content-Type")) not in body_types
+    ):
+        _releaseBody(response)
+    else:
+        try:
+            content, truncated = _readBody(response, max_body=max_body)
+        except Exception:
+            response.close()
+            raise
+    response = _bodyResponse(response, content, truncated)
+    response.ttfb = ttfb
+    response.duration = perf_counter() - t0
+    return response
+
+
+def _doLimitedStep(
+    url,
+    include_body=False,
+    headers=None,
+    timeout=5,
+    session=None,
+    max_body=None,
+    body_types=None,
+    limiter=None,
+):
+    """
+    _doResolveStep, waiting for the host limit of limiter if provided.
+    """
+    if limiter is None:
+        return _doResolveStep(
+            url,
+            include_body=include_body,
+            headers=headers,
+            timeout=timeout,
+            session=session,
+            max_body=max_body,
+            body_types=body_types,
+        )
+    host_limiter = limiter.acquire(url)
+    response = None
+    try:
+        response = _doResolveStep(
+            url,
+            include_body=include_body,
+            headers=headers,
+            timeout=timeout,
+            session=session,
+            max_body=max_body,
+            body_types=body_types,
+        )
+        return response
+    finally:
+        limiter.release(host_limiter, response)
+
+
+def _doRetryStep(
+    url,
+    include_body=False,
+    headers=None,
+    timeout=5,
+    session=None,
+    max_body=None,
+    body_types=None,
+    limiter=None,
+    retry=None,
+    breaker=None,
+    collector=None,
+):
+    """
+    _doLimitedStep, retried according to retry and failing fast when the
+    circuit for the host is open in breaker. Each attempt is recorded in
+    collector.
+    """
+    L = logging.getLogger("igsn_lib")
+    attempt = 0
+    while True:
+        if breaker is not None:
+            breaker.check(url)
+        try:
+            response = _doLimitedStep(
+                url,
+                include_body=include_body,
+                headers=headers,
+                timeout=timeout,
+                session=session,
+                max_body=max_body,
+                body_types=body_types,
+                limiter=limiter,
+            )
+        except Exception as e:
+            if breaker is not None:
+                breaker.record(url, None)
+            if collector is not None:
+                collector.record(url, None)
+            if retry is None or not retry.shouldRetry(attempt):
+                raise
+            L.info("Retrying %s after %s", url, e)
+            response = None
+        else:
+            if breaker is not None:
+                breaker.record(url, response)
+            if collector is not None:
+                collector.record(url, response)
+            if retry is None or not retry.shouldRetry(attempt, response):
+                return response
+            L.info("Retrying %s after status %s", url, response.status_code)
+        retry.sleep(attempt, response)
+        attempt += 1
 
 
 class FakeResponse(object):
     def __init__(self, d):
         self.__dict__ = d
 
+    def json(self, **kwargs):
+        return json.loads(self.text, **kwargs)
+
+
+class Hop(object):
+    """
+    Compact record of one response in a resolution chain.
+
+    Holds the URL, status, the headers listed in HOP_HEADERS, the elapsed time
+    and optionally a truncated body and its SHA-256 digest. Unlike a
+    requests.Response it holds no connection or raw content, so many can be
+    kept in memory.
+
+    Attributes:
+        url: (str) URL that was requested
+        status_code: (int) response status, 0 if there was no response
+        headers: (requests.structures.CaseInsensitiveDict) selected headers,
+            listed in HOP_HEADERS
+        elapsed: (float) seconds for the request including the body, or None
+        ttfb: (float) seconds until the response headers were received, or None
+        text: (str) body, possibly truncated, or None if not kept
+        truncated: (bool) True if text is shorter than the body
+        sha256: (str) hex digest of the body as received, or None
+    """
+
+    __slots__ = (
+        "url",
+        "status_code",
+        "headers",
+        "elapsed",
+        "ttfb",
+        "text",
+        "truncated",
+        "sha256",
+    )
+
+    def __init__(
+        self,
+        url,
+        status_code,
+        headers=None,
+        elapsed=None,
+        ttfb=None,
+        text=None,
+        truncated=False,
+        sha256=None,
+    ):
+        import requests.structures
+
+        self.url = url
+        self.status_code = status_code
+        self.headers = requests.structures.CaseInsensitiveDict(headers)
+        self.elapsed = elapsed
+        self.ttfb = ttfb
+        self.text = text
+        self.truncated = truncated
+        self.sha256 = sha256
+
+    @classmethod
+    def fromResponse(cls, response, keep_body=True, max_body=None, hash_body=False):
+        """
+        Hop from a requests.Response or FakeResponse.
+
+        Args:
+            response: requests.Response or FakeResponse
+            keep_body: (bool) If True then retain the body text
+            max_body: (int) Maximum characters of body text retained, None for all
+            hash_body: (bool) If True then record the SHA-256 digest of the body
+
+        Returns:
+            Hop
+        """
+        headers = {}
+        for k in HOP_HEADERS:
+            v = response.headers.get(k)
+            if v is not None:
+                headers[k] = v
+        elapsed = getattr(response, "duration", None)
+        if elapsed is None:
+            elapsed = getattr(response, "elapsed", None)
+            if elapsed is not None and not isinstance(elapsed, (int, float)):
+                elapsed = elapsed.total_seconds()
+        text = None
+        truncated = getattr(response, "truncated", False)
+        sha256 = None
+        body = response.text
+        if body:
+            if hash_body:
+                sha256 = getattr(response, "sha256", None)
+                if sha256 is None:
+                    sha256 = hashlib.sha256(body.encode("utf-8")).hexdigest()
+            if keep_body:
+                text = body
+                if max_body is not None and len(body) > max_body:
+                    text = body[:max_body]
+                    truncated = True
+        return cls(
+            response.url,
+            response.status_code,
+            headers=headers,
+            elapsed=elapsed,
+            ttfb=getattr(response, "ttfb", None),
+            text=text,
+            truncated=truncated,
+            sha256=sha256,
+        )
+
+    def json(self, **kwargs):
+        return json.loads(self.text, **kwargs)
+
+    def asJsonDict(self):
+        res = {k: getattr(self, k) for k in self.__slots__}
+        res["headers"] = dict(self.headers)
+        return res
+
+    def __repr__(self):
+        return f"<Hop {self.status_code} {self.url}>"
+
+
+def _compactResponses(responses, compact):
+    """
+    Convert responses to Hop records if compact is set.
+
+    Args:
+        responses: list of responses
+        compact: False, True, or dict of arguments for Hop.fromResponse
+
+    Returns:
+        list of responses or Hop
+    """
+    if not compact:
+        return responses
+    kwargs = compact if isinstance(compact, dict) else {}
+    return [Hop.fromResponse(r, **kwargs) for r in responses]
+
+
+def _stepHeaders(url, headers):
+    """
+    Headers to send for a step of the resolve chain.
+    """
+    cheaders = headers.copy()
+    if url.startswith(N2T_RESOLVER_URL):
+        cheaders["Accept"] = "*/*"
+    return cheaders
+
+
+def _errorResponse(url, headers, error=None):
+    """
+    Stand in response with status 0 for a step that raised an exception.
+
+    The response is ``transient`` if the exception says so, e.g. for an
+    open circuit, and should not be cached.
+    """
+    return FakeResponse(
+        {
+            "status_code": 0,
+            "url": url,
+            "headers": {},
+            "encoding": "",
+            "text": "",
+            "request": {"url": url, "headers": headers},
+            "transient": getattr(error, "transient", False),
+        }
+    )
+
+
+def _isPredicted(responses):
+    """
+    True if responses is the single response of a successful prediction.
+    """
+    return len(responses) > 0 and getattr(responses[-1], "predicted", False)
 
-def _doResolve(url, include_body=False, headers=None, timeout=5, callback=None):
+
+def _doResolve(
+    url,
+    include_body=False,
+    headers=None,
+    timeout=5,
+    callback=None,
+    session=None,
+    cache=None,
+    negative_cache=None,
+    predicted=None,
+    limiter=None,
+    retry=None,
+    breaker=None,
+    max_body=None,
+    body_types=None,
+    collector=None,
+    follow_links=False,
+):
     L = logging.getLogger("igsn_lib")
+    if cache is None and negative_cache is None:
+        return _doResolveChain(
+            url,
+            include_body=include_body,
+            headers=headers,
+            timeout=timeout,
+            callback=callback,
+            session=session,
+            predicted=predicted,
+            limiter=limiter,
+            retry=retry,
+            breaker=breaker,
+            max_body=max_body,
+            body_types=body_types,
+            collector=collector,
+            follow_links=follow_links,
+        )
+
+    def _cacheKey(c):
+        return c.key(
+            url,
+            include_body,
+            headers,
+            follow_links=follow_links,
+            max_body=max_body,
+            body_types=body_types,
+        )
+
+    for c in (cache, negative_cache):
+        if c is not None:
+            key = _cacheKey(c)
+            responses = c.get(key)
+            if responses is not None:
+                L.debug("Cached resolution for %s", url)
+                return responses
+    responses = _doResolveChain(
+        url,
+        include_body=include_body,
+        headers=headers,
+        timeout=timeout,
+        callback=callback,
+        session=session,
+        predicted=predicted,
+        limiter=limiter,
+        retry=retry,
+        breaker=breaker,
+        max_body=max_body,
+        body_types=body_types,
+        collector=collector,
+        follow_links=follow_links,
+    )
+    if len(responses) == 0:
+        return responses
+    status = responses[-1].status_code
+    # Only successfully completed chains are cached. Failures that will not
+    # succeed on a retry soon (4xx other than 429, or no response) go to the
+    # negative cache. A predicted result was not obtained by following the
+    # chain, so is not cached under the key of the chain.
+    if cache is not None and 200 <= status < 300:
+        if not _isPredicted(responses):
+            cache.put(_cacheKey(cache), responses)
+    elif negative_cache is not None and (
+        (status == 0 and not getattr(responses[-1], "transient", False))
+        or (400 <= status < 500 and status != 429)
+    ):
+        negative_cache.put(_cacheKey(negative_cache), responses)
+    return responses
+
+
+def _doResolveChain(
+    url,
+    include_body=False,
+    headers=None,
+    timeout=5,
+    callback=None,
+    session=None,
+    predicted=None,
+    limiter=None,
+    retry=None,
+    breaker=None,
+    max_body=None,
+    body_types=None,
+    collector=None,
+    follow_links=False,
+):
+    L = logging.getLogger("igsn_lib")
+    link_types = None
+    if follow_links:
+        link_types = DEFAULT_BODY_MEDIA_TYPES if follow_links is True else follow_links
+    if predicted is not None:
+        # Check the predicted final URL before walking the redirect chain
+        try:
+            response = _doRetryStep(
+                predicted,
+                include_body=include_body,
+                headers=_stepHeaders(predicted, headers),
+                timeout=timeout,
+                session=session,
+                max_body=max_body,
+                body_types=body_types,
+                limiter=limiter,
+                retry=retry,
+                breaker=breaker,
+                collector=collector,
+            )
+            if 200 <= response.status_code < 300:
+                response.predicted = True
+                return [response]
+            L.info("Prediction %s failed with %s", predicted, response.status_code)
+        except Exception as e:
+            L.info("Prediction %s failed: %s", predicted, e)
     responses = []
     c_url = url
+    following = False
     while True:
-        cheaders = headers.copy()
-        if c_url.startswith(N2T_RESOLVER_URL):
-            cheaders["Accept"] = "*/*"
+        cheaders = _stepHeaders(c_url, headers)
+        # When following links, HEAD is used until a metadata link is found
+        step_body = include_body and (link_types is None or following)
         try:
             do_continue = True
             if callback is not None:
                 do_continue = callback(c_url)
             if do_continue:
-                response = _doResolveStep(
-                    c_url, include_body=include_body, headers=cheaders
+                response = _doRetryStep(
+                    c_url,
+                    include_body=step_body,
+                    headers=cheaders,
+                    timeout=timeout,
+                    session=session,
+                    max_body=max_body,
+                    body_types=body_types,
+                    limiter=limiter,
+                    retry=retry,
+                    breaker=breaker,
+                    collector=collector,
                 )
             else:
                 return responses
         except Exception as e:
             L.error(e)
-            fake_response = FakeResponse(
-                {
-                    "status_code": 0,
-                    "url": c_url,
-                    "headers": {},
-                    "encoding": "",
-                    "text": "",
-                    "request": {"url": c_url, "headers": cheaders},
-                }
-            )
-            responses.append(fake_response)
+            responses.append(_errorResponse(c_url, cheaders, error=e))
             return responses
         responses.append(response)
         if response.status_code >= 400:
             L.warning("Aborting _doResolve on error status %s", response.status_code)
             return responses
-        elif response.status_code >= 300:
+        elif response.status_code == 304:
+            # Not modified since the validators sent in a conditional request
+            return responses
+        if link_types is not None and not following:
+            link = metadataLink(response, link_types)
+            if link is not None:
+                L.debug("Following metadata link %s", link)
+                c_url = link
+                following = True
+                continue
+        if response.status_code >= 300:
             c_url = response.headers.get("Location", None)
             if c_url is None:
                 L.warning("redirect code but no location! %s", response.status_code)
                 return responses
         elif response.status_code >= 200:
+            if include_body and not step_body:
+                # No metadata link, so retrieve the body of the final response
+                try:
+                    responses[-1] = _doRetryStep(
+                        c_url,
+                        include_body=True,
+                        headers=cheaders,
+                        timeout=timeout,
+                        session=session,
+                        max_body=max_body,
+                        body_types=body_types,
+                        limiter=limiter,
+                        retry=retry,
+                        breaker=breaker,
+                        collector=collector,
+                    )
+                except Exception as e:
+                    L.error(e)
+                    responses[-1] = _errorResponse(c_url, cheaders, error=e)
             return responses
 
 
-def resolveN2T(identifier, include_body=False, headers=None, callback=None):
+def resolveN2T(
+    identifier,
+    include_body=False,
+    headers=None,
+    callback=None,
+    session=None,
+    cache=None,
+    negative_cache=None,
+    limiter=None,
+    retry=None,
+    breaker=None,
+    compact=False,
+    max_body=None,
+    body_types=None,
+    collector=None,
+    follow_links=False,
+):
     """
     Use N2T to resolve the identifier
 
     Args:
         identifier: pre-normalized IGSN string
-        include_body: (bool) If True then return response body, otherwise only HEAD request is made
+        include_body: (bool) If True then return the body of the final 2xx response, otherwise only HEAD requests are made
         headers: (dict) Optional headers to send in request
         callback: (method) Optional method to call after completion of each step of the resolve chain
+        session: (requests.Session) Optional session to use, defaults to getHttpSession()
+        cache: (igsn_lib.cache.ResolveCache) Optional cache of resolutions
+        negative_cache: (igsn_lib.cache.ResolveCache) Optional cache of failed resolutions
+        limiter: (igsn_lib.ratelimit.RateLimiter) Optional per-host request limits
+        retry: (igsn_lib.retry.RetryPolicy) Optional retries of failed requests
+        breaker: (igsn_lib.retry.CircuitBreaker) Optional per-host circuit breaker
+        compact: (bool or dict) If set then return Hop records, a dict provides arguments for Hop.fromResponse
+        max_body: (int) Maximum bytes of body read, longer bodies are truncated
+        body_types: (sequence) Media types of bodies to read, e.g. DEFAULT_BODY_MEDIA_TYPES, None for all
+        collector: (igsn_lib.timing.LatencyCollector) Optional collector of request timings
+        follow_links: (bool or sequence) If set then HEAD is used until a Link header with
+            rel describedby or alternate and a type in DEFAULT_BODY_MEDIA_TYPES (or the given
+            media types) is found, which is then followed instead of the rest of the chain
 
     Returns:
-
+        list of requests.Response objects, FakeResponse if include_body or
+        cached, or Hop if compact
     """
     _L = logging.getLogger("igsn_lib")
     url = f"{N2T_RESOLVER_URL}{urllib.parse.quote(identifier)}"
     n2theaders = DEFAULT_RESOLVE_HEADERS.copy()
     if headers is not None:
         n2theaders.update(headers)
-    return _doResolve(
-        url, include_body=include_body, headers=n2theaders, callback=callback
+    responses = _doResolve(
+        url,
+        include_body=include_body,
+        headers=n2theaders,
+        callback=callback,
+        session=session,
+        cache=cache,
+        negative_cache=negative_cache,
+        limiter=limiter,
+        retry=retry,
+        breaker=breaker,
+        max_body=max_body,
+        body_types=body_types,
+        collector=collector,
+        follow_links=follow_links,
     )
+    return _compactResponses(responses, compact)
 
 
-def resolve(igsn_value, include_body=False, headers=None):
+def resolve(
+    igsn_value,
+    include_body=False,
+    headers=None,
+    session=None,
+    cache=None,
+    negative_cache=None,
+    templates=None,
+    predict=False,
+    limiter=None,
+    retry=None,
+    breaker=None,
+    compact=False,
+    max_body=None,
+    body_types=None,
+    collector=None,
+    follow_links=False,
+):
     """
     Resolve an IGSN value
 
-    #TODO: add support for link headers
-
     Args:
         igsn_value: pre-normalized IGSN string
-        include_body: (bool) If True then return response body, otherwise only HEAD request is made
+        include_body: (bool) If True then return the body of the final 2xx response, otherwise only HEAD requests are made
         headers: (dict) Optional headers to send in request
+        session: (requests.Session) Optional session to use, defaults to getHttpSession()
+        cache: (igsn_lib.cache.ResolveCache) Optional cache of resolutions
+        negative_cache: (igsn_lib.cache.ResolveCache) Optional cache of failed resolutions
+        templates: (igsn_lib.templates.RedirectTemplates) Optional templates, updated from the result, not used with follow_links
+        predict: (bool) If True then first request the final URL predicted by templates
+        limiter: (igsn_lib.ratelimit.RateLimiter) Optional per-host request limits
+        retry: (igsn_lib.retry.RetryPolicy) Optional retries of failed requests
+        breaker: (igsn_lib.retry.CircuitBreaker) Optional per-host circuit breaker
+        compact: (bool or dict) If set then return Hop records, a dict provides arguments for Hop.fromResponse
+        max_body: (int) Maximum bytes of body read, longer bodies are truncated
+        body_types: (sequence) Media types of bodies to read, e.g. DEFAULT_BODY_MEDIA_TYPES, None for all
+        collector: (igsn_lib.timing.LatencyCollector) Optional collector of request timings
+        follow_links: (bool or sequence) If set then HEAD is used until a Link header with
+            rel describedby or alternate and a type in DEFAULT_BODY_MEDIA_TYPES (or the given
+            media types) is found, which is then followed instead of the rest of the chain
 
     Returns:
-        list of requests.Response objects
+        list of requests.Response objects, FakeResponse if include_body or
+        cached, or Hop if compact. If a prediction succeeded the list contains
+        only the final response.
 
     Examples:
 
@@ -242,4 +1067,123 @@ def resolve(igsn_value, include_body=False, headers=None):
         rheaders.update(headers)
     url = f"{IGSN_RESOLVER_URL}{urllib.parse.quote(igsn_value)}"
     _L.debug("Resolve URL = %s", url)
-    return _doResolve(url, include_body=include_body, headers=rheaders)
+    # Templates are of the final URL of the chain, which a followed metadata
+    # link replaces, so they are neither used nor learnt when following links.
+    use_templates = templates is not None and not follow_links
+    predicted = None
+    if use_templates and predict:
+        predicted = templates.predict(igsn_value)
+    responses = _doResolve(
+        url,
+        include_body=include_body,
+        headers=rheaders,
+        session=session,
+        cache=cache,
+        negative_cache=negative_cache,
+        predicted=predicted,
+        limiter=limiter,
+        retry=retry,
+        breaker=breaker,
+        max_body=max_body,
+        body_types=body_types,
+        collector=collector,
+        follow_links=follow_links,
+    )
+    # A predicted result only confirms the template it came from
+    if use_templates and not _isPredicted(responses):
+        templates.learn(igsn_value, responses)
+    return _compactResponses(responses, compact)
+
+
+def _resolveOne(resolver, identifier, **kwargs):
+    try:
+        return resolver(identifier, **kwargs)
+    except Exception as e:
+        logging.getLogger("igsn_lib").error("Resolving %s failed: %s", identifier, e)
+    return []
+
+
+def resolveMany(
+    identifiers,
+    workers=DEFAULT_RESOLVE_WORKERS,
+    include_body=False,
+    resolver=None,
+    max_pending=None,
+    **kwargs,
+):
+    """
+    Resolve many identifiers concurrently.
+
+    Results are yielded as each resolution completes, so they are generally not
+    in the order of ``identifiers``. At most ``max_pending`` identifiers are
+    taken from the input ahead of the results being consumed, so memory use
+    does not depend on the length of the input iterator.
+
+    Other keyword arguments, such as ``headers``, ``session`` or ``cache``, are
+    passed to the resolver. If no session is provided, one with a connection
+    pool large enough for ``workers`` is used, and closed once the results are
+    exhausted. Callers resolving several batches should pass one session that
+    lives for all of them.
+
+    Args:
+        identifiers: iterable of pre-normalized identifier strings
+        workers: (int) Number of concurrent resolutions
+        include_body: (bool) If True then return the body of the final 2xx response, otherwise only HEAD requests are made
+        resolver: (method) resolve or resolveN2T, defaults to resolve
+        max_pending: (int) Maximum identifiers in flight, defaults to 2 * workers
+        **kwargs: passed to resolver
+
+    Returns:
+        generator of (identifier, list of responses). The list is empty if
+        resolution raised an unexpected exception.
+
+    Examples:
+
+        .. jupyter-execute::
+
+           import igsn_lib
+
+           for igsn, responses in igsn_lib.resolveMany(["PRR047915", "ICDP5054EEW1001"]):
+               print(igsn, responses[-1].status_code, responses[-1].url)
+    """
+    if resolver is None:
+        resolver = resolve
+    if max_pending is None:
+        max_pending = 2 * workers
+    own_session = None
+    if kwargs.get("session") is None:
+        if workers > DEFAULT_POOL_MAXSIZE:
+            own_session = createHttpSession(pool_maxsize=workers)
+            kwargs["session"] = own_session
+        else:
+            kwargs["session"] = getHttpSession()
+    identifiers = iter(identifiers)
+    pending = {}
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            exhausted = False
+            while True:
+                while not exhausted and len(pending) < max_pending:
+                    try:
+                        identifier = next(identifiers)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    future = executor.submit(
+                        _resolveOne,
+                        resolver,
+                        identifier,
+                        include_body=include_body,
+                        **kwargs,
+                    )
+                    pending[future] = identifier
+                if len(pending) == 0:
+                    return
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    yield pending.pop(future), future.result()
+    finally:
+        if own_session is not None:
+            own_session.close()
@@ -0,0 +1,263 @@
+"""
+asyncio implementation of the IGSN resolver.
+
+Follows redirect chains in the same way as :func:`igsn_lib.resolve`, but
+without a thread per chain, so many thousands of slow resolutions can be in
+flight at once.
+
+Requires `aiohttp <https://docs.aiohttp.org/>`_, which is imported on first use.
+Install it with the ``aio`` extra, ``pip install igsn_lib[aio]``.
+
+Responses are returned as :class:`igsn_lib.FakeResponse` instances with the
+``status_code``, ``url``, ``headers``, ``encoding``, ``text``, ``content`` and
+``request`` properties of a ``requests.Response``, since aiohttp responses can
+not be used after their connection is released.
+"""
+
+import asyncio
+import logging
+import urllib.parse
+import igsn_lib
+
+DEFAULT_CONCURRENCY = 100
+"""Maximum number of resolutions in flight in resolveMany
+"""
+
+
+def _getLogger():
+    return logging.getLogger("igsn_lib.aio")
+
+
+def createHttpSession(limit=DEFAULT_CONCURRENCY, limit_per_host=0):
+    """
+    Create an aiohttp.ClientSession for resolving identifiers.
+
+    Must be called with a running event loop. The caller is responsible for
+    closing the session.
+
+    Args:
+        limit: (int) Maximum number of open connections
+        limit_per_host: (int) Maximum open connections per host, 0 for no limit
+
+    Returns:
+        aiohttp.ClientSession
+    """
+    try:
+        import aiohttp
+    except ImportError as e:
+        raise ImportError(
+            "igsn_lib.aio requires aiohttp, install igsn_lib[aio]"
+        ) from e
+    connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host)
+    return aiohttp.ClientSession(connector=connector)
+
+
+async def _doResolveStep(session, url, include_body=False, headers=None, timeout=5):
+    import aiohttp
+
+    method = "GET" if include_body else "HEAD"
+    async with session.request(
+        method,
+        url,
+        headers=headers,
+        allow_redirects=False,
+        timeout=aiohttp.ClientTimeout(total=timeout),
+    ) as response:
+        content = b""
+        text = ""
+        encoding = ""
+        if include_body:
+            content = await response.read()
+            encoding = response.get_encoding()
+            text = content.decode(encoding, errors="replace")
+        return igsn_lib.FakeResponse(
+            {
+                "status_code": response.status,
+                "url": str(response.url),
+                "headers": response.headers.copy(),
+                "encoding": encoding,
+                "text": text,
+                "content": content,
+                "request": {"url": url, "headers": headers},
+            }
+        )
+
+
+async def _doResolve(session, url, include_body=False, headers=None, timeout=5):
+    L = _getLogger()
+    responses = []
+    c_url = url
+    while True:
+        cheaders = igsn_lib._stepHeaders(c_url, headers)
+        try:
+            response = await _doResolveStep(
+                session,
+                c_url,
+                include_body=include_body,
+                headers=cheaders,
+                timeout=timeout,
+            )
+        except Exception as e:
+            L.error("%s: %s", c_url, repr(e))
+            responses.append(igsn_lib._errorResponse(c_url, cheaders))
+            return responses
+        responses.append(response)
+        if response.status_code >= 400:
+            L.warning("Aborting _doResolve on error status %s", response.status_code)
+            return responses
+        elif response.status_code >= 300:
+            c_url = response.headers.get("Location", None)
+            if c_url is None:
+                L.warning("redirect code but no location! %s", response.status_code)
+                return responses
+        elif response.status_code >= 200:
+            return responses
+
+
+async def _withSession(session, func, *args, **kwargs):
+    if session is not None:
+        return await func(session, *args, **kwargs)
+    async with createHttpSession() as session:
+        return await func(session, *args, **kwargs)
+
+
+async def resolveN2T(identifier, include_body=False, headers=None, session=None):
+    """
+    Use N2T to resolve the identifier
+
+    Args:
+        identifier: pre-normalized IGSN string
+        include_body: (bool) If True then return response body, otherwise only HEAD request is made
+        headers: (dict) Optional headers to send in request
+        session: (aiohttp.ClientSession) Optional session, a temporary one is used if None
+
+    Returns:
+        list of FakeResponse
+    """
+    url = f"{igsn_lib.N2T_RESOLVER_URL}{urllib.parse.quote(identifier)}"
+    n2theaders = igsn_lib.DEFAULT_RESOLVE_HEADERS.copy()
+    if headers is not None:
+        n2theaders.update(headers)
+    return await _withSession(
+        session, _doResolve, url, include_body=include_body, headers=n2theaders
+    )
+
+
+async def resolve(igsn_value, include_body=False, headers=None, session=None):
+    """
+    Resolve an IGSN value
+
+    Args:
+        igsn_value: pre-normalized IGSN string
+        include_body: (bool) If True then return response body, otherwise only HEAD request is made
+        headers: (dict) Optional headers to send in request
+        session: (aiohttp.ClientSession) Optional session, a temporary one is used if None
+
+    Returns:
+        list of FakeResponse
+
+    Examples:
+
+        .. jupyter-execute::
+
+           import asyncio
+           import igsn_lib.aio
+
+           res = await igsn_lib.aio.resolve('PRR047915')
+           print(res[-1].status_code, res[-1].url)
+    """
+    rheaders = igsn_lib.DEFAULT_RESOLVE_HEADERS.copy()
+    if headers is not None:
+        rheaders.update(headers)
+    url = f"{igsn_lib.IGSN_RESOLVER_URL}{urllib.parse.quote(igsn_value)}"
+    return await _withSession(
+        session, _doResolve, url, include_body=include_body, headers=rheaders
+    )
+
+
+async def resolveMany(
+    identifiers,
+    concurrency=DEFAULT_CONCURRENCY,
+    include_body=False,
+    headers=None,
+    session=None,
+    resolver=None,
+):
+    """
+    Resolve many identifiers concurrently.
+
+    Async generator yielding results as each resolution completes. At most
+    ``concurrency`` resolutions are in flight, guarded by a semaphore, and no
+    more than twice that many identifiers are taken from the input ahead of the
+    consumer.
+
+    Args:
+        identifiers: iterable or async iterable of pre-normalized identifier strings
+        concurrency: (int) Maximum number of resolutions in flight
+        include_body: (bool) If True then return response body, otherwise only HEAD request is made
+        headers: (dict) Optional headers to send in request
+        session: (aiohttp.ClientSession) Optional session, one is created if None
+        resolver: (coroutine function) resolve or resolveN2T, defaults to resolve
+
+    Returns:
+        async generator of (identifier, list of FakeResponse)
+
+    Examples:
+
+        .. jupyter-execute::
+
+           import igsn_lib.aio
+
+           async for igsn, res in igsn_lib.aio.resolveMany(["PRR047915", "ICDP5054EEW1001"]):
+               print(igsn, res[-1].status_code)
+    """
+    if resolver is None:
+        resolver = resolve
+    own_session = session is None
+    if own_session:
+        session = createHttpSession(limit=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _resolve(identifier):
+        async with semaphore:
+            return identifier, await resolver(
+                identifier, include_body=include_body, headers=headers, session=session
+            )
+
+    if hasattr(identifiers, "__aiter__"):
+        iterator = identifiers.__aiter__()
+    else:
+        iterator = None
+        sync_iterator = iter(identifiers)
+
+    async def _next():
+        if iterator is not None:
+            return await iterator.__anext__()
+        try:
+            return next(sync_iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    pending = set()
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < 2 * concurrency:
+                try:
+                    identifier = await _next()
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+                pending.add(asyncio.ensure_future(_resolve(identifier)))
+            if len(pending) == 0:
+                return
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+        if own_session:
+            await session.close()
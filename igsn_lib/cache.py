@@ -0,0 +1,368 @@
+"""
+Caches for identifier resolution chains.
+
+A cache is passed to :func:`igsn_lib.resolve` (or resolveN2T, resolveMany) and
+is consulted before the redirect chain is followed. Entries are keyed by the
+starting URL, the request method and the request headers that affect the
+response. Responses are stored as plain dicts and returned as
+:class:`igsn_lib.FakeResponse` instances.
+
+Two implementations are provided, :class:`MemoryResolveCache`, an in-memory
+LRU, and :class:`SqliteResolveCache`, which persists entries in an SQLite
+database. Both expire entries after ``ttl`` seconds.
+
+Successful resolutions are stored in the ``cache``. Failed resolutions (4xx or
+no response) may be stored separately in a ``negative_cache``, usually a
+:class:`NegativeResolveCache` with a shorter TTL and fewer entries, so that
+repeated bad identifiers are not sent to the resolver again.
+"""
+
+import json
+import logging
+import threading
+import time
+import collections
+import igsn_lib
+
+DEFAULT_TTL = 86400
+"""Default time in seconds that a resolution is cached
+"""
+
+DEFAULT_MAXSIZE = 100000
+"""Default maximum number of cached resolutions
+"""
+
+DEFAULT_NEGATIVE_TTL = 3600
+"""Default time in seconds that a failed resolution is cached
+"""
+
+DEFAULT_NEGATIVE_MAXSIZE = 10000
+"""Default maximum number of cached failed resolutions
+"""
+
+CACHE_KEY_HEADERS = ("Accept", "Accept-Language")
+"""Request headers that are part of the cache key
+"""
+
+
+def _getLogger():
+    return logging.getLogger("igsn_lib.cache")
+
+
+def _mediaTypes(media_types):
+    """
+    Sorted lower case list of media types, for a cache key.
+    """
+    return sorted({t.lower() for t in media_types})
+
+
+def responseToDict(response):
+    """
+    JSON serializable dict of a requests.Response or FakeResponse.
+
+    Args:
+        response: requests.Response or FakeResponse
+
+    Returns:
+        dict
+    """
+    request = response.request
+    if isinstance(request, dict):
+        request = {"url": request.get("url"), "headers": dict(request.get("headers", {}))}
+    else:
+        request = {"url": request.url, "headers": dict(request.headers)}
+    elapsed = getattr(response, "elapsed", None)
+    if elapsed is not None and not isinstance(elapsed, (int, float)):
+        elapsed = elapsed.total_seconds()
+    return {
+        "status_code": response.status_code,
+        "url": response.url,
+        "headers": dict(response.headers),
+        "encoding": response.encoding,
+        "text": response.text,
+        "elapsed": elapsed,
+        "ttfb": getattr(response, "ttfb", None),
+        "duration": getattr(response, "duration", None),
+        "truncated": getattr(response, "truncated", False),
+        "sha256": getattr(response, "sha256", None),
+        "request": request,
+    }
+
+
+def responseFromDict(d):
+    """
+    FakeResponse from a dict created by responseToDict.
+
+    Header lookup is case insensitive, as for requests.Response. ``content``
+    is the encoded ``text`` and ``elapsed`` is the datetime.timedelta of the
+    original request, zero if that was not recorded. ``ttfb``, ``duration``,
+    ``truncated`` and ``sha256`` are restored as recorded.
+
+    Args:
+        d: dict
+
+    Returns:
+        FakeResponse
+    """
+    import datetime
+    import requests.structures
+
+    d = d.copy()
+    d["headers"] = requests.structures.CaseInsensitiveDict(d["headers"])
+    text = d.get("text") or ""
+    d["content"] = text.encode(d.get("encoding") or "utf-8", errors="replace")
+    d["elapsed"] = datetime.timedelta(seconds=d.get("elapsed") or 0)
+    # Entries written before these were recorded
+    d.setdefault("ttfb", None)
+    d.setdefault("duration", None)
+    d.setdefault("truncated", False)
+    d.setdefault("sha256", None)
+    return igsn_lib.FakeResponse(d)
+
+
+class ResolveCache(object):
+    """
+    Base class for resolution caches.
+
+    Subclasses implement storage with ``_load``, ``_store`` and ``__len__``.
+    Access is serialized with a lock so a cache can be shared between threads.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, maxsize=DEFAULT_MAXSIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def key(
+        self,
+        url,
+        include_body,
+        headers,
+        follow_links=False,
+        max_body=None,
+        body_types=None,
+    ):
+        """
+        Cache key for a resolution request.
+
+        Options that change the result are part of the key, so that, for
+        example, a truncated body is not returned for a request of the full
+        body. Options at their defaults are omitted.
+
+        Args:
+            url: starting URL of the chain
+            include_body: (bool) True for GET, False for HEAD
+            headers: (dict) request headers
+            follow_links: (bool or sequence) follow_links of the resolution
+            max_body: (int) max_body of the resolution
+            body_types: (sequence) body_types of the resolution
+
+        Returns:
+            string
+        """
+        method = "GET" if include_body else "HEAD"
+        headers = headers or {}
+        key = [method, url, [headers.get(k) for k in CACHE_KEY_HEADERS]]
+        options = {}
+        if follow_links:
+            if follow_links is True:
+                follow_links = igsn_lib.DEFAULT_BODY_MEDIA_TYPES
+            options["follow_links"] = _mediaTypes(follow_links)
+        # Bodies are only read by GET
+        if include_body and max_body is not None:
+            options["max_body"] = max_body
+        if include_body and body_types is not None:
+            options["body_types"] = _mediaTypes(body_types)
+        if len(options) > 0:
+            key.append(options)
+        return json.dumps(key, separators=(",", ":"))
+
+    def get(self, key):
+        """
+        Cached responses for key.
+
+        Args:
+            key: from key()
+
+        Returns:
+            list of FakeResponse or None if not cached or expired
+        """
+        with self._lock:
+            value = self._load(key, time.time())
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return [responseFromDict(d) for d in value]
+
+    def put(self, key, responses):
+        """
+        Cache the responses of a resolution.
+
+        Args:
+            key: from key()
+            responses: list of requests.Response or FakeResponse
+        """
+        value = [responseToDict(r) for r in responses]
+        with self._lock:
+            self._store(key, value, time.time())
+
+    def stats(self):
+        """
+        Cache counters.
+
+        Returns:
+            dict of ``{hits, misses, evictions, size}``
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self),
+            }
+
+    def _load(self, key, now):
+        raise NotImplementedError()
+
+    def _store(self, key, value, now):
+        raise NotImplementedError()
+
+    def __len__(self):
+        raise NotImplementedError()
+
+
+class MemoryResolveCache(ResolveCache):
+    """
+    In-memory LRU cache of resolutions with expiry.
+
+    Args:
+        ttl: seconds an entry is valid
+        maxsize: maximum number of entries, least recently used are evicted
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, maxsize=DEFAULT_MAXSIZE):
+        super().__init__(ttl=ttl, maxsize=maxsize)
+        self._entries = collections.OrderedDict()
+
+    def _load(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] + self.ttl < now:
+            del self._entries[key]
+            self.evictions += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def _store(self, key, value, now):
+        self._entries[key] = (now, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class NegativeResolveCache(MemoryResolveCache):
+    """
+    In-memory LRU cache for failed resolutions.
+
+    Same as MemoryResolveCache with defaults suited to failures, which are
+    kept for a shorter time in case the identifier is registered later.
+
+    Args:
+        ttl: seconds an entry is valid
+        maxsize: maximum number of entries, least recently used are evicted
+    """
+
+    def __init__(self, ttl=DEFAULT_NEGATIVE_TTL, maxsize=DEFAULT_NEGATIVE_MAXSIZE):
+        super().__init__(ttl=ttl, maxsize=maxsize)
+
+
+class SqliteResolveCache(ResolveCache):
+    """
+    Resolution cache persisted in an SQLite database.
+
+    Entries survive restarts. When more than ``maxsize`` entries are stored the
+    least recently used are evicted. The number of entries is counted when the
+    database is opened and tracked from then on, so a database file should
+    only be written by one SqliteResolveCache at a time.
+
+    Args:
+        path: SQLite database file
+        ttl: seconds an entry is valid
+        maxsize: maximum number of entries
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL, maxsize=DEFAULT_MAXSIZE):
+        import sqlite3
+
+        super().__init__(ttl=ttl, maxsize=maxsize)
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS resolve_cache ("
+            "key TEXT PRIMARY KEY, tstored REAL, taccessed REAL, value TEXT)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS resolve_cache_taccessed "
+            "ON resolve_cache (taccessed)"
+        )
+        self._connection.commit()
+        self._count = self._connection.execute(
+            "SELECT COUNT(*) FROM resolve_cache"
+        ).fetchone()[0]
+
+    def _load(self, key, now):
+        row = self._connection.execute(
+            "SELECT tstored, value FROM resolve_cache WHERE key=?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[0] + self.ttl < now:
+            self._connection.execute("DELETE FROM resolve_cache WHERE key=?", (key,))
+            self._connection.commit()
+            self._count -= 1
+            self.evictions += 1
+            return None
+        self._connection.execute(
+            "UPDATE resolve_cache SET taccessed=? WHERE key=?", (now, key)
+        )
+        self._connection.commit()
+        return json.loads(row[1])
+
+    def _store(self, key, value, now):
+        exists = self._connection.execute(
+            "SELECT 1 FROM resolve_cache WHERE key=?", (key,)
+        ).fetchone()
+        self._connection.execute(
+            "INSERT OR REPLACE INTO resolve_cache (key, tstored, taccessed, value) "
+            "VALUES (?, ?, ?, ?)",
+            (key, now, now, json.dumps(value)),
+        )
+        if exists is None:
+            self._count += 1
+        excess = self._count - self.maxsize
+        if excess > 0:
+            cursor = self._connection.execute(
+                "DELETE FROM resolve_cache WHERE rowid IN (SELECT rowid FROM "
+                "resolve_cache ORDER BY taccessed LIMIT ?)",
+                (excess,),
+            )
+            self._count -= cursor.rowcount
+            self.evictions += cursor.rowcount
+        self._connection.commit()
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        """Close the database connection."""
+        self._connection.close()
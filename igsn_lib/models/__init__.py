@@ -4,7 +4,9 @@ Basic SQL database interface for minimal IGSN metadata.
 All dates are stored in UTC.
 """
 import logging
-import dateparser
+import sqlite3
+import collections
+import concurrent.futures
 import sqlalchemy
 import sqlalchemy.ext.declarative
 import sqlalchemy.orm
@@ -12,7 +14,6 @@ import sqlalchemy.exc
 import sqlalchemy.schema
 import sqlalchemy.dialects.postgresql
 import sqlalchemy.ext.compiler
-import sickle.oaiexceptions
 import igsn_lib
 import igsn_lib.oai
 import igsn_lib.time
@@ -20,6 +21,14 @@ import json
 
 _L = logging.getLogger("igsn_lib.models")
 
+BULK_INSERT_MAX_PARAMETERS = 32766
+"""Most bind parameters per bulk insert statement, within the Postgres and SQLite 3.32+ limits
+"""
+
+SQLITE_LEGACY_MAX_PARAMETERS = 999
+"""Default SQLITE_MAX_VARIABLE_NUMBER of SQLite releases before 3.32.0
+"""
+
 Base = sqlalchemy.ext.declarative.declarative_base()
 
 # Use the JSONB type when connected to a postgres database
@@ -115,12 +124,13 @@ class Identifier(Base):
         }
         return d
 
-    def fromOAIRecord(self, record):
+    def fromOAIRecord(self, record, engine=igsn_lib.oai.ENGINE_XMLTODICT):
         '''
         Populates self from an OAI-PMH IGSN XML string
 
         Args:
             record: String, xml OAI-PMH record
+            engine: parsing engine passed to oaiRecordToDict
 
         Returns:
             nothing
@@ -161,7 +171,9 @@ class Identifier(Base):
         '''
         data = record
         if isinstance(record, str):
-            data = igsn_lib.oai.oaiRecordToDict(record)
+            data = igsn_lib.oai.oaiRecordToDict(
+                record, engine=engine, source=igsn_lib.oai.SOURCE_OMIT
+            )
         self.id = data["igsn_id"]
         self.provider_id = data["oai_id"]
         self.provider_time = data["oai_time"]
@@ -247,20 +259,39 @@ class Job(Base):
     def __repr__(self):
         return json.dumps(self.asDict(), indent=2)
 
-    def execute(self, session, callback=None, resume=True):
+    def execute(
+        self,
+        session,
+        callback=None,
+        resume=True,
+        batch_size=None,
+        engine=igsn_lib.oai.ENGINE_XMLTODICT,
+    ):
         """
         Execute this task, harvesting records until complete.
 
         #TODO: implement support for resumption of interupted job
 
+        When ``batch_size`` is set, parsed records are accumulated and written
+        with :func:`bulkInsertIdentifiers`, one multi-row insert and one commit
+        per batch. Existing identifiers are skipped by the database rather than
+        queried for individually, and ``tlast_record`` is advanced once per
+        flushed batch. In this mode ``callback`` is called for every record
+        before it is queued, since whether it is new is only known on insert.
+        A batch that can not be written ends the harvest with an exception.
+
         Args:
             session: sqlalchemy session
             callback: optional callback mutate record before committing
             resume: If True, start retrieval from the last retrieved date
+            batch_size: optional number of records per bulk insert
+            engine: record parsing engine passed to Identifier.fromOAIRecord
 
         Returns:
             integer, number of records added
         """
+        import sickle.oaiexceptions
+
         svc = igsn_lib.oai.getSickle(self.service.url)
         kwargs = {"metadataPrefix": self.metadata_prefix}
         if self.setspec is not None:
@@ -293,42 +324,88 @@ class Job(Base):
             self.tend = igsn_lib.time.dtnow()
             session.commit()
             return counter
+        batch = []
         for record in records:
-            if total_count < 0:
-                _L.info(
-                    "OAI-PMH batch has %s records",
-                    records.resumption_token.complete_list_size,
-                )
-            total_count = int(records.resumption_token.complete_list_size)
+            if counter == 0:
+                # Single page responses have no resumptionToken
+                token = records.resumption_token
+                if token is not None and token.complete_list_size:
+                    total_count = int(token.complete_list_size)
+                _L.info("OAI-PMH batch has %s records", total_count)
             try:
                 igsn = Identifier(
                     service_id=self.service_id, harvest_time=igsn_lib.time.dtnow()
                 )
-                igsn.fromOAIRecord(record.raw)
+                igsn.fromOAIRecord(record.raw, engine=engine)
                 _L.debug(igsn)
-                exists = session.query(Identifier).get(igsn.id)
-                if not exists:
-                    _L.debug("NEW")
+                if batch_size is not None:
                     if callback is not None:
                         callback(record, igsn)
-                    new_count += 1
-                    try:
-                        session.add(igsn)
-                        self.tlast_record = igsn.provider_time
-                        session.commit()
-                    except sqlalchemy.exc.IntegrityError as e:
-                        _L.warning("IGSN entry already exists: %s", str(igsn))
+                    batch.append(igsn)
                 else:
-                    _L.debug("EXISTING")
+                    exists = session.query(Identifier).get(igsn.id)
+                    if not exists:
+                        _L.debug("NEW")
+                        if callback is not None:
+                            callback(record, igsn)
+                        new_count += 1
+                        try:
+                            session.add(igsn)
+                            self.tlast_record = igsn.provider_time
+                            session.commit()
+                        except sqlalchemy.exc.IntegrityError as e:
+                            _L.warning("IGSN entry already exists: %s", str(igsn))
+                    else:
+                        _L.debug("EXISTING")
             except Exception as e:
                 _L.error(e)
+            if batch_size is not None and len(batch) >= batch_size:
+                new_count += self._flushBatch(session, batch)
+                batch = []
             counter += 1
             if counter % 10 == 0:
                 _L.info("%s (%s) / %s", new_count, counter, total_count)
+        if len(batch) > 0:
+            new_count += self._flushBatch(session, batch)
+        if total_count < 0:
+            total_count = counter
         self.tend = igsn_lib.time.dtnow()
         session.commit()
         return new_count, counter, total_count
 
+    def _flushBatch(self, session, batch):
+        """
+        Bulk insert a batch of Identifiers and advance tlast_record.
+
+        A failed insert is rolled back and re-raised, ending the harvest with
+        tlast_record at the last batch written so a resumed job retrieves the
+        lost records again.
+
+        Args:
+            session: sqlalchemy session
+            batch: list of Identifier instances
+
+        Returns:
+            integer, number of new records written
+        """
+        try:
+            n_new = bulkInsertIdentifiers(session, batch)
+        except sqlalchemy.exc.SQLAlchemyError as e:
+            _L.error(e)
+            session.rollback()
+            raise
+        tlast = max(
+            (igsn.provider_time for igsn in batch if igsn.provider_time is not None),
+            default=None,
+        )
+        if tlast is not None:
+            self.tlast_record = tlast
+        session.commit()
+        _L.debug(
+            "Batch of %s: %s new, %s existing", len(batch), n_new, len(batch) - n_new
+        )
+        return n_new
+
 
 class Service(Base):
     __tablename__ = "service"
@@ -368,10 +445,7 @@ class Service(Base):
             self.url = url
         info = igsn_lib.oai.identify(self.url)
         self.name = info.repositoryName
-        self.tearliest = dateparser.parse(
-            info.earliestDatestamp,
-            settings={"TIMEZONE": "+0000", "RETURN_AS_TIMEZONE_AWARE": True},
-        )
+        self.tearliest = igsn_lib.time.datetimeFromString(info.earliestDatestamp)
         self.admin_email = info.adminEmail
         if session is not None:
             session.commit()
@@ -472,8 +546,8 @@ class Service(Base):
                 )
             )
             return jobs
-        t2_jd = tfrom_jd + tdelta
-        while t2_jd < tuntil_jd:
+        while tfrom_jd < tuntil_jd:
+            t2_jd = min(tfrom_jd + tdelta, tuntil_jd)
             jobs.append(
                 self.createJob(
                     session=session,
@@ -485,7 +559,147 @@ class Service(Base):
                 )
             )
             tfrom_jd = t2_jd
-            t2_jd = tfrom_jd + tdelta
+        return jobs
+
+    def planWindows(
+        self,
+        metadata_prefix="igsn",
+        setspec=None,
+        ignore_deleted=True,
+        tfrom=None,
+        tuntil=None,
+        max_records=10000,
+        min_delta=1.0 / 24.0,
+        counts=None,
+    ):
+        """
+        Split a time range into windows holding at most max_records records
+
+        The range is recursively bisected using the completeListSize reported by
+        :func:`igsn_lib.oai.recordCount` until each window is under max_records
+        or shorter than min_delta days. Empty windows are dropped, and adjacent
+        windows are then merged while their combined count stays under
+        max_records.
+
+        Args:
+            metadata_prefix: OAI-PMH metadata prefix
+            setspec: optional OAI-PMH set
+            ignore_deleted: ignore deleted records when counting
+            tfrom: Starting date, defaults to tearliest
+            tuntil: Ending date, defaults to now
+            max_records: target maximum number of records per window
+            min_delta: shortest window in days, defaults to one hour
+            counts: optional dict caching probe results, reused across calls
+
+        Returns:
+            list of ``(tfrom, tuntil, count)`` with datetime bounds
+        """
+        if tfrom is None:
+            tfrom = self.tearliest
+        if tuntil is None:
+            tuntil = igsn_lib.time.dtnow()
+        if counts is None:
+            counts = {}
+        oai_svc = igsn_lib.oai.getSickle(self.url)
+
+        def _count(t0, t1):
+            key = (
+                self.url,
+                metadata_prefix,
+                setspec,
+                ignore_deleted,
+                t0.strftime(igsn_lib.time.OAI_TIME_FORMAT),
+                t1.strftime(igsn_lib.time.OAI_TIME_FORMAT),
+            )
+            if key not in counts:
+                counts[key] = igsn_lib.oai.recordCount(
+                    oai_svc,
+                    metadata_prefix=metadata_prefix,
+                    ignore_deleted=ignore_deleted,
+                    set_spec=setspec,
+                    tfrom=t0,
+                    tuntil=t1,
+                )
+            return counts[key]
+
+        windows = []
+        pending = [
+            (igsn_lib.time.datetimeToJD(tfrom), igsn_lib.time.datetimeToJD(tuntil))
+        ]
+        while len(pending) > 0:
+            t0_jd, t1_jd = pending.pop()
+            t0 = igsn_lib.time.jdToDateTime(t0_jd)
+            t1 = igsn_lib.time.jdToDateTime(t1_jd)
+            n = _count(t0, t1)
+            _L.debug("Window %s - %s: %s records", t0, t1, n)
+            if n == 0:
+                continue
+            if n <= max_records or (t1_jd - t0_jd) <= min_delta:
+                windows.append((t0, t1, n))
+                continue
+            tmid_jd = (t0_jd + t1_jd) / 2.0
+            # Push the later half first so windows come out in time order
+            pending.append((tmid_jd, t1_jd))
+            pending.append((t0_jd, tmid_jd))
+        merged = []
+        for window in windows:
+            if len(merged) > 0 and merged[-1][2] + window[2] <= max_records:
+                prev = merged.pop()
+                window = (prev[0], window[1], prev[2] + window[2])
+            merged.append(window)
+        return merged
+
+    def createBalancedJobPackage(
+        self,
+        session=None,
+        ignore_deleted=True,
+        metadata_prefix="igsn",
+        setspec=None,
+        tfrom=None,
+        tuntil=None,
+        max_records=10000,
+        min_delta=1.0 / 24.0,
+        counts=None,
+    ):
+        """
+        Generates a set of jobs with roughly equal numbers of records
+
+        Unlike createJobPackage, which cuts fixed tdelta day windows, the
+        windows are sized by record count using :meth:`planWindows`.
+
+        Args:
+            session: database session
+            tfrom: Starting date, defaults to tearliest
+            tuntil: Ending date, defaults to now
+            max_records: target maximum number of records per job
+            min_delta: shortest window in days, defaults to one hour
+            counts: optional dict caching probe results, reused across calls
+
+        Returns:
+            list of Jobs
+        """
+        windows = self.planWindows(
+            metadata_prefix=metadata_prefix,
+            setspec=setspec,
+            ignore_deleted=ignore_deleted,
+            tfrom=tfrom,
+            tuntil=tuntil,
+            max_records=max_records,
+            min_delta=min_delta,
+            counts=counts,
+        )
+        jobs = []
+        for t0, t1, n in windows:
+            jobs.append(
+                self.createJob(
+                    session=session,
+                    ignore_deleted=ignore_deleted,
+                    metadata_prefix=metadata_prefix,
+                    setspec=setspec,
+                    tfrom=t0,
+                    tuntil=t1,
+                )
+            )
         return jobs
 
 
@@ -502,6 +716,9 @@ def createAll(engine):
     """
     Create the database tables etc if not aleady present.
 
+    Tables that already exist are brought up to date with
+    :func:`upgradeTables`.
+
     Args:
         engine: SqlAlchemy engine to use.
 
@@ -509,6 +726,55 @@ def createAll(engine):
         nothing
     """
     Base.metadata.create_all(engine)
+    upgradeTables(engine)
+
+
+def upgradeTables(engine):
+    """
+    Add the columns and indexes missing from existing tables.
+
+    ``create_all`` does not alter a table that already exists, so a database
+    created by an earlier version lacks columns added since, such as
+    ``thing.resolved_etag``, ``thing.resolved_last_modified`` and
+    ``thing.resolve_failures``. These are added with ``ALTER TABLE ... ADD
+    COLUMN``, with no value for existing rows, and missing indexes are
+    created. Columns are never removed or changed.
+
+    Args:
+        engine: SqlAlchemy engine to use.
+
+    Returns:
+        list of "table.column" and index names that were added
+    """
+    inspector = sqlalchemy.inspect(engine)
+    tables = set(inspector.get_table_names())
+    quote = engine.dialect.identifier_preparer.quote
+    added = []
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in tables:
+                continue
+            columns = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in columns:
+                    continue
+                _L.warning("Adding column %s.%s", table.name, column.name)
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(
+                    sqlalchemy.text(
+                        f"ALTER TABLE {quote(table.name)} "
+                        f"ADD COLUMN {quote(column.name)} {column_type}"
+                    )
+                )
+                added.append(f"{table.name}.{column.name}")
+            indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in indexes:
+                    continue
+                _L.warning("Adding index %s", index.name)
+                index.create(bind=connection)
+                added.append(index.name)
+    return added
 
 def getEngine(db_connection):
     engine = sqlalchemy.create_engine(db_connection)
@@ -554,6 +820,206 @@ def getOrCreate(session, model, create_method="", create_method_kwargs=None, **k
             return session.query(model).filter_by(**kwargs).one(), False
 
 
+def bulkInsertIdentifiers(session, identifiers):
+    """
+    Insert Identifiers with a single multi-row statement, skipping existing ids.
+
+    Uses ``INSERT ... ON CONFLICT DO NOTHING`` on Postgres and ``INSERT OR IGNORE``
+    on SQLite, split into statements of at most ``BULK_INSERT_MAX_PARAMETERS``
+    bind parameters, or ``SQLITE_LEGACY_MAX_PARAMETERS`` with SQLite older
+    than 3.32.0. Other databases fall back to checking for and adding each
+    record individually. The caller is responsible for committing the session.
+
+    Args:
+        session: sqlalchemy session
+        identifiers: list of Identifier instances
+
+    Returns:
+        integer, number of rows actually inserted
+    """
+    if len(identifiers) == 0:
+        return 0
+    dialect = session.get_bind().dialect.name
+    if dialect not in ("postgresql", "sqlite"):
+        return _insertIdentifiersEach(session, identifiers)
+    table = Identifier.__table__
+    json_columns = [c.key for c in table.columns if isinstance(c.type, sqlalchemy.JSON)]
+    rows = []
+    for igsn in identifiers:
+        row = {c.key: getattr(igsn, c.key) for c in table.columns}
+        if row["harvest_time"] is None:
+            row["harvest_time"] = igsn_lib.time.dtnow()
+        for k in json_columns:
+            # Match the ORM behavior of storing SQL NULL rather than JSON null
+            if row[k] is None:
+                row[k] = sqlalchemy.null()
+        rows.append(row)
+    chunk_size = max(1, _maxBindParameters(dialect) // len(table.columns))
+    n_new = 0
+    for i in range(0, len(rows), chunk_size):
+        chunk = rows[i : i + chunk_size]
+        if dialect == "postgresql":
+            stmt = (
+                sqlalchemy.dialects.postgresql.insert(table)
+                .values(chunk)
+                .on_conflict_do_nothing(index_elements=["id"])
+            )
+        else:
+            stmt = table.insert().values(chunk).prefix_with("OR IGNORE")
+        n_new += session.execute(stmt).rowcount
+    return n_new
+
+
+def _maxBindParameters(dialect):
+    """
+    Most bind parameters allowed in one statement for the named dialect.
+    """
+    if dialect == "sqlite" and sqlite3.sqlite_version_info < (3, 32, 0):
+        return min(BULK_INSERT_MAX_PARAMETERS, SQLITE_LEGACY_MAX_PARAMETERS)
+    return BULK_INSERT_MAX_PARAMETERS
+
+
+def _insertIdentifiersEach(session, identifiers):
+    """
+    Add Identifiers that are not already present, one query per record.
+    """
+    n_new = 0
+    seen = set()
+    for igsn in identifiers:
+        if igsn.id in seen or session.query(Identifier).get(igsn.id) is not None:
+            continue
+        if igsn.harvest_time is None:
+            igsn.harvest_time = igsn_lib.time.dtnow()
+        session.add(igsn)
+        seen.add(igsn.id)
+        n_new += 1
+    session.flush()
+    return n_new
+
+
+def _executeJobWindow(session_factory, job_id, batch_size, callback, engine):
+    """
+    Run a single Job in its own session, returning a result dict for the window.
+    """
+    result = {
+        "job_id": job_id,
+        "tfrom": None,
+        "tuntil": None,
+        "new": 0,
+        "count": 0,
+        "total": 0,
+        "error": None,
+    }
+    session = session_factory()
+    try:
+        job = session.query(Job).get(job_id)
+        result["tfrom"] = igsn_lib.time.datetimeToJsonStr(job.tfrom)
+        result["tuntil"] = igsn_lib.time.datetimeToJsonStr(job.tuntil)
+        res = job.execute(
+            session, callback=callback, batch_size=batch_size, engine=engine
+        )
+        if isinstance(res, tuple):
+            result["new"], result["count"], result["total"] = res
+        else:
+            result["new"] = res
+    except Exception as e:
+        _L.error("Job %s failed: %s", job_id, e)
+        result["error"] = str(e)
+        session.rollback()
+    finally:
+        session.close()
+    return result
+
+
+def executeJobPackage(
+    session_factory,
+    jobs,
+    workers=4,
+    provider_limit=2,
+    batch_size=1000,
+    callback=None,
+    progress=None,
+    engine=igsn_lib.oai.ENGINE_XMLTODICT,
+):
+    """
+    Execute a package of Jobs concurrently, e.g. from Service.createJobPackage
+
+    Each window is run by :meth:`Job.execute` in a worker thread with its own
+    session obtained from ``session_factory``. At most ``provider_limit`` windows
+    are run at the same time against any one service, and a window is only
+    handed to a worker once its service has a free slot, so ``workers`` is the
+    actual number of concurrent harvests. A failed window does not
+    affect the others; since Jobs record ``tlast_record`` as they go, the failed
+    Jobs can simply be passed to this method again to resume them.
+
+    Args:
+        session_factory: callable returning a new session, e.g. from getSession
+        jobs: list of committed Job instances
+        workers: number of worker threads
+        provider_limit: maximum concurrent windows per service
+        batch_size: records per bulk insert, None for per-record commits
+        callback: optional callback passed to Job.execute
+        progress: optional method called with the result dict of each window
+        engine: record parsing engine passed to Job.execute
+
+    Returns:
+        list of ``{job_id, tfrom, tuntil, new, count, total, error}``, one per
+        window in order of completion. ``error`` is None on success.
+    """
+    pending = {}
+    for job in jobs:
+        pending.setdefault(job.service_id, collections.deque()).append(job.id)
+    running = {service_id: 0 for service_id in pending}
+    futures = {}
+    results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+
+        def _submit():
+            # Round robin over services with a free slot until the workers are busy
+            submitted = True
+            while submitted and len(futures) < workers:
+                submitted = False
+                for service_id, queue in pending.items():
+                    if len(futures) >= workers:
+                        break
+                    if len(queue) == 0 or running[service_id] >= provider_limit:
+                        continue
+                    future = executor.submit(
+                        _executeJobWindow,
+                        session_factory,
+                        queue.popleft(),
+                        batch_size,
+                        callback,
+                        engine,
+                    )
+                    futures[future] = service_id
+                    running[service_id] += 1
+                    submitted = True
+
+        _submit()
+        while len(futures) > 0:
+            done, _ = concurrent.futures.wait(
+                futures, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                running[futures.pop(future)] -= 1
+                result = future.result()
+                results.append(result)
+                if result["error"] is None:
+                    _L.info(
+                        "Job %s (%s - %s) complete: %s new / %s",
+                        result["job_id"],
+                        result["tfrom"],
+                        result["tuntil"],
+                        result["new"],
+                        result["count"],
+                    )
+                if progress is not None:
+                    progress(result)
+            _submit()
+    return results
+
+
 def addService(session, url):
     """
     Add and OAI-PMH service record.
@@ -1,13 +1,39 @@
 import logging
 import json
-import dateparser
+import math
+import time
+import datetime
 import sqlalchemy
 import sqlalchemy.ext.declarative
 import sqlalchemy.orm
 import sqlalchemy.exc
+import igsn_lib
 import igsn_lib.time
+import igsn_lib.timing
 import igsn_lib.models
 
+_L = logging.getLogger("igsn_lib.models.thing")
+
+DEFAULT_PAGE_SIZE = 1000
+"""Number of Thing rows selected and updated at a time by resolveThings
+"""
+
+DEFAULT_REQUESTS_PER_HOUR = 3600
+"""Resolution budget of ResolveScheduler
+"""
+
+DEFAULT_FAILURE_BACKOFF = 3600
+"""Seconds before a failed resolution is first retried by ResolveScheduler
+"""
+
+DEFAULT_MAX_FAILURE_BACKOFF = 30 * 86400
+"""Longest time in seconds between retries of a failing resolution
+"""
+
+DEFAULT_REFRESH_AGE = 30 * 86400
+"""Age in seconds after which ResolveScheduler refreshes a successful resolution
+"""
+
 
 class Thing(igsn_lib.models.Base):
 
@@ -67,14 +93,21 @@ class Thing(igsn_lib.models.Base):
         default=None,
         nullable=True,
         index=True,
-        doc="Status code of the resolve response",
+        doc="Status code of the resolve response, 0 if there was no response",
     )
     tresolved = sqlalchemy.Column(
         sqlalchemy.DateTime(timezone=True),
         default=None,
         nullable=True,
+        index=True,
         doc="When the record was resolved",
     )
+    resolve_failures = sqlalchemy.Column(
+        sqlalchemy.Integer,
+        default=0,
+        nullable=True,
+        doc="Number of consecutive failed resolutions",
+    )
     resolve_elapsed = sqlalchemy.Column(
         sqlalchemy.Float,
         default=None,
@@ -93,8 +126,21 @@ class Thing(igsn_lib.models.Base):
         default=None,
         doc="Media type of resolved content",
     )
+    resolved_etag = sqlalchemy.Column(
+        sqlalchemy.String,
+        nullable=True,
+        default=None,
+        doc="ETag of the resolved response, for conditional refresh",
+    )
+    resolved_last_modified = sqlalchemy.Column(
+        sqlalchemy.String,
+        nullable=True,
+        default=None,
+        doc="Last-Modified of the resolved response, for conditional refresh",
+    )
     __table_args__ = (
         sqlalchemy.Index("item_type_status_idx", "item_type", "resolved_status"),
+        sqlalchemy.Index("status_tresolved_idx", "resolved_status", "tresolved"),
     )
 
     def __repr__(self):
@@ -115,13 +161,538 @@ class Thing(igsn_lib.models.Base):
             "resolved_content": self.resolved_content,
             "resolved_elapsed": self.resolve_elapsed,
             "resolved_media_type": self.resolved_media_type,
+            "resolved_etag": self.resolved_etag,
+            "resolved_last_modified": self.resolved_last_modified,
+            "resolve_failures": self.resolve_failures,
         }
         return res
 
-    def resolve(self, session):
+    def setResolved(self, hops, tresolved=None):
+        """
+        Set the resolve columns from a resolution chain.
+
+        Args:
+            hops: list of igsn_lib.Hop or responses from igsn_lib.resolve
+            tresolved: (datetime) when resolved, defaults to now
+        """
+        for k, v in thingColumnsFromHops(hops, tresolved=tresolved).items():
+            setattr(self, k, v)
+
+    def conditionalHeaders(self):
+        """
+        Request headers for a conditional refresh of this Thing.
+
+        Returns:
+            dict with If-None-Match and If-Modified-Since if validators are known
+        """
+        return conditionalHeaders(
+            self.resolved_status, self.resolved_etag, self.resolved_last_modified
+        )
+
+    def resolve(self, session, conditional=True, **kwargs):
+        """
+        Resolve the identifier of this Thing and commit the result.
+
+        Args:
+            session: sqlalchemy session
+            conditional: (bool) If True then only update tresolved if unmodified
+            **kwargs: passed to igsn_lib.resolve
+
+        Returns:
+            list of igsn_lib.Hop
+        """
+        kwargs.setdefault("compact", True)
+        if conditional:
+            headers = self.conditionalHeaders()
+            headers.update(kwargs.get("headers") or {})
+            kwargs["headers"] = headers
+        value = igsn_lib.normalize(self.id)
+        hops = []
+        if value is not None:
+            hops = igsn_lib.resolve(value, **kwargs)
+        else:
+            _L.warning("Not an IGSN: %s", self.id)
+        self.setResolved(hops)
+        session.commit()
+        return hops
+
+
+def conditionalHeaders(resolved_status, etag, last_modified):
+    """
+    Conditional request headers from the validators of a previous resolution.
+
+    Validators are only used if the previous resolution succeeded.
+
+    Args:
+        resolved_status: (int) Thing.resolved_status
+        etag: Thing.resolved_etag
+        last_modified: Thing.resolved_last_modified
+
+    Returns:
+        dict
+    """
+    res = {}
+    if resolved_status is None or not (200 <= resolved_status < 300):
+        return res
+    if etag is not None:
+        res["If-None-Match"] = etag
+    if last_modified is not None:
+        res["If-Modified-Since"] = last_modified
+    return res
+
+
+def thingColumnsFromHops(hops, tresolved=None):
+    """
+    Thing resolve column values from a resolution chain.
+
+    The values describe the final hop, with resolve_elapsed the total of all
+    hops. ETag and Last-Modified are only recorded for a 2xx final hop with a
+    body. If the final hop is 304 Not Modified only ``tresolved`` is returned,
+    since the previously resolved values still apply. The result can be used
+    with ``Session.bulk_update_mappings``.
+
+    Args:
+        hops: list of igsn_lib.Hop or responses from igsn_lib.resolve
+        tresolved: (datetime) when resolved, defaults to now
+
+    Returns:
+        dict of {column name: value}
+    """
+    if tresolved is None:
+        tresolved = igsn_lib.time.dtnow()
+    res = {
+        "resolved_url": None,
+        "resolved_status": None,
+        "tresolved": tresolved,
+        "resolve_elapsed": None,
+        "resolved_content": None,
+        "resolved_media_type": None,
+        "resolved_etag": None,
+        "resolved_last_modified": None,
+    }
+    if len(hops) == 0:
+        return res
+    final = hops[-1]
+    if final.status_code == 304:
+        return {"tresolved": tresolved}
+    res["resolved_url"] = final.url
+    res["resolved_status"] = final.status_code
+    elapsed = 0.0
+    for hop in hops:
+        e, ttfb = igsn_lib.timing.hopTimes(hop)
+        if e is not None:
+            elapsed += e
+    res["resolve_elapsed"] = elapsed
+    content_type = final.headers.get("Content-Type")
+    res["resolved_media_type"] = igsn_lib.mediaType(content_type)
+    if final.text:
+        res["resolved_content"] = {"content_type": content_type, "content": final.text}
+        # Validators are only kept with the content they describe, so that a
+        # 304 never stands in for a body that was not retrieved
+        if 200 <= final.status_code < 300:
+            res["resolved_etag"] = final.headers.get("ETag")
+            res["resolved_last_modified"] = final.headers.get("Last-Modified")
+    return res
+
+
+def resolveThing(session, identifier, **kwargs):
+    """
+    Resolve an identifier, recording the result in its Thing.
+
+    The Thing is created if it does not exist.
+
+    Args:
+        session: sqlalchemy session
+        identifier: identifier string, the Thing.id
+        **kwargs: passed to igsn_lib.resolve
+
+    Returns:
+        Thing
+    """
+    thing = session.query(Thing).filter(Thing.id == identifier).first()
+    if thing is None:
+        thing = Thing(id=identifier, tstamp=igsn_lib.time.dtnow())
+        session.add(thing)
+    thing.resolve(session, **kwargs)
+    return thing
+
+
+def _rowsQuery(session):
+    """
+    Query for the Thing columns needed to resolve rows.
+    """
+    return session.query(
+        Thing._id,
+        Thing.id,
+        Thing.resolved_status,
+        Thing.resolved_etag,
+        Thing.resolved_last_modified,
+        Thing.resolve_failures,
+    )
+
+
+def _unresolvedQuery(session, stale_before=None):
+    """
+    Query for Things that have not been resolved, got no response, or were not
+    resolved since stale_before.
+    """
+    condition = sqlalchemy.or_(Thing.tresolved == None, Thing.resolved_status == 0)
+    if stale_before is not None:
+        condition = sqlalchemy.or_(condition, Thing.tresolved < stale_before)
+    return _rowsQuery(session).filter(condition)
+
+
+def _conditionalResolver(resolver, validators):
+    """
+    Wrap resolver to add the conditional headers of each identifier.
+    """
+
+    def _resolve(value, headers=None, **kwargs):
+        cheaders = dict(validators.get(value, {}))
+        cheaders.update(headers or {})
+        return resolver(value, headers=cheaders, **kwargs)
+
+    return _resolve
+
+
+def _isSuccess(status):
+    return status is not None and (200 <= status < 300 or status == 304)
+
+
+def _resolveRows(dbsession, rows, workers, resolver, conditional, summary, **kwargs):
+    """
+    Resolve rows from _rowsQuery and write the results with a bulk update.
+
+    dbsession is the sqlalchemy session, kwargs may hold the HTTP ``session``.
+    Updates the ``count`` and ``status`` of summary.
+    """
+    tresolved = igsn_lib.time.dtnow()
+    # Several rows may share an identifier value
+    pending = {}
+    failures = {}
+    validators = {}
+    mappings = []
+    for _id, identifier, status, etag, last_modified, n_failures in rows:
+        failures[_id] = n_failures or 0
+        value = igsn_lib.normalize(identifier)
+        if value is None:
+            _L.warning("Not an IGSN: %s", identifier)
+            columns = thingColumnsFromHops([], tresolved=tresolved)
+            columns["_id"] = _id
+            columns["resolve_failures"] = failures[_id] + 1
+            mappings.append(columns)
+            continue
+        pending.setdefault(value, []).append(_id)
+        if conditional:
+            headers = conditionalHeaders(status, etag, last_modified)
+            if len(headers) > 0:
+                validators.setdefault(value, headers)
+    if len(validators) > 0:
+        resolver = _conditionalResolver(resolver, validators)
+    for value, hops in igsn_lib.resolveMany(
+        list(pending.keys()), workers=workers, resolver=resolver, **kwargs
+    ):
+        columns = thingColumnsFromHops(hops, tresolved=tresolved)
+        if len(hops) > 0:
+            status = hops[-1].status_code
+        else:
+            # The resolver raised, which is recorded as no response
+            status = 0
+            columns["resolved_status"] = status
+        for _id in pending[value]:
+            mapping = dict(columns, _id=_id)
+            mapping["resolve_failures"] = 0 if _isSuccess(status) else failures[_id] + 1
+            mappings.append(mapping)
+            summary["status"][status] = summary["status"].get(status, 0) + 1
+    dbsession.bulk_update_mappings(Thing, mappings)
+    dbsession.commit()
+    summary["count"] += len(rows)
+
+
+def _httpSession(workers, http_session, kwargs):
+    """
+    Set the HTTP session used for every batch in kwargs.
+
+    Without http_session, a session with a pool for workers is created when
+    the shared session is too small.
+
+    Returns:
+        the created session for the caller to close, or None
+    """
+    if http_session is None and workers > igsn_lib.DEFAULT_POOL_MAXSIZE:
+        kwargs["session"] = igsn_lib.createHttpSession(pool_maxsize=workers)
+        return kwargs["session"]
+    if http_session is not None:
+        kwargs["session"] = http_session
+    return None
+
+
+def resolveThings(
+    session,
+    stale_before=None,
+    page_size=DEFAULT_PAGE_SIZE,
+    workers=igsn_lib.DEFAULT_RESOLVE_WORKERS,
+    start_id=None,
+    progress=None,
+    conditional=True,
+    http_session=None,
+    **kwargs,
+):
+    """
+    Resolve Things that are unresolved or stale.
+
+    Rows are selected in pages of ``page_size`` ordered by ``_id``, each page
+    is resolved concurrently with :func:`igsn_lib.resolveMany` and the results
+    are written with one bulk update and commit per page.
+
+    With ``conditional``, rows previously resolved with an ETag or
+    Last-Modified are requested with If-None-Match or If-Modified-Since, and
+    a 304 Not Modified response only updates ``tresolved``.
+
+    A resolved row has ``tresolved`` set to the time of resolution, so it is
+    no longer selected. Running this again after an interruption therefore
+    continues with the rows that were not yet written. Rows whose resolution
+    got no response, ``resolved_status`` 0, are selected again on the next
+    run. Rows that are not IGSNs are recorded with ``resolved_status`` None.
+
+    Args:
+        session: sqlalchemy session
+        stale_before: (datetime) also resolve rows resolved before this time
+        page_size: (int) rows per page
+        workers: (int) concurrent resolutions
+        start_id: (int) only process rows with _id greater than this
+        progress: optional method called with the summary dict after each page
+        conditional: (bool) If True then make conditional requests where possible
+        http_session: optional requests.Session used for all pages, by default
+            one sized for workers
+        **kwargs: passed to igsn_lib.resolveMany, e.g. include_body, limiter
+
+    Returns:
+        summary dict ``{count, pages, last_id, status: {status_code: count}}``
+    """
+    kwargs.setdefault("compact", True)
+    resolver = kwargs.pop("resolver", None)
+    if resolver is None:
+        resolver = igsn_lib.resolve
+    summary = {"count": 0, "pages": 0, "last_id": start_id, "status": {}}
+    last_id = start_id
+    own_session = _httpSession(workers, http_session, kwargs)
+    try:
+        while True:
+            q = _unresolvedQuery(session, stale_before=stale_before)
+            if last_id is not None:
+                q = q.filter(Thing._id > last_id)
+            rows = q.order_by(Thing._id).limit(page_size).all()
+            if len(rows) == 0:
+                break
+            last_id = rows[-1][0]
+            _resolveRows(
+                session, rows, workers, resolver, conditional, summary, **kwargs
+            )
+            summary["pages"] += 1
+            summary["last_id"] = last_id
+            _L.info("Resolved %s things, last _id = %s", summary["count"], last_id)
+            if progress is not None:
+                progress(summary)
+    finally:
+        if own_session is not None:
+            own_session.close()
+    return summary
+
+
+class ResolveScheduler(object):
+    """
+    Prioritized re-resolution of Things within a request budget.
+
+    Each batch is planned from indexed queries in order of priority:
+
+    1. Things never resolved, by ``_id``.
+    2. Things whose last resolution failed, once the backoff for their number
+       of consecutive failures has passed. The backoff doubles with each
+       failure from ``failure_backoff`` up to ``max_failure_backoff``.
+       Fewer failures come first, then oldest.
+    3. Things resolved successfully more than ``refresh_age`` ago, oldest first.
+
+    Batches are paced so that no more than ``requests_per_hour`` resolutions
+    are started per hour.
+
+    Args:
+        session: sqlalchemy session
+        requests_per_hour: (float) resolution budget
+        batch_size: (int) Things resolved per batch
+        failure_backoff: (float) seconds before the first retry of a failure
+        max_failure_backoff: (float) longest seconds between retries
+        refresh_age: (float) seconds after which a success is refreshed
+        workers: (int) concurrent resolutions
+        clock: method returning seconds, for pacing
+        sleep: method to wait seconds, for pacing
+
+    Examples:
+
+        .. code-block:: python
+
+           scheduler = igsn_lib.models.thing.ResolveScheduler(
+               session, requests_per_hour=1800, refresh_age=7 * 86400
+           )
+           print(scheduler.run(max_batches=10, include_body=True))
+    """
+
+    def __init__(
+        self,
+        session,
+        requests_per_hour=DEFAULT_REQUESTS_PER_HOUR,
+        batch_size=100,
+        failure_backoff=DEFAULT_FAILURE_BACKOFF,
+        max_failure_backoff=DEFAULT_MAX_FAILURE_BACKOFF,
+        refresh_age=DEFAULT_REFRESH_AGE,
+        workers=igsn_lib.DEFAULT_RESOLVE_WORKERS,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        if failure_backoff <= 0:
+            raise ValueError("failure_backoff must be greater than 0")
+        if max_failure_backoff < failure_backoff:
+            raise ValueError("max_failure_backoff must be at least failure_backoff")
+        if requests_per_hour <= 0:
+            raise ValueError("requests_per_hour must be greater than 0")
+        self.session = session
+        self.requests_per_hour = requests_per_hour
+        self.batch_size = batch_size
+        self.failure_backoff = failure_backoff
+        self.max_failure_backoff = max_failure_backoff
+        self.refresh_age = refresh_age
+        self.workers = workers
+        self.clock = clock
+        self.sleep = sleep
+
+    def backoff(self, failures):
+        """
+        Seconds to wait after the given number of consecutive failures.
+        """
+        return min(
+            self.max_failure_backoff, self.failure_backoff * 2 ** max(0, failures - 1)
+        )
+
+    def _maxFailures(self):
+        """
+        Failure count after which the backoff stops growing.
+        """
+        ratio = self.max_failure_backoff / self.failure_backoff
+        return max(1, math.ceil(math.log2(ratio)) + 1)
+
+    def plan(self, limit=None, now=None):
+        """
+        Rows to resolve next, in order of priority.
+
+        Args:
+            limit: (int) maximum rows, defaults to batch_size
+            now: (datetime) current time, defaults to now
+
+        Returns:
+            list of rows ``(_id, id, resolved_status, resolved_etag,
+            resolved_last_modified, resolve_failures)``
+        """
+        if limit is None:
+            limit = self.batch_size
+        if now is None:
+            now = igsn_lib.time.dtnow()
+        rows = []
+
+        def _add(q):
+            remaining = limit - len(rows)
+            if remaining > 0:
+                rows.extend(q.limit(remaining).all())
+
+        _add(_rowsQuery(self.session).filter(Thing.tresolved == None).order_by(Thing._id))
+        failed = sqlalchemy.and_(
+            Thing.tresolved != None,
+            sqlalchemy.or_(
+                Thing.resolved_status == None,
+                Thing.resolved_status < 200,
+                Thing.resolved_status >= 300,
+            ),
+        )
+        max_failures = self._maxFailures()
+        for n in range(0, max_failures + 1):
+            if n == 0:
+                count = sqlalchemy.or_(
+                    Thing.resolve_failures == None, Thing.resolve_failures == 0
+                )
+            elif n == max_failures:
+                count = Thing.resolve_failures >= n
+            else:
+                count = Thing.resolve_failures == n
+            cutoff = now - datetime.timedelta(seconds=self.backoff(n))
+            _add(
+                _rowsQuery(self.session)
+                .filter(failed, count, Thing.tresolved < cutoff)
+                .order_by(Thing.tresolved)
+            )
+        cutoff = now - datetime.timedelta(seconds=self.refresh_age)
+        _add(
+            _rowsQuery(self.session)
+            .filter(
+                Thing.resolved_status >= 200,
+                Thing.resolved_status < 300,
+                Thing.tresolved < cutoff,
+            )
+            .order_by(Thing.tresolved)
+        )
+        return rows
 
-        pass
+    def run(
+        self,
+        max_batches=None,
+        progress=None,
+        conditional=True,
+        http_session=None,
+        **kwargs,
+    ):
+        """
+        Resolve batches of Things until nothing is due or max_batches is reached.
 
+        Args:
+            max_batches: (int) stop after this many batches, None for no limit
+            progress: optional method called with the summary dict after each batch
+            conditional: (bool) If True then make conditional requests where possible
+            http_session: optional requests.Session used for all batches, by
+                default one sized for workers
+            **kwargs: passed to igsn_lib.resolveMany
 
-def resolveThing(session, identifier):
-    pass
+        Returns:
+            summary dict ``{count, batches, status: {status_code: count}}``
+        """
+        kwargs.setdefault("compact", True)
+        resolver = kwargs.pop("resolver", None)
+        if resolver is None:
+            resolver = igsn_lib.resolve
+        interval = 3600.0 / self.requests_per_hour
+        summary = {"count": 0, "batches": 0, "status": {}}
+        tstart = self.clock()
+        own_session = _httpSession(self.workers, http_session, kwargs)
+        try:
+            while max_batches is None or summary["batches"] < max_batches:
+                rows = self.plan()
+                if len(rows) == 0:
+                    break
+                # Start the batch once the budget allows for the previous ones
+                wait = tstart + summary["count"] * interval - self.clock()
+                if wait > 0:
+                    self.sleep(wait)
+                _resolveRows(
+                    self.session,
+                    rows,
+                    self.workers,
+                    resolver,
+                    conditional,
+                    summary,
+                    **kwargs,
+                )
+                summary["batches"] += 1
+                _L.info("Scheduled %s resolutions", summary["count"])
+                if progress is not None:
+                    progress(summary)
+        finally:
+            if own_session is not None:
+                own_session.close()
+        return summary
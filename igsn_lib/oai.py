@@ -1,18 +1,19 @@
 """
 Methods in support of OAI-PMH harvesting of IGSN records.
+
+sickle, xmltodict and lxml are only imported when first needed.
 """
 
 import logging
+import collections.abc
 import concurrent.futures
 import datetime
-import dateparser
-import sickle
-import sickle.oaiexceptions
 import json
-import xmltodict
 import igsn_lib
 import igsn_lib.time
 
+_etree = None
+
 IGSN_OAI_NAMESPACES = {
     "http://www.w3.org/2001/XMLSchema-instance": "xsi",
     "http://purl.org/dc/elements/1.1/": "dc",
@@ -32,11 +33,72 @@ DEFAULT_THREAD_COUNT = 10
 DEFAULT_ENCODING = "utf-8"
 DEFAULT_IGSN_OAIPMH_PROVIDER = "https://doidb.wdc-terra.org/igsnoaip/oai"
 
+ENGINE_XMLTODICT = "xmltodict"
+"""oaiRecordToDict engine building the full xmltodict tree of a record
+"""
+
+ENGINE_ETREE = "etree"
+"""oaiRecordToDict engine reading only the needed elements with ElementTree
+"""
+
+SOURCE_TREE = "tree"
+"""Keep the xmltodict tree of a record in ``_source``
+"""
+
+SOURCE_LAZY = "lazy"
+"""Keep the raw record XML in ``_source``, parsed to a tree on first access
+"""
+
+SOURCE_OMIT = "omit"
+"""Do not include ``_source`` in the parsed record
+"""
+
+
+def _clarkPath(*steps):
+    """
+    Namespace qualified ElementTree path from ``prefix:name`` steps.
+    """
+    res = []
+    for step in steps:
+        prefix, name = step.split(":", 1)
+        res.append(f"{{{IGSN_OAI_NAMESPACES_INV[prefix]}}}{name}")
+    return "/".join(res)
+
+
+_PATH_OAI_ID = _clarkPath("oai:header", "oai:identifier")
+_PATH_OAI_DATESTAMP = _clarkPath("oai:header", "oai:datestamp")
+_PATH_SET_SPEC = _clarkPath("oai:header", "oai:setSpec")
+_PATH_SAMPLE = _clarkPath("oai:metadata", "igsn:sample")
+_PATH_SAMPLE_NUMBER = _PATH_SAMPLE + "/" + _clarkPath("igsn:sampleNumber")
+_PATH_REGISTRANT_NAME = (
+    _PATH_SAMPLE + "/" + _clarkPath("igsn:registrant", "igsn:registrantName")
+)
+_PATH_LOG_ELEMENT = _PATH_SAMPLE + "/" + _clarkPath("igsn:log", "igsn:logElement")
+_PATH_RELATED_IDENTIFIER = (
+    _PATH_SAMPLE
+    + "/"
+    + _clarkPath("igsn:relatedResourceIdentifiers", "igsn:relatedIdentifier")
+)
+
 
 def _getLogger():
     return logging.getLogger("igsn_lib.oai")
 
 
+def _getEtree():
+    """
+    The ElementTree implementation, lxml if available.
+    """
+    global _etree
+    if _etree is None:
+        try:
+            import lxml.etree as etree
+        except ImportError:
+            import xml.etree.ElementTree as etree
+        _etree = etree
+    return _etree
+
+
 def getSickle(url):
     """
     Create a Sickle instance
@@ -47,6 +109,8 @@ def getSickle(url):
     Returns:
         sickle.Sickle instance
     """
+    import sickle
+
     return sickle.Sickle(url, encoding=DEFAULT_ENCODING)
 
 
@@ -100,6 +164,9 @@ def recordCount(
         tfrom (str or datetime): Optional representation of time for the earliest record (inclusive)
         tuntil (str or datetime): Optional representation of time for the latest record (inclusive)
 
+    The completeListSize of the resumptionToken is used when available,
+    otherwise the records of the response are counted.
+
     Returns:
         int: Number of records matching the specified subset.
 
@@ -139,10 +206,18 @@ def recordCount(
         )
     except:
         pass
+    import sickle.oaiexceptions
+
     count = 0
     try:
         response = svc.ListRecords(ignore_deleted=ignore_deleted, **kwargs)
-        count = int(response.resumption_token.complete_list_size)
+        token = response.resumption_token
+        if token is None or not token.complete_list_size:
+            # Single page results carry no resumptionToken, and the
+            # completeListSize is optional, so count the records instead
+            count = sum(1 for record in response)
+        else:
+            count = int(token.complete_list_size)
     except sickle.oaiexceptions.NoRecordsMatch as e:
         L.info("No records for set %s @ %s - %s", set_spec, tfrom, tuntil)
     return count
@@ -223,7 +298,85 @@ def listRecords(
     return svc.ListRecords(ignore_deleted=ignore_deleted, **kwargs)
 
 
-def oaiRecordToDict(xml_string):
+class LazySource(collections.abc.Mapping):
+    """
+    Read only mapping of the xmltodict tree of a record, parsed on first access.
+
+    Only the raw XML is held until the tree is needed, which is much smaller
+    than the tree itself.
+    """
+
+    __slots__ = ("raw", "_tree")
+
+    def __init__(self, raw):
+        if isinstance(raw, str):
+            raw = raw.encode(DEFAULT_ENCODING)
+        self.raw = raw
+        self._tree = None
+
+    @property
+    def tree(self):
+        """The xmltodict tree of the record."""
+        if self._tree is None:
+            import xmltodict
+
+            self._tree = xmltodict.parse(
+                self.raw, process_namespaces=True, namespaces=IGSN_OAI_NAMESPACES
+            )
+        return self._tree
+
+    def __getitem__(self, key):
+        return self.tree[key]
+
+    def __iter__(self):
+        return iter(self.tree)
+
+    def __len__(self):
+        return len(self.tree)
+
+
+def _logEntries(events):
+    """
+    Generate log entries and the IGSN time from (event, timestamp) pairs.
+    """
+    # log 'events':
+    #   https://doidb.wdc-terra.org//igsn/schemas/igsn.org/schema/1.0/include/igsn-eventType-v1.0.xsd
+    log = []
+    igsn_time = None
+    for event, tstamp in events:
+        _event = event.lower().strip()
+        _time = igsn_lib.time.datetimeFromString(tstamp)
+        log.append(
+            {"event": _event, "time": _time.strftime(igsn_lib.time.JSON_TIME_FORMAT)}
+        )
+        if _event == "submitted":
+            igsn_time = _time
+        if _event == "registered":
+            # Use registered time if submitted not available
+            if igsn_time is None:
+                igsn_time = _time
+        if _event == "updated":
+            # Fall back to updated time
+            if igsn_time is None:
+                igsn_time = _time
+    return log, igsn_time
+
+
+def _emptyRecordDict():
+    return {
+        "igsn_id": None,  # Value of the IGSN identifier
+        "oai_id": None,  # Internal OAI-PMH identifier of this record
+        "registrant": None,  # registrant name
+        "oai_time": None,  # time stamp on the OAI record
+        "igsn_time": None,  # submitted or registered time in the log
+        "set_spec": [],  # list of setSpec entries for record
+        "log": [],  # list of log entries
+        "related": [],  # list of related identifiers
+        "_source": {},
+    }
+
+
+def oaiRecordToDict(xml_string, engine=ENGINE_XMLTODICT, source=None):
     '''
     Converts an OAI-PMH IGSN metadata record to a dict
 
@@ -231,8 +384,22 @@ def oaiRecordToDict(xml_string):
 
     Times are returned as timezone aware python datetime, TZ=UTC.
 
+    Two parsing engines are available. ``xmltodict`` (the default) builds the
+    complete namespaced tree of the record. ``etree`` reads only the needed
+    elements using lxml (or the standard library ElementTree if lxml is
+    unavailable) and is faster. Both engines produce the same entries.
+
+    The ``source`` mode controls what is kept in ``_source``. With
+    ``SOURCE_TREE`` it is the xmltodict tree. With ``SOURCE_LAZY`` it is a
+    :class:`LazySource` holding the raw XML, which behaves like the tree but is
+    only parsed when accessed. With ``SOURCE_OMIT`` the entry is left out. The
+    default is ``SOURCE_TREE`` for the xmltodict engine and ``SOURCE_LAZY`` for
+    the etree engine.
+
     Args:
         raw_record: OAI-PMH record XML in IGSN format
+        engine: Parsing engine to use, ``xmltodict`` or ``etree``
+        source: What to keep in ``_source``, ``tree``, ``lazy`` or ``omit``
 
     Returns:
         dict or None on failure
@@ -271,18 +438,38 @@ def oaiRecordToDict(xml_string):
            data = igsn_lib.oai.oaiRecordToDict(xml)
            pprint.pprint(data, indent=2)
     '''
+    if engine == ENGINE_ETREE:
+        data = _oaiRecordToDictEtree(xml_string)
+        if source is None:
+            source = SOURCE_LAZY
+    elif engine == ENGINE_XMLTODICT:
+        data = _oaiRecordToDictXmltodict(xml_string)
+        if source is None:
+            source = SOURCE_TREE
+    else:
+        raise ValueError(f"Unknown parsing engine: {engine}")
+    if data is None:
+        return None
+    if source == SOURCE_LAZY:
+        data["_source"] = LazySource(xml_string)
+    elif source == SOURCE_TREE:
+        if engine != ENGINE_XMLTODICT:
+            data["_source"] = LazySource(xml_string).tree
+    elif source == SOURCE_OMIT:
+        data.pop("_source")
+    else:
+        raise ValueError(f"Unknown source mode: {source}")
+    return data
+
+
+def _oaiRecordToDictXmltodict(xml_string):
+    """
+    Implements oaiRecordToDict using xmltodict.
+    """
+    import xmltodict
+
     _L = _getLogger()
-    data = {
-        "igsn_id": None,  # Value of the IGSN identifier
-        "oai_id": None,  # Internal OAI-PMH identifier of this record
-        "registrant": None,  # registrant name
-        "oai_time": None,  # time stamp on the OAI record
-        "igsn_time": None,  # submitted or registered time in the log
-        "set_spec": [],  # list of setSpec entries for record
-        "log": [],  # list of log entries
-        "related": [],  # list of related identifiers
-        "_source": {},
-    }
+    data = _emptyRecordDict()
     try:
         data["_source"] = xmltodict.parse(
             xml_string, process_namespaces=True, namespaces=IGSN_OAI_NAMESPACES
@@ -293,44 +480,22 @@ def oaiRecordToDict(xml_string):
     # _L.debug(json.dumps(data["_source"], indent=2))
     data["oai_id"] = data["_source"]["oai:record"]["oai:header"]["oai:identifier"]
     # Always store time in UTC
-    data["oai_time"] = dateparser.parse(
-        data["_source"]["oai:record"]["oai:header"]["oai:datestamp"],
-        settings={"TIMEZONE": "+0000"},
+    data["oai_time"] = igsn_lib.time.datetimeFromString(
+        data["_source"]["oai:record"]["oai:header"]["oai:datestamp"]
     )
     _sample = data["_source"]["oai:record"]["oai:metadata"]["igsn:sample"]
     igsn_id = _sample["igsn:sampleNumber"]["#text"]
     data["igsn_id"] = igsn_lib.normalize(igsn_id)
     data["registrant"] = _sample["igsn:registrant"]["igsn:registrantName"]
     data["set_spec"] = data["_source"]["oai:record"]["oai:header"]["oai:setSpec"]
-    # log 'events':
-    #   https://doidb.wdc-terra.org//igsn/schemas/igsn.org/schema/1.0/include/igsn-eventType-v1.0.xsd
     igsn_log = _sample["igsn:log"]["igsn:logElement"]
     if isinstance(igsn_log, dict):
         igsn_log = [
             igsn_log,
         ]
-    data["log"] = []
-    igsn_time = None
-    for _log in igsn_log:
-        _event = _log["@event"].lower().strip()
-        _time = dateparser.parse(
-            _log["@timeStamp"],
-            settings={"TIMEZONE": "+0000", "RETURN_AS_TIMEZONE_AWARE": True},
-        )
-        data["log"].append(
-            {"event": _event, "time": _time.strftime(igsn_lib.time.JSON_TIME_FORMAT)}
-        )
-        if _event == "submitted":
-            igsn_time = _time
-        if _event == "registered":
-            # Use registered time if submitted not available
-            if igsn_time is None:
-                igsn_time = _time
-        if _event == "updated":
-            # Fall back to updated time
-            if igsn_time is None:
-                igsn_time = _time
-    data["igsn_time"] = igsn_time
+    data["log"], data["igsn_time"] = _logEntries(
+        (_log["@event"], _log["@timeStamp"]) for _log in igsn_log
+    )
     _related_ids = []
     try:
         _related_ids = _sample["igsn:relatedResourceIdentifiers"][
@@ -351,6 +516,48 @@ def oaiRecordToDict(xml_string):
     return data
 
 
+def _etreeText(element):
+    if element is None or element.text is None:
+        return None
+    return element.text.strip()
+
+
+def _oaiRecordToDictEtree(xml_string):
+    """
+    Implements oaiRecordToDict using ElementTree and precomputed element paths.
+    """
+    _L = _getLogger()
+    data = _emptyRecordDict()
+    try:
+        if isinstance(xml_string, str):
+            xml_string = xml_string.encode(DEFAULT_ENCODING)
+        root = _getEtree().fromstring(xml_string)
+    except Exception as e:
+        _L.error(e)
+        return None
+    data["oai_id"] = _etreeText(root.find(_PATH_OAI_ID))
+    data["oai_time"] = igsn_lib.time.datetimeFromString(
+        _etreeText(root.find(_PATH_OAI_DATESTAMP))
+    )
+    data["igsn_id"] = igsn_lib.normalize(_etreeText(root.find(_PATH_SAMPLE_NUMBER)))
+    data["registrant"] = _etreeText(root.find(_PATH_REGISTRANT_NAME))
+    # Single setSpec is a string, matching the xmltodict representation
+    set_spec = [_etreeText(e) for e in root.iterfind(_PATH_SET_SPEC)]
+    if len(set_spec) == 1:
+        set_spec = set_spec[0]
+    data["set_spec"] = set_spec
+    data["log"], data["igsn_time"] = _logEntries(
+        (e.get("event"), e.get("timeStamp")) for e in root.iterfind(_PATH_LOG_ELEMENT)
+    )
+    for e in root.iterfind(_PATH_RELATED_IDENTIFIER):
+        entry = {}
+        entry["id"] = _etreeText(e) or ""
+        entry["id_type"] = e.get("relatedIdentifierType", "")
+        entry["rel_type"] = e.get("relationType", "")
+        data["related"].append(entry)
+    return data
+
+
 class DatetimeEncoder(json.JSONEncoder):
     def default(self, obj):
         try:
@@ -361,8 +568,29 @@ class DatetimeEncoder(json.JSONEncoder):
             return str(obj)
 
 def oaiDictRecordToJson(record, indent=2, include_source=False):
+    """
+    Serialize a dict from oaiRecordToDict to JSON.
+
+    Args:
+        record: dict from oaiRecordToDict
+        indent: JSON indentation
+        include_source: False or ``SOURCE_OMIT`` to leave out ``_source``,
+            True or ``SOURCE_TREE`` to include the xmltodict tree, or
+            ``SOURCE_LAZY`` to include the raw XML as a string.
+
+    Returns:
+        string, JSON
+    """
     result = record.copy()
-    if not include_source:
-        result.pop('_source',None)
+    source = result.pop("_source", None)
+    if include_source and include_source != SOURCE_OMIT and source is not None:
+        if include_source == SOURCE_LAZY:
+            if not isinstance(source, LazySource):
+                raise ValueError("Raw XML is only available for lazy _source")
+            result["_source"] = source.raw.decode(DEFAULT_ENCODING)
+        elif isinstance(source, LazySource):
+            result["_source"] = source.tree
+        else:
+            result["_source"] = source
     return json.dumps(result, cls=DatetimeEncoder, indent=indent)
 
@@ -0,0 +1,286 @@
+"""
+Map IGSN prefixes to allocating agents or registrants.
+
+:class:`PrefixTrie` is a character trie that answers longest-prefix lookups in
+time proportional to the length of the identifier. A trie can be built from
+``(identifier, registrant)`` pairs, such as harvested
+:class:`igsn_lib.models.Identifier` rows, and saved to a JSON file.
+
+Example:
+
+    .. code-block:: python
+
+       import igsn_lib.models
+       import igsn_lib.prefix
+
+       session = igsn_lib.models.getSession(igsn_lib.models.getEngine(db_url))()
+       trie = igsn_lib.prefix.trieFromSession(session)
+       trie.save("prefixes.json")
+       print(trie.lookup("IEEJR000M"))
+"""
+
+import json
+import logging
+import igsn_lib
+
+DEFAULT_MIN_LENGTH = 2
+"""Shortest prefix assigned when building a trie from observations
+"""
+
+DEFAULT_MIN_SHARE = 0.95
+"""Fraction of identifiers under a prefix that must share a value for it to be assigned
+"""
+
+_VALUE = ""
+# Key of the value in a trie node. Never a character of a prefix.
+
+
+def _getLogger():
+    return logging.getLogger("igsn_lib.prefix")
+
+
+class PrefixTrie(object):
+    """
+    Character trie of IGSN prefixes.
+
+    Nodes are nested dicts keyed by character, with the value of a prefix
+    stored under the empty string key. Prefixes are case insensitive.
+
+    Examples:
+
+        .. jupyter-execute::
+
+           import igsn_lib.prefix
+
+           trie = igsn_lib.prefix.PrefixTrie()
+           trie.insert("IE", "SESAR")
+           trie.insert("ICDP", "ICDP")
+           print(trie.lookup("IEEJR000M"))
+           print(trie.longestPrefix("icdp5054eew1001"))
+           print(trie.lookup("XYZ123"))
+    """
+
+    def __init__(self):
+        self._root = {}
+        self._size = 0
+
+    def insert(self, prefix, value):
+        """
+        Set the value for a prefix.
+
+        Args:
+            prefix: string
+            value: JSON serializable value, usually the registrant name
+        """
+        if len(prefix) == 0:
+            raise ValueError("Empty prefix")
+        node = self._root
+        for c in prefix.upper():
+            node = node.setdefault(c, {})
+        if _VALUE not in node:
+            self._size += 1
+        node[_VALUE] = value
+
+    def longestPrefix(self, identifier):
+        """
+        Longest prefix of identifier with a value.
+
+        Args:
+            identifier: pre-normalized IGSN string
+
+        Returns:
+            (prefix, value) or (None, None) if no prefix matches
+        """
+        node = self._root
+        match = None
+        for i, c in enumerate(identifier.upper()):
+            node = node.get(c)
+            if node is None:
+                break
+            if _VALUE in node:
+                match = i + 1
+                value = node[_VALUE]
+        if match is None:
+            return None, None
+        return identifier[:match].upper(), value
+
+    def lookup(self, identifier, default=None):
+        """
+        Value of the longest prefix of identifier.
+
+        Args:
+            identifier: pre-normalized IGSN string
+            default: returned if no prefix matches
+
+        Returns:
+            value or default
+        """
+        prefix, value = self.longestPrefix(identifier)
+        if prefix is None:
+            return default
+        return value
+
+    def annotate(self, identifiers, default=None):
+        """
+        Look up the value for many identifiers.
+
+        Args:
+            identifiers: iterable of pre-normalized IGSN strings
+            default: value for identifiers with no matching prefix
+
+        Returns:
+            generator of (identifier, value)
+        """
+        lookup = self.lookup
+        for identifier in identifiers:
+            yield identifier, lookup(identifier, default=default)
+
+    def items(self):
+        """
+        All prefixes with values.
+
+        Returns:
+            generator of (prefix, value), in prefix order
+        """
+        stack = [("", self._root)]
+        while len(stack) > 0:
+            prefix, node = stack.pop()
+            if _VALUE in node:
+                yield prefix, node[_VALUE]
+            for c in sorted((k for k in node if k != _VALUE), reverse=True):
+                stack.append((prefix + c, node[c]))
+
+    def save(self, path):
+        """
+        Write the trie to a JSON file.
+
+        Args:
+            path: file name
+        """
+        with open(path, "w") as dest:
+            json.dump(self._root, dest, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path):
+        """
+        PrefixTrie from a JSON file written by save.
+
+        Args:
+            path: file name
+
+        Returns:
+            PrefixTrie
+        """
+        res = cls()
+        with open(path, "r") as src:
+            res._root = json.load(src)
+        res._size = sum(1 for _ in res.items())
+        return res
+
+    @classmethod
+    def fromPairs(
+        cls,
+        pairs,
+        min_share=DEFAULT_MIN_SHARE,
+        min_count=1,
+        min_length=DEFAULT_MIN_LENGTH,
+    ):
+        """
+        Build a trie from observed (identifier, value) pairs.
+
+        The letters of each identifier (see :func:`igsn_lib.igsnPrefix`) are
+        counted per value. Each prefix is assigned its most common value if
+        that value accounts for at least ``min_share`` of the identifiers under
+        the prefix, otherwise longer prefixes are examined. The shortest
+        prefixes that satisfy this are kept, so the result is compact.
+        Identifiers whose letters end at a prefix that is not assigned give
+        that prefix their majority value.
+
+        Args:
+            pairs: iterable of (identifier, value), value None is ignored
+            min_share: (float) required fraction of identifiers with the majority value
+            min_count: (int) minimum number of identifiers under an assigned prefix
+            min_length: (int) minimum length of an assigned prefix
+
+        Returns:
+            PrefixTrie
+        """
+        # Each node of counts is
+        # [ {value: count}, {char: node}, {value: count of identifiers ending here} ]
+        counts = [{}, {}, {}]
+        n = 0
+        for identifier, value in pairs:
+            if value is None:
+                continue
+            prefix = igsn_lib.igsnPrefix(identifier)
+            if prefix is None:
+                continue
+            n += 1
+            node = counts
+            for c in prefix:
+                node = node[1].setdefault(c, [{}, {}, {}])
+                node[0][value] = node[0].get(value, 0) + 1
+            node[2][value] = node[2].get(value, 0) + 1
+        _getLogger().debug("Building prefix trie from %s identifiers", n)
+        res = cls()
+        stack = [(c, node) for c, node in counts[1].items()]
+        while len(stack) > 0:
+            prefix, node = stack.pop()
+            total = sum(node[0].values())
+            if total < min_count:
+                continue
+            value, count = max(node[0].items(), key=lambda kv: kv[1])
+            if len(prefix) >= min_length and count >= min_share * total:
+                res.insert(prefix, value)
+                continue
+            if len(node[2]) > 0:
+                value, count = max(node[2].items(), key=lambda kv: kv[1])
+                if count >= min_count:
+                    res.insert(prefix, value)
+            for c, child in node[1].items():
+                stack.append((prefix + c, child))
+        return res
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, prefix):
+        node = self._root
+        for c in prefix.upper():
+            node = node.get(c)
+            if node is None:
+                return False
+        return _VALUE in node
+
+
+def trieFromSession(
+    session,
+    min_share=DEFAULT_MIN_SHARE,
+    min_count=1,
+    min_length=DEFAULT_MIN_LENGTH,
+    batch_size=10000,
+):
+    """
+    Build a PrefixTrie from the registrants of harvested identifiers.
+
+    Args:
+        session: SQLAlchemy session
+        min_share: (float) see PrefixTrie.fromPairs
+        min_count: (int) see PrefixTrie.fromPairs
+        min_length: (int) see PrefixTrie.fromPairs
+        batch_size: (int) rows fetched from the database at a time
+
+    Returns:
+        PrefixTrie
+    """
+    import igsn_lib.models
+
+    Identifier = igsn_lib.models.Identifier
+    rows = (
+        session.query(Identifier.id, Identifier.registrant)
+        .filter(Identifier.registrant != None)
+        .yield_per(batch_size)
+    )
+    return PrefixTrie.fromPairs(
+        rows, min_share=min_share, min_count=min_count, min_length=min_length
+    )
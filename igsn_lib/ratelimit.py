@@ -0,0 +1,295 @@
+"""
+Per-host rate limiting and adaptive concurrency for resolution.
+
+A :class:`RateLimiter` is passed to :func:`igsn_lib.resolve` (or resolveN2T,
+resolveMany) as ``limiter``. Every request of a resolution chain waits for its
+host's :class:`HostLimiter`, which combines:
+
+* a token bucket limiting the request rate, and
+* an AIMD (additive increase, multiplicative decrease) concurrency limit that
+  grows while the host responds normally and is cut when it responds with
+  429 or 503, or fails to respond.
+
+A ``Retry-After`` header on a 429 or 503 response blocks further requests to
+the host until the indicated time.
+
+Example:
+
+    .. code-block:: python
+
+       import igsn_lib
+       import igsn_lib.ratelimit
+
+       limiter = igsn_lib.ratelimit.RateLimiter(
+           default={"rate": 20, "concurrency": 4},
+           hosts={"app.geosamples.org": {"rate": 5, "max_concurrency": 8}},
+       )
+       for igsn, responses in igsn_lib.resolveMany(identifiers, limiter=limiter):
+           ...
+       print(limiter.stats())
+"""
+
+import email.utils
+import logging
+import threading
+import time
+import urllib.parse
+
+THROTTLE_STATUS_CODES = (429, 503)
+"""Response status codes indicating a host is overloaded
+"""
+
+DEFAULT_MAX_RETRY_AFTER = 300
+"""Longest Retry-After delay in seconds that is honoured
+"""
+
+
+def _getLogger():
+    return logging.getLogger("igsn_lib.ratelimit")
+
+
+def parseRetryAfter(value, now=None):
+    """
+    Seconds to wait from the value of a Retry-After header.
+
+    Args:
+        value: header value, either seconds or an HTTP date
+        now: (float) current time as seconds since the epoch, defaults to time.time()
+
+    Returns:
+        float seconds, or None if value can not be parsed
+
+    Examples:
+
+        .. jupyter-execute::
+
+           import igsn_lib.ratelimit
+
+           print(igsn_lib.ratelimit.parseRetryAfter("120"))
+           print(igsn_lib.ratelimit.parseRetryAfter(
+               "Wed, 21 Oct 2015 07:28:30 GMT", now=1445412480
+           ))
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        t = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if t is None:
+        return None
+    if now is None:
+        now = time.time()
+    return max(0.0, t.timestamp() - now)
+
+
+class HostLimiter(object):
+    """
+    Token bucket and AIMD concurrency limit for a single host.
+
+    Args:
+        rate: (float) requests per second, None for no rate limit
+        burst: (int) token bucket size, defaults to max(1, rate)
+        concurrency: (int) initial concurrent request limit
+        min_concurrency: (int) lower bound of the concurrency limit
+        max_concurrency: (int) upper bound of the concurrency limit
+        increase: (float) concurrency added per round of successful requests
+        decrease: (float) factor applied to concurrency on throttling
+        max_retry_after: (float) longest Retry-After honoured in seconds
+    """
+
+    def __init__(
+        self,
+        rate=None,
+        burst=None,
+        concurrency=4,
+        min_concurrency=1,
+        max_concurrency=32,
+        increase=1.0,
+        decrease=0.5,
+        max_retry_after=DEFAULT_MAX_RETRY_AFTER,
+    ):
+        self.rate = rate
+        if burst is None:
+            burst = max(1, rate) if rate is not None else 1
+        self.burst = burst
+        self.concurrency = float(concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.increase = increase
+        self.decrease = decrease
+        self.max_retry_after = max_retry_after
+        self.in_flight = 0
+        self.requests = 0
+        self.throttled = 0
+        self._tokens = float(burst)
+        self._tlast = time.monotonic()
+        self._blocked_until = 0.0
+        self._condition = threading.Condition()
+
+    def _delay(self, now):
+        """
+        Seconds until a request may start, 0 if it may start now.
+        """
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        if self.rate is None:
+            return 0.0
+        self._tokens = min(self.burst, self._tokens + (now - self._tlast) * self.rate)
+        self._tlast = now
+        if self._tokens >= 1.0:
+            return 0.0
+        return (1.0 - self._tokens) / self.rate
+
+    def acquire(self, timeout=None):
+        """
+        Wait until a request to the host may start.
+
+        Args:
+            timeout: (float) seconds to wait, None waits indefinitely
+
+        Returns:
+            bool, False if timeout was reached
+        """
+        tend = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                wait = None
+                if self.in_flight < max(1, int(self.concurrency)):
+                    wait = self._delay(now)
+                    if wait <= 0:
+                        if self.rate is not None:
+                            self._tokens -= 1.0
+                        self.in_flight += 1
+                        self.requests += 1
+                        return True
+                if tend is not None:
+                    if now >= tend:
+                        return False
+                    wait = tend - now if wait is None else min(wait, tend - now)
+                self._condition.wait(wait)
+
+    def release(self, status_code, retry_after=None):
+        """
+        Record the outcome of a request started with acquire.
+
+        Args:
+            status_code: (int) response status, 0 if there was no response
+            retry_after: (str) value of the Retry-After response header
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if status_code == 0 or status_code in THROTTLE_STATUS_CODES:
+                self.throttled += 1
+                self.concurrency = max(
+                    self.min_concurrency, self.concurrency * self.decrease
+                )
+                delay = parseRetryAfter(retry_after)
+                if delay is not None:
+                    delay = min(delay, self.max_retry_after)
+                    self._blocked_until = max(
+                        self._blocked_until, time.monotonic() + delay
+                    )
+            else:
+                # Additive increase of about `increase` per window of requests
+                self.concurrency = min(
+                    self.max_concurrency,
+                    self.concurrency + self.increase / max(1.0, self.concurrency),
+                )
+            self._condition.notify_all()
+
+    def stats(self):
+        """
+        Current state of the limiter.
+
+        Returns:
+            dict of ``{concurrency, in_flight, requests, throttled}``
+        """
+        with self._condition:
+            return {
+                "concurrency": self.concurrency,
+                "in_flight": self.in_flight,
+                "requests": self.requests,
+                "throttled": self.throttled,
+            }
+
+
+class RateLimiter(object):
+    """
+    HostLimiter per host, created on first use.
+
+    Args:
+        default: (dict) HostLimiter arguments for hosts not listed in ``hosts``
+        hosts: (dict) {host name: HostLimiter arguments}
+    """
+
+    def __init__(self, default=None, hosts=None):
+        self.default = default if default is not None else {}
+        self.hosts = hosts if hosts is not None else {}
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def forHost(self, host):
+        """
+        HostLimiter for host.
+
+        Args:
+            host: host name, lower case
+
+        Returns:
+            HostLimiter
+        """
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = HostLimiter(**self.hosts.get(host, self.default))
+                self._limiters[host] = limiter
+            return limiter
+
+    def acquire(self, url, timeout=None):
+        """
+        Wait until a request to url may start.
+
+        Args:
+            url: request URL
+            timeout: (float) seconds to wait, None waits indefinitely
+
+        Returns:
+            HostLimiter to release after the request, or None if timeout was reached
+        """
+        limiter = self.forHost(urllib.parse.urlsplit(url).hostname or "")
+        if limiter.acquire(timeout=timeout):
+            return limiter
+        return None
+
+    def release(self, limiter, response):
+        """
+        Record the outcome of a request started with acquire.
+
+        Args:
+            limiter: HostLimiter returned by acquire
+            response: requests.Response or FakeResponse, None if no response
+        """
+        if response is None:
+            limiter.release(0)
+            return
+        limiter.release(
+            response.status_code, retry_after=response.headers.get("Retry-After")
+        )
+
+    def stats(self):
+        """
+        State of all host limiters.
+
+        Returns:
+            dict of {host: HostLimiter.stats()}
+        """
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {host: limiter.stats() for host, limiter in limiters.items()}
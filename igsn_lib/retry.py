@@ -0,0 +1,242 @@
+"""
+Retries and circuit breaking for resolution requests.
+
+:class:`RetryPolicy` retries a request that raised an exception or returned a
+transient error status, waiting with jittered exponential backoff between
+attempts. Resolution only makes HEAD and GET requests, which are idempotent
+and so safe to repeat.
+
+:class:`CircuitBreaker` tracks failures per host. After ``threshold``
+consecutive failures the circuit for the host opens and requests to it fail
+immediately, without waiting for a timeout, until ``cooldown`` seconds have
+passed. A single probe request is then let through; success closes the
+circuit and failure opens it for another cooldown.
+
+Both are passed to :func:`igsn_lib.resolve` (or resolveN2T, resolveMany) as
+``retry`` and ``breaker``.
+
+Example:
+
+    .. code-block:: python
+
+       import igsn_lib
+       import igsn_lib.retry
+
+       retry = igsn_lib.retry.RetryPolicy(retries=3, backoff=0.5)
+       breaker = igsn_lib.retry.CircuitBreaker(threshold=5, cooldown=60)
+       for igsn, responses in igsn_lib.resolveMany(
+           identifiers, retry=retry, breaker=breaker
+       ):
+           ...
+"""
+
+import logging
+import random
+import threading
+import time
+import urllib.parse
+import igsn_lib.ratelimit
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+"""Response status codes that are retried
+"""
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half-open"
+
+
+def _getLogger():
+    return logging.getLogger("igsn_lib.retry")
+
+
+def _host(url):
+    return urllib.parse.urlsplit(url).hostname or ""
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised for a request to a host with an open circuit.
+    """
+
+    transient = True
+    """Failure is expected to clear, so the result should not be cached
+    """
+
+
+class RetryPolicy(object):
+    """
+    Retry failed requests with jittered exponential backoff.
+
+    The wait before retry ``n`` (starting at 0) is a random time between 0 and
+    ``min(max_backoff, backoff * 2**n)`` seconds ("full jitter"), or the
+    ``Retry-After`` of the response if that is present and shorter than
+    ``max_backoff``.
+
+    Args:
+        retries: (int) maximum number of retries after the first attempt
+        backoff: (float) base delay in seconds
+        max_backoff: (float) longest delay in seconds
+        status_codes: response status codes to retry
+    """
+
+    def __init__(
+        self,
+        retries=3,
+        backoff=0.5,
+        max_backoff=30.0,
+        status_codes=RETRY_STATUS_CODES,
+    ):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.status_codes = status_codes
+        self._random = random.Random()
+
+    def shouldRetry(self, attempt, response=None):
+        """
+        Check if a request should be made again.
+
+        Args:
+            attempt: (int) number of the attempt that just completed, starting at 0
+            response: response of the attempt, None if it raised an exception
+
+        Returns:
+            bool
+        """
+        if attempt >= self.retries:
+            return False
+        if response is None:
+            return True
+        return response.status_code in self.status_codes
+
+    def delay(self, attempt, response=None):
+        """
+        Seconds to wait before the next attempt.
+
+        Args:
+            attempt: (int) number of the attempt that just completed, starting at 0
+            response: response of the attempt, None if it raised an exception
+
+        Returns:
+            float
+        """
+        if response is not None:
+            retry_after = igsn_lib.ratelimit.parseRetryAfter(
+                response.headers.get("Retry-After")
+            )
+            if retry_after is not None and retry_after <= self.max_backoff:
+                return retry_after
+        return self._random.uniform(
+            0, min(self.max_backoff, self.backoff * (2 ** attempt))
+        )
+
+    def sleep(self, attempt, response=None):
+        """
+        Wait before the next attempt.
+
+        Args:
+            attempt: (int) number of the attempt that just completed, starting at 0
+            response: response of the attempt, None if it raised an exception
+        """
+        time.sleep(self.delay(attempt, response=response))
+
+
+class _HostCircuit(object):
+    def __init__(self):
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.topened = 0.0
+        self.probing = False
+
+
+class CircuitBreaker(object):
+    """
+    Per-host circuit breaker.
+
+    A request fails if it raises an exception or returns a 5xx status.
+
+    Args:
+        threshold: (int) consecutive failures that open the circuit
+        cooldown: (float) seconds before an open circuit is probed
+    """
+
+    def __init__(self, threshold=5, cooldown=30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.rejected = 0
+        self._circuits = {}
+        self._lock = threading.Lock()
+
+    def _circuit(self, host):
+        circuit = self._circuits.get(host)
+        if circuit is None:
+            circuit = _HostCircuit()
+            self._circuits[host] = circuit
+        return circuit
+
+    def check(self, url):
+        """
+        Check that a request to url may be made.
+
+        Args:
+            url: request URL
+
+        Raises:
+            CircuitOpenError if the circuit for the host is open
+        """
+        host = _host(url)
+        with self._lock:
+            circuit = self._circuit(host)
+            if circuit.state == STATE_CLOSED:
+                return
+            if (
+                circuit.state == STATE_OPEN
+                and time.monotonic() - circuit.topened >= self.cooldown
+            ):
+                circuit.state = STATE_HALF_OPEN
+            if circuit.state == STATE_HALF_OPEN and not circuit.probing:
+                circuit.probing = True
+                _getLogger().info("Probing %s", host)
+                return
+            self.rejected += 1
+        raise CircuitOpenError(f"Circuit open for {host}")
+
+    def record(self, url, response):
+        """
+        Record the outcome of a request.
+
+        Args:
+            url: request URL
+            response: response, None if the request raised an exception
+        """
+        host = _host(url)
+        failed = response is None or response.status_code >= 500
+        with self._lock:
+            circuit = self._circuit(host)
+            circuit.probing = False
+            if not failed:
+                if circuit.state != STATE_CLOSED:
+                    _getLogger().info("Circuit closed for %s", host)
+                circuit.state = STATE_CLOSED
+                circuit.failures = 0
+                return
+            circuit.failures += 1
+            if circuit.state == STATE_HALF_OPEN or circuit.failures >= self.threshold:
+                if circuit.state != STATE_OPEN:
+                    _getLogger().warning("Circuit open for %s", host)
+                circuit.state = STATE_OPEN
+                circuit.topened = time.monotonic()
+
+    def state(self, host):
+        """
+        State of the circuit for host.
+
+        Args:
+            host: host name
+
+        Returns:
+            one of STATE_CLOSED, STATE_OPEN, STATE_HALF_OPEN
+        """
+        with self._lock:
+            return self._circuit(host).state
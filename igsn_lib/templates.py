@@ -0,0 +1,192 @@
+"""
+Learned redirect templates for skipping resolver hops.
+
+Resolving an IGSN usually goes igsn.org -> hdl.handle.net -> provider URL, and
+the provider URL depends only on the IGSN prefix. :class:`RedirectTemplates`
+records the final URL of successful resolutions as a per-prefix template, for
+example ``https://app.geosamples.org/sample/igsn/{igsn}`` for prefix ``IE``.
+
+When passed to :func:`igsn_lib.resolve` with ``predict=True``, the predicted
+final URL is requested directly. If that does not give a 2xx response the full
+resolver chain is followed and the template is updated from the result.
+
+The prefix is only the leading letters of an identifier, so different
+namespaces may share one, and a provider may answer a wrong URL with a 2xx
+"not found" page. Prefixes that have been observed with more than one
+template are therefore never predicted.
+"""
+
+import json
+import logging
+import threading
+import urllib.parse
+import igsn_lib
+
+TEMPLATE_MARKER = "{igsn}"
+"""Placeholder for the identifier in a template
+"""
+
+DEFAULT_MIN_OBSERVATIONS = 2
+"""Number of consistent observations needed before a template is used
+"""
+
+
+def _getLogger():
+    return logging.getLogger("igsn_lib.templates")
+
+
+class RedirectTemplates(object):
+    """
+    Per-prefix templates of the final URL of a resolution.
+
+    A template is only used for prediction after it has been observed for
+    ``min_observations`` identifiers, and only if no other template has been
+    observed for the prefix. Instances may be shared between threads.
+
+    Args:
+        min_observations: (int) observations needed before predicting
+
+    Examples:
+
+        .. jupyter-execute::
+
+           import igsn_lib
+           import igsn_lib.templates
+
+           templates = igsn_lib.templates.RedirectTemplates()
+           for igsn in ["IEEJR000M", "IEEJR000N", "IEEJR000O"]:
+               responses = igsn_lib.resolve(igsn, templates=templates, predict=True)
+               print(len(responses), responses[-1].url)
+           print(templates.asDict())
+    """
+
+    def __init__(self, min_observations=DEFAULT_MIN_OBSERVATIONS):
+        self.min_observations = min_observations
+        # {prefix: [template, count, conflicts]}
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def learn(self, identifier, responses):
+        """
+        Update the template for the prefix of identifier from a resolution.
+
+        Only resolutions ending with a 2xx response whose URL contains the
+        identifier are used. A template different from the one recorded for
+        the prefix replaces it and counts as a conflict.
+
+        Args:
+            identifier: pre-normalized IGSN string
+            responses: list of responses from resolve
+
+        Returns:
+            template string or None if nothing was learnt
+        """
+        prefix = igsn_lib.igsnPrefix(identifier)
+        if prefix is None or len(responses) == 0:
+            return None
+        final = responses[-1]
+        if not (200 <= final.status_code < 300):
+            return None
+        quoted = urllib.parse.quote(identifier)
+        if final.url.count(quoted) != 1 or TEMPLATE_MARKER in final.url:
+            return None
+        template = final.url.replace(quoted, TEMPLATE_MARKER)
+        with self._lock:
+            entry = self._templates.get(prefix)
+            if entry is None:
+                self._templates[prefix] = [template, 1, 0]
+            elif entry[0] == template:
+                entry[1] += 1
+            else:
+                _getLogger().info(
+                    "Template for %s changed from %s to %s", prefix, entry[0], template
+                )
+                self._templates[prefix] = [template, 1, entry[2] + 1]
+        return template
+
+    def predict(self, identifier):
+        """
+        Predicted final URL for identifier.
+
+        Args:
+            identifier: pre-normalized IGSN string
+
+        Returns:
+            URL string or None if there is no established, unambiguous template
+            for the prefix
+        """
+        prefix = igsn_lib.igsnPrefix(identifier)
+        if prefix is None:
+            return None
+        with self._lock:
+            entry = self._templates.get(prefix)
+            if entry is None or entry[1] < self.min_observations or entry[2] > 0:
+                return None
+            template = entry[0]
+        return template.replace(TEMPLATE_MARKER, urllib.parse.quote(identifier))
+
+    def asDict(self):
+        """
+        Templates as a JSON serializable dict.
+
+        Returns:
+            dict of ``{prefix: {"template":, "count":, "conflicts":}}``
+        """
+        with self._lock:
+            return {
+                prefix: {
+                    "template": entry[0],
+                    "count": entry[1],
+                    "conflicts": entry[2],
+                }
+                for prefix, entry in self._templates.items()
+            }
+
+    @classmethod
+    def fromDict(cls, d, min_observations=DEFAULT_MIN_OBSERVATIONS):
+        """
+        RedirectTemplates from the output of asDict.
+
+        Args:
+            d: dict from asDict
+            min_observations: (int) observations needed before predicting
+
+        Returns:
+            RedirectTemplates
+        """
+        res = cls(min_observations=min_observations)
+        for prefix, entry in d.items():
+            res._templates[prefix] = [
+                entry["template"],
+                entry["count"],
+                entry.get("conflicts", 0),
+            ]
+        return res
+
+    def save(self, path):
+        """
+        Write templates to a JSON file.
+
+        Args:
+            path: file name
+        """
+        with open(path, "w") as dest:
+            json.dump(self.asDict(), dest, indent=2)
+
+    @classmethod
+    def load(cls, path, min_observations=DEFAULT_MIN_OBSERVATIONS):
+        """
+        RedirectTemplates from a JSON file written by save.
+
+        Args:
+            path: file name
+            min_observations: (int) observations needed before predicting
+
+        Returns:
+            RedirectTemplates
+        """
+        with open(path, "r") as src:
+            return cls.fromDict(json.load(src), min_observations=min_observations)
+
+    def __len__(self):
+        return len(self._templates)
@@ -1,11 +1,14 @@
 """
 Time handling routines for igsn_lib.
+
+astropy, numpy and dateparser are only imported when first needed, so
+that the common datetime and Julian date conversions stay cheap to import.
 """
 import logging
+import re
+import math
 import datetime
-import dateparser
-import astropy.time
-import astropy.utils.exceptions
+import functools
 
 JSON_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
 """datetime format string for generating JSON content
@@ -19,6 +22,30 @@ _BCE_JD0 = 1721060
 """Julian date 0 for BCE 1, year '0000'
 """
 
+_JD_ORDINAL_OFFSET = 1721424.5
+"""Julian date of midnight UTC preceding python date ordinal 0
+"""
+
+_MAX_ORDINAL = datetime.date.max.toordinal()
+
+_JD_J2000 = 2451545.0
+"""Julian date of the J2000.0 epoch
+"""
+
+_JD_UNIX_EPOCH = 2440587.5
+"""Julian date of 1970-01-01T00:00:00 UTC
+"""
+
+_DAYS_PER_JYEAR = 365.25
+
+DATETIME_CACHE_SIZE = 4096
+"""Number of parsed timestamps memoized by datetimeFromString
+"""
+
+_ISO_UTC_PATTERN = re.compile(
+    r"^(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,6}))?(Z|[+-]00:?00)?$"
+)
+
 
 def _getLogger():
     return logging.getLogger("igsn_lib.time")
@@ -28,6 +55,64 @@ def datetimeToJsonStr(dt):
         return None
     return dt.strftime(JSON_TIME_FORMAT)
 
+@functools.lru_cache(maxsize=DATETIME_CACHE_SIZE)
+def _datetimeFromIsoUTC(tstr):
+    match = _ISO_UTC_PATTERN.match(tstr)
+    if match is None:
+        return None
+    year, month, day, hour, minute, second, fraction, tz = match.groups()
+    microsecond = 0
+    if fraction is not None:
+        microsecond = int(fraction.ljust(6, "0"))
+    try:
+        return datetime.datetime(
+            int(year),
+            int(month),
+            int(day),
+            int(hour),
+            int(minute),
+            int(second),
+            microsecond,
+            tzinfo=datetime.timezone.utc,
+        )
+    except ValueError:
+        return None
+
+
+def datetimeFromString(tstr):
+    """
+    Parse a string representation of time to a timezone aware UTC datetime.
+
+    Strict ISO-8601 UTC timestamps such as ``2019-10-15T06:00:10Z``, which is
+    what OAI-PMH providers almost always report, are parsed directly and the
+    results memoized. Anything else is passed to dateparser, with UTC assumed
+    if no timezone is given.
+
+    Args:
+        tstr: string, time in text.
+
+    Returns:
+        datetime.datetime or None if the string could not be parsed
+
+    Example:
+
+        .. jupyter-execute::
+
+           import igsn_lib.time
+
+           print(igsn_lib.time.datetimeFromString("2019-10-15T06:00:10Z"))
+           print(igsn_lib.time.datetimeFromString("15 October 2019 06:00"))
+    """
+    dt = _datetimeFromIsoUTC(tstr.strip())
+    if dt is not None:
+        return dt
+    import dateparser
+
+    return dateparser.parse(
+        tstr, settings={"TIMEZONE": "+0000", "RETURN_AS_TIMEZONE_AWARE": True}
+    )
+
+
 def datetimeFromSomething(V):
     if V is None:
         return None
@@ -36,9 +121,7 @@ def datetimeFromSomething(V):
     if isinstance(V, float):
         return jdToDateTime(V)
     if isinstance(V, str):
-        return dateparser.parse(
-            V, settings={"TIMEZONE": "+0000", "RETURN_AS_TIMEZONE_AWARE": True}
-        )
+        return datetimeFromString(V)
     return None
 
 def datetimeDeltaToSeconds(dtd):
@@ -51,7 +134,9 @@ def datetimeToJD(dt):
     """
     Convert a python datetime to Julian date.
 
-    Naive datetime is assumed to be UTC.
+    Naive datetime is assumed to be UTC. The conversion is done arithmetically
+    on the proleptic Gregorian calendar, so leap seconds are ignored. Results
+    match astropy to within a second on days with a leap second.
 
     Args:
         dt: datetime.datetime
@@ -73,7 +158,10 @@ def datetimeToJD(dt):
     # force UTC if no timezone information is provided with dt
     if dt.tzinfo is None:
         dt = dt.replace(tzinfo=datetime.timezone.utc)
-    return astropy.time.Time(dt).jd
+    else:
+        dt = dt.astimezone(datetime.timezone.utc)
+    seconds = dt.hour * 3600 + dt.minute * 60 + dt.second + dt.microsecond / 1.0e6
+    return dt.toordinal() + _JD_ORDINAL_OFFSET + seconds / 86400.0
 
 
 def dtnow():
@@ -114,7 +202,8 @@ def jdFromString(tstr):
     """
     Julian date from string representation of time.
 
-    Uses dateparser.parse to get date time from the string.
+    Uses datetimeFromString to get date time from the string, which falls back
+    to dateparser.parse for anything other than ISO-8601 UTC timestamps.
 
     See https://dateparser.readthedocs.io/en/latest/
 
@@ -134,7 +223,7 @@ def jdFromString(tstr):
            print(igsn_lib.time.jdFromString("100 years ago"))
            print(igsn_lib.time.jdFromString("2020-08-15 16:30:00 ET"))
     """
-    dt = dateparser.parse(tstr, settings={"TIMEZONE": "+0000"})
+    dt = datetimeFromString(tstr)
     return datetimeToJD(dt)
 
 
@@ -143,8 +232,7 @@ def jdToDateTime(jd):
     Convert Julian date to datetime.
 
     Note that Julian date values can exceed the range supported by
-    python datetime, in which case astropy or datetime will raise
-    an exception, and this method will return None.
+    python datetime, in which case this method will return None.
 
     Args:
         jd: float, Julian date/
@@ -159,10 +247,17 @@ def jdToDateTime(jd):
            import igsn_lib.time
            print(igsn_lib.time.jdToDateTime(2459125.5))
     """
-    atime = astropy.time.Time(jd, format="jd")
     try:
-        return atime.to_datetime(datetime.timezone.utc)
-    except ValueError as e:
+        days = jd - _JD_ORDINAL_OFFSET
+        ordinal = math.floor(days)
+        if ordinal < 1 or ordinal > _MAX_ORDINAL:
+            raise ValueError(f"Julian date {jd} is outside the range of datetime")
+        microseconds = round((days - ordinal) * 86400.0e6)
+        dt = datetime.datetime.fromordinal(ordinal).replace(
+            tzinfo=datetime.timezone.utc
+        )
+        return dt + datetime.timedelta(microseconds=microseconds)
+    except (ValueError, OverflowError) as e:
         _L = _getLogger()
         _L.error(e)
     return None
@@ -253,6 +348,8 @@ def jdToMa(jd):
            import igsn_lib.time
            print(igsn_lib.time.jdToMa(-363521138))
     """
+    import astropy.time
+
     atime = astropy.time.Time(jd, format="jd").jyear
     return -atime / 1.0e6
 
@@ -276,6 +373,8 @@ def maToJd(Ma):
            import igsn_lib.time
            print(igsn_lib.time.maToJd(-1.0))
     """
+    import astropy.time
+
     atime = astropy.time.Time(-Ma * 1.0e6, format="jyear").jd
     return atime
 
@@ -299,6 +398,8 @@ def jdToBCE(jd):
            import igsn_lib.time
            print(igsn_lib.time.jdToBCE(0.0))
     """
+    import astropy.time
+
     atime = astropy.time.Time(jd, format="jd").jyear
     # 0000 = -1 BCE
     if atime <= 0:
@@ -325,8 +426,162 @@ def bceToJd(bce):
            import igsn_lib.time
            print(igsn_lib.time.bceToJd(-1))
     """
+    import astropy.time
+
     # 0000 = 1 BCE
     bce = -bce
     if bce < 0:
         bce = bce + 1
     return astropy.time.Time(bce, format="jyear").jd
+
+
+def _maskedFloatArray(values):
+    """
+    Float masked array from values, with missing and non-finite entries masked.
+    """
+    import numpy
+
+    return numpy.ma.masked_invalid(numpy.ma.asarray(values, dtype=float))
+
+
+def _jdToJyearArray(jd):
+    return 2000.0 + (_maskedFloatArray(jd) - _JD_J2000) / _DAYS_PER_JYEAR
+
+
+def _jyearToJdArray(jyear):
+    return _JD_J2000 + (jyear - 2000.0) * _DAYS_PER_JYEAR
+
+
+def jdToMaArray(jd):
+    """
+    Convert an array of Julian dates to Ma (millions of years ago).
+
+    Array version of :func:`jdToMa`. Missing (None or NaN) and non-finite
+    values are masked in the result.
+
+    Args:
+        jd: array like of float, Julian dates
+
+    Returns:
+        numpy.ma.MaskedArray of float, Ma
+
+    Example:
+
+        .. jupyter-execute::
+
+           import igsn_lib.time
+           print(igsn_lib.time.jdToMaArray([-363521138, 2433282.5, None]))
+    """
+    return -_jdToJyearArray(jd) / 1.0e6
+
+
+def maToJdArray(Ma):
+    """
+    Convert an array of Ma (millions of years ago) to Julian dates.
+
+    Array version of :func:`maToJd`. Missing (None or NaN) and non-finite
+    values are masked in the result.
+
+    Args:
+        Ma: array like of float, millions of years ago
+
+    Returns:
+        numpy.ma.MaskedArray of float, Julian dates
+    """
+    return _jyearToJdArray(-_maskedFloatArray(Ma) * 1.0e6)
+
+
+def jdToBCEArray(jd):
+    """
+    Convert an array of Julian dates to BCE, where 1 BCE = year 0000.
+
+    Array version of :func:`jdToBCE`. Missing (None or NaN) and non-finite
+    values are masked in the result.
+
+    Args:
+        jd: array like of float, Julian dates
+
+    Returns:
+        numpy.ma.MaskedArray of float, BCE years
+    """
+    import numpy
+
+    jyear = _jdToJyearArray(jd)
+    # 0000 = -1 BCE
+    return -numpy.ma.where(jyear <= 0, jyear - 1, jyear)
+
+
+def bceToJdArray(bce):
+    """
+    Convert an array of BCE years to Julian dates, where 1 BCE = year 0000.
+
+    Array version of :func:`bceToJd`. Missing (None or NaN) and non-finite
+    values are masked in the result.
+
+    Args:
+        bce: array like of float, years BCE
+
+    Returns:
+        numpy.ma.MaskedArray of float, Julian dates
+    """
+    import numpy
+
+    # 0000 = 1 BCE
+    jyear = -_maskedFloatArray(bce)
+    return _jyearToJdArray(numpy.ma.where(jyear < 0, jyear + 1, jyear))
+
+
+def jdToDateTimeArray(jd):
+    """
+    Convert an array of Julian dates to numpy datetime64 UTC values.
+
+    Array version of :func:`jdToDateTime`. Values that are missing or outside
+    the range of python datetime are masked in the result.
+
+    Args:
+        jd: array like of float, Julian dates
+
+    Returns:
+        numpy.ma.MaskedArray of datetime64[us], UTC
+    """
+    import numpy
+
+    jd = _maskedFloatArray(jd)
+    days = jd - _JD_ORDINAL_OFFSET
+    jd = numpy.ma.masked_where((days < 1) | (days >= _MAX_ORDINAL + 1), jd)
+    microseconds = numpy.ma.round((jd - _JD_UNIX_EPOCH) * 86400.0e6)
+    result = numpy.ma.masked_array(
+        microseconds.filled(0).astype("int64").astype("datetime64[us]"),
+        mask=numpy.ma.getmaskarray(microseconds),
+    )
+    return result
+
+
+def datetimeToJDArray(dts):
+    """
+    Convert an array of datetimes to Julian dates.
+
+    Array version of :func:`datetimeToJD`. Accepts numpy datetime64 values,
+    taken to be UTC, or python datetimes, where naive values are assumed to be
+    UTC. Missing values (None, NaT or masked) are masked in the result.
+
+    Args:
+        dts: array like of datetime64 or datetime.datetime
+
+    Returns:
+        numpy.ma.MaskedArray of float, Julian dates
+    """
+    import numpy
+
+    mask = numpy.ma.getmask(dts)
+    if not isinstance(dts, numpy.ndarray):
+        dts = [
+            dt.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+            if isinstance(dt, datetime.datetime) and dt.tzinfo is not None
+            else dt
+            for dt in dts
+        ]
+    dts = numpy.asarray(numpy.ma.getdata(dts), dtype="datetime64[us]")
+    microseconds = dts.astype("int64").astype(float)
+    jd = _JD_UNIX_EPOCH + microseconds / 86400.0e6
+    return numpy.ma.masked_array(jd, mask=numpy.isnat(dts) | mask)
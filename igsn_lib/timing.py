@@ -0,0 +1,195 @@
+"""
+Latency statistics for resolution.
+
+A :class:`LatencyCollector` is passed to :func:`igsn_lib.resolve` (or
+resolveN2T, resolveMany) as ``collector``. It records the timing of every
+request made while resolving, grouped by host, so slow steps of the chain,
+e.g. igsn.org, hdl.handle.net or a provider, can be identified.
+
+Times are held in log-spaced histograms, so memory use does not grow with the
+number of requests. Percentiles are accurate to within the bucket ratio,
+about 10%.
+
+Example:
+
+    .. code-block:: python
+
+       import igsn_lib
+       import igsn_lib.timing
+
+       collector = igsn_lib.timing.LatencyCollector()
+       for igsn, responses in igsn_lib.resolveMany(identifiers, collector=collector):
+           pass
+       for host, stats in collector.summary().items():
+           print(host, stats["count"], stats["p50"], stats["p95"], stats["p99"])
+"""
+
+import bisect
+import threading
+import urllib.parse
+
+HISTOGRAM_MIN = 0.001
+"""Upper bound in seconds of the first histogram bucket
+"""
+
+HISTOGRAM_MAX = 600.0
+"""Times longer than this are counted in the last histogram bucket
+"""
+
+HISTOGRAM_RATIO = 1.1
+"""Ratio of the bounds of adjacent histogram buckets
+"""
+
+PERCENTILES = (50, 95, 99)
+"""Percentiles reported by LatencyCollector.summary
+"""
+
+
+def _bucketBounds():
+    bounds = []
+    b = HISTOGRAM_MIN
+    while b < HISTOGRAM_MAX:
+        bounds.append(b)
+        b *= HISTOGRAM_RATIO
+    bounds.append(HISTOGRAM_MAX)
+    return bounds
+
+
+_BOUNDS = _bucketBounds()
+
+
+def hopTimes(response):
+    """
+    Timing of a response from the resolver.
+
+    Args:
+        response: requests.Response, FakeResponse or igsn_lib.Hop
+
+    Returns:
+        (elapsed, ttfb) in seconds. elapsed includes reading the body. Either
+        may be None if not available.
+    """
+    elapsed = getattr(response, "duration", None)
+    if elapsed is None:
+        elapsed = getattr(response, "elapsed", None)
+        if elapsed is not None and not isinstance(elapsed, (int, float)):
+            elapsed = elapsed.total_seconds()
+    ttfb = getattr(response, "ttfb", None)
+    if ttfb is not None and not isinstance(ttfb, (int, float)):
+        ttfb = ttfb.total_seconds()
+    return elapsed, ttfb
+
+
+class LatencyHistogram(object):
+    """
+    Histogram of times in log-spaced buckets.
+    """
+
+    def __init__(self):
+        self.counts = [0] * len(_BOUNDS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        """
+        Add a time in seconds.
+        """
+        i = min(bisect.bisect_left(_BOUNDS, seconds), len(_BOUNDS) - 1)
+        self.counts[i] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p):
+        """
+        Approximate p-th percentile in seconds, the upper bound of its bucket.
+
+        Args:
+            p: percentile, 0 - 100
+
+        Returns:
+            float or None if empty
+        """
+        if self.count == 0:
+            return None
+        rank = p / 100.0 * self.count
+        n = 0
+        for i, c in enumerate(self.counts):
+            n += c
+            if n >= rank and c > 0:
+                return min(_BOUNDS[i], self.max)
+        return self.max
+
+    def mean(self):
+        if self.count == 0:
+            return None
+        return self.total / self.count
+
+
+class LatencyCollector(object):
+    """
+    Per-host latency histograms of resolution requests.
+
+    Safe to share between threads.
+    """
+
+    def __init__(self):
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host(self, host):
+        entry = self._hosts.get(host)
+        if entry is None:
+            entry = {
+                "elapsed": LatencyHistogram(),
+                "ttfb": LatencyHistogram(),
+                "errors": 0,
+            }
+            self._hosts[host] = entry
+        return entry
+
+    def record(self, url, response):
+        """
+        Record the timing of a request.
+
+        Args:
+            url: request URL
+            response: response, or None if the request failed
+        """
+        host = urllib.parse.urlsplit(url).hostname or ""
+        with self._lock:
+            entry = self._host(host)
+            if response is None:
+                entry["errors"] += 1
+                return
+            elapsed, ttfb = hopTimes(response)
+            if elapsed is not None:
+                entry["elapsed"].add(elapsed)
+            if ttfb is not None:
+                entry["ttfb"].add(ttfb)
+
+    def summary(self):
+        """
+        Latency statistics per host.
+
+        Returns:
+            dict of {host: {count, errors, mean, max, p50, p95, p99, ttfb:
+            {p50, p95, p99}}}, times in seconds
+        """
+        res = {}
+        with self._lock:
+            for host, entry in self._hosts.items():
+                elapsed = entry["elapsed"]
+                stats = {
+                    "count": elapsed.count,
+                    "errors": entry["errors"],
+                    "mean": elapsed.mean(),
+                    "max": elapsed.max if elapsed.count > 0 else None,
+                    "ttfb": {},
+                }
+                for p in PERCENTILES:
+                    stats[f"p{p}"] = elapsed.percentile(p)
+                    stats["ttfb"][f"p{p}"] = entry["ttfb"].percentile(p)
+                res[host] = stats
+        return res
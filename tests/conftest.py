@@ -0,0 +1,116 @@
+import http.server
+import json
+import threading
+import pytest
+import igsn_lib
+
+'''
+Local stand-in for the IGSN resolver chain.
+
+  /igsn/<id>    -> 302 /hdl/<id>
+  /hdl/<id>     -> 302 /landing/<id>, or 404 if id contains "FAKE",
+                   or 429 with Retry-After: 1 if id contains "BUSY",
+                   or 503 on the first request if id contains "FLAKY"
+  /landing/<id> -> 200 application/json, or 100kB of text/html if id contains "HTML",
+                   with an ETag and Last-Modified, 304 if If-None-Match matches,
+                   or text/html with a Link to /meta/<id> if id contains "LINKED"
+  /meta/<id>    -> 200 application/ld+json
+'''
+
+
+class ResolverHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, headers=None, body=b""):
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _handle(self):
+        with self.server.lock:
+            self.server.requests.append((self.command, self.path, dict(self.headers)))
+        parts = self.path.strip("/").split("/", 1)
+        route = parts[0]
+        ident = parts[1] if len(parts) > 1 else ""
+        if route == "igsn":
+            return self._send(302, {"Location": f"{self.server.url}/hdl/{ident}"})
+        if route == "hdl":
+            if "FAKE" in ident.upper():
+                return self._send(404, {"Content-Type": "text/plain"}, b"Not found")
+            if "BUSY" in ident.upper():
+                return self._send(429, {"Retry-After": "1"})
+            if "FLAKY" in ident.upper():
+                with self.server.lock:
+                    first = ident not in self.server.seen
+                    self.server.seen.add(ident)
+                if first:
+                    return self._send(503)
+            return self._send(302, {"Location": f"{self.server.url}/landing/{ident}"})
+        if route == "landing" and "LINKED" in ident.upper():
+            link = (
+                f'</meta/{ident}>; rel="describedby"; type="application/ld+json", '
+                f'<{self.server.url}/alt/{ident}>; rel="alternate"; type="text/xml"'
+            )
+            body = b"<html></html>"
+            return self._send(200, {"Content-Type": "text/html", "Link": link}, body)
+        if route == "meta":
+            body = json.dumps({"@id": ident}).encode("utf-8")
+            return self._send(200, {"Content-Type": "application/ld+json"}, body)
+        if route == "landing":
+            if "HTML" in ident.upper():
+                body = b"<html>" + b" " * 100000 + b"</html>"
+                return self._send(200, {"Content-Type": "text/html"}, body)
+            validators = {
+                "ETag": f'"v1-{ident}"',
+                "Last-Modified": "Wed, 21 Oct 2015 07:28:00 GMT",
+            }
+            if self.headers.get("If-None-Match") == validators["ETag"]:
+                return self._send(304, validators)
+            body = json.dumps({"id": ident}).encode("utf-8")
+            validators["Content-Type"] = "application/json"
+            return self._send(200, validators, body)
+        return self._send(404)
+
+    def do_GET(self):
+        self._handle()
+
+    def do_HEAD(self):
+        self._handle()
+
+
+class ResolverServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), ResolverHandler)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.connections = 0
+        self.seen = set()
+        self.url = f"http://127.0.0.1:{self.server_address[1]}"
+
+
+@pytest.fixture
+def resolver_server(monkeypatch):
+    """
+    Local resolver chain, with igsn_lib.resolve pointed at it.
+    """
+    server = ResolverServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(igsn_lib, "IGSN_RESOLVER_URL", f"{server.url}/igsn/")
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,57 @@
+import asyncio
+import pytest
+import igsn_lib
+
+pytest.importorskip("aiohttp")
+import igsn_lib.aio
+
+'''
+asyncio resolver tests against the local stand-in server in conftest.py
+'''
+
+
+@pytest.mark.parametrize("include_body", [False, True])
+def test_resolve(resolver_server, include_body):
+    res = asyncio.run(igsn_lib.aio.resolve("ABC123", include_body=include_body))
+    expected = igsn_lib.resolve("ABC123", include_body=include_body)
+    assert [r.status_code for r in res] == [r.status_code for r in expected]
+    assert [r.url for r in res] == [r.url for r in expected]
+    if include_body:
+        assert res[-1].json() == {"id": "ABC123"}
+    else:
+        assert res[-1].text == ""
+
+
+def test_resolve_errors(resolver_server, monkeypatch):
+    res = asyncio.run(igsn_lib.aio.resolve("AU1234IAMFAKE"))
+    assert [r.status_code for r in res] == [302, 404]
+    # Transport errors are reported as status 0
+    monkeypatch.setattr(igsn_lib, "IGSN_RESOLVER_URL", "http://127.0.0.1:1/igsn/")
+    res = asyncio.run(igsn_lib.aio.resolve("ABC123"))
+    assert len(res) == 1
+    assert res[0].status_code == 0
+    assert res[0].url == "http://127.0.0.1:1/igsn/ABC123"
+
+
+def test_resolveN2T_accept(resolver_server, monkeypatch):
+    monkeypatch.setattr(igsn_lib, "N2T_RESOLVER_URL", f"{resolver_server.url}/igsn/")
+    res = asyncio.run(igsn_lib.aio.resolveN2T("ABC123"))
+    assert res[-1].status_code == 200
+    accept = [r[2]["Accept"] for r in resolver_server.requests]
+    assert accept[0] == "*/*"
+    assert accept[1] == igsn_lib.DEFAULT_RESOLVE_HEADERS["Accept"]
+
+
+def test_resolveMany(resolver_server):
+    async def _run():
+        results = {}
+        async for identifier, res in igsn_lib.aio.resolveMany(
+            (f"ABC{i}" if i % 4 else f"FAKE{i}" for i in range(40)), concurrency=5
+        ):
+            results[identifier] = res[-1].status_code
+        return results
+
+    results = asyncio.run(_run())
+    assert len(results) == 40
+    assert results["ABC1"] == 200
+    assert results["FAKE0"] == 404
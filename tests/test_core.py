@@ -73,7 +73,20 @@ link_header_values = [
                 'rel': 'preconnect',
             },
         ]
-    )
+    ),
+    (
+        '<meta.json>; REL=describedby; type="application/ld+json", <b>, junk; rel="x"',
+        [
+            {
+                'href': 'meta.json',
+                'rel': 'describedby',
+                'type': 'application/ld+json',
+            },
+            {
+                'href': 'b',
+            },
+        ]
+    ),
 ]
 
 
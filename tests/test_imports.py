@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+import pytest
+
+'''
+Guard against heavy dependencies being imported eagerly.
+
+Each module is imported in a fresh interpreter with ``python -X importtime``
+and the reported imports are checked.
+'''
+
+HEAVY_MODULES = (
+    "astropy",
+    "dateparser",
+    "lxml",
+    "numpy",
+    "requests",
+    "sickle",
+    "xmltodict",
+)
+
+import_values = [
+    ("igsn_lib", HEAVY_MODULES + ("sqlalchemy",)),
+    ("igsn_lib.time", HEAVY_MODULES + ("sqlalchemy",)),
+    ("igsn_lib.oai", HEAVY_MODULES + ("sqlalchemy",)),
+    ("igsn_lib.aio", HEAVY_MODULES + ("aiohttp", "sqlalchemy")),
+    ("igsn_lib.cache", HEAVY_MODULES + ("sqlalchemy",)),
+    ("igsn_lib.templates", HEAVY_MODULES + ("sqlalchemy",)),
+    ("igsn_lib.prefix", HEAVY_MODULES + ("sqlalchemy",)),
+    ("igsn_lib.ratelimit", HEAVY_MODULES + ("sqlalchemy",)),
+    ("igsn_lib.retry", HEAVY_MODULES + ("sqlalchemy",)),
+    ("igsn_lib.timing", HEAVY_MODULES + ("sqlalchemy",)),
+    ("igsn_lib.models", HEAVY_MODULES),
+    ("igsn_lib.models.thing", HEAVY_MODULES),
+]
+
+
+def importTimes(module):
+    """
+    Import module in a new interpreter, returning {name: cumulative microseconds}
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    res = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            res[parts[2].strip()] = int(parts[1])
+        except ValueError:
+            # header line
+            pass
+    return res
+
+
+@pytest.mark.parametrize("module,excluded", import_values)
+def test_importtime(module, excluded):
+    times = importTimes(module)
+    loaded = {name.split(".")[0] for name in times}
+    assert loaded.isdisjoint(excluded)
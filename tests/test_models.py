@@ -0,0 +1,612 @@
+import pytest
+import sqlalchemy
+import sqlalchemy.exc
+import igsn_lib.oai
+import igsn_lib.time
+import igsn_lib.models
+import igsn_lib.models.thing
+
+RECORD_TEMPLATE = """<record xmlns="http://www.openarchives.org/OAI/2.0/" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+<header>
+    <identifier>oai:registry.igsn.org:{n}</identifier>
+    <datestamp>2013-06-19T17:28:{n:02d}Z</datestamp>
+    <setSpec>IEDA</setSpec>
+</header>
+<metadata>
+    <sample xmlns="http://igsn.org/schema/kernel-v.1.0">
+        <sampleNumber identifierType="igsn">10273/TEST{n:05d}</sampleNumber>
+        <registrant>
+            <registrantName>IEDA</registrantName>
+        </registrant>
+        <log>
+            <logElement event="submitted" timeStamp="2013-06-19T03:28:20Z"/>
+        </log>
+    </sample>
+</metadata>
+</record>"""
+
+
+class FakeRecord:
+    def __init__(self, raw):
+        self.raw = raw
+
+
+class FakeToken:
+    def __init__(self, n):
+        self.complete_list_size = str(n)
+
+
+class FakeRecords:
+    def __init__(self, raws, token=True):
+        self._raws = raws
+        self.resumption_token = FakeToken(len(raws)) if token else None
+
+    def __iter__(self):
+        for raw in self._raws:
+            yield FakeRecord(raw)
+
+
+class FakeSickle:
+    def __init__(self, raws, token=True):
+        self.raws = raws
+        self.token = token
+
+    def ListRecords(self, ignore_deleted=True, **kwargs):
+        return FakeRecords(self.raws, token=self.token)
+
+
+@pytest.fixture
+def session():
+    engine = igsn_lib.models.getEngine("sqlite://")
+    session = igsn_lib.models.getSession(engine)
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def service(session):
+    svc = igsn_lib.models.Service(
+        url="http://oai.example.org/oai", tearliest=igsn_lib.time.dtnow()
+    )
+    session.add(svc)
+    session.commit()
+    return svc
+
+
+def _records(ns):
+    return [RECORD_TEMPLATE.format(n=n) for n in ns]
+
+
+def _identifiers(service, ns):
+    res = []
+    for raw in _records(ns):
+        igsn = igsn_lib.models.Identifier(service_id=service.id)
+        igsn.fromOAIRecord(raw)
+        res.append(igsn)
+    return res
+
+
+def test_bulkInsertIdentifiers(session, service):
+    identifiers = _identifiers(service, range(5))
+    assert igsn_lib.models.bulkInsertIdentifiers(session, identifiers) == 5
+    session.commit()
+    identifiers = _identifiers(service, range(3, 8))
+    assert igsn_lib.models.bulkInsertIdentifiers(session, identifiers) == 3
+    session.commit()
+    assert session.query(igsn_lib.models.Identifier).count() == 8
+    rec = session.query(igsn_lib.models.Identifier).get("TEST00001")
+    assert rec.registrant == "IEDA"
+    assert rec.related is None
+
+
+def test_bulkInsertIdentifiers_chunked(monkeypatch, session, service):
+    # Two rows per statement
+    n_columns = len(igsn_lib.models.Identifier.__table__.columns)
+    monkeypatch.setattr(igsn_lib.models, "BULK_INSERT_MAX_PARAMETERS", 2 * n_columns)
+    identifiers = _identifiers(service, range(5))
+    assert igsn_lib.models.bulkInsertIdentifiers(session, identifiers) == 5
+    session.commit()
+    identifiers = _identifiers(service, [3, 4, 5, 6, 6])
+    assert igsn_lib.models._insertIdentifiersEach(session, identifiers) == 2
+    session.commit()
+    assert session.query(igsn_lib.models.Identifier).count() == 7
+
+
+def test_bulkInsertIdentifiers_legacySqlite(monkeypatch, session, service):
+    import sqlite3
+
+    monkeypatch.setattr(sqlite3, "sqlite_version_info", (3, 31, 1))
+    assert igsn_lib.models._maxBindParameters("sqlite") == 999
+    assert igsn_lib.models._maxBindParameters("postgresql") == 32766
+    n_columns = len(igsn_lib.models.Identifier.__table__.columns)
+    # Parsing records is slow, so build the rows directly
+    identifiers = [
+        igsn_lib.models.Identifier(id=f"TEST{n:05d}", service_id=service.id)
+        for n in range(999 // n_columns + 5)
+    ]
+    assert igsn_lib.models.bulkInsertIdentifiers(session, identifiers) == len(
+        identifiers
+    )
+    monkeypatch.setattr(sqlite3, "sqlite_version_info", (3, 32, 0))
+    assert igsn_lib.models._maxBindParameters("sqlite") == 32766
+
+
+@pytest.mark.parametrize("batch_size", [None, 3])
+@pytest.mark.parametrize(
+    "engine", [igsn_lib.oai.ENGINE_XMLTODICT, igsn_lib.oai.ENGINE_ETREE]
+)
+def test_jobExecute(monkeypatch, session, service, batch_size, engine):
+    raws = _records(range(7))
+    monkeypatch.setattr(igsn_lib.oai, "getSickle", lambda url: FakeSickle(raws))
+    job = service.createJob(session=session)
+    new_count, counter, total = job.execute(
+        session, batch_size=batch_size, engine=engine
+    )
+    assert (new_count, counter, total) == (7, 7, 7)
+    # sqlite does not retain the timezone
+    assert job.tlast_record.strftime("%Y-%m-%dT%H:%M:%S") == "2013-06-19T17:28:06"
+    # Running again adds nothing
+    job.tlast_record = None
+    new_count, counter, total = job.execute(session, batch_size=batch_size)
+    assert (new_count, counter, total) == (0, 7, 7)
+    assert session.query(igsn_lib.models.Identifier).count() == 7
+
+
+def test_jobExecute_singlePage(monkeypatch, session, service):
+    raws = _records(range(3))
+    fake = FakeSickle(raws, token=False)
+    monkeypatch.setattr(igsn_lib.oai, "getSickle", lambda url: fake)
+    job = service.createJob(session=session)
+    assert job.execute(session, batch_size=10) == (3, 3, 3)
+
+
+def test_jobExecute_failedBatch(monkeypatch, session, service):
+    raws = _records(range(7))
+    monkeypatch.setattr(igsn_lib.oai, "getSickle", lambda url: FakeSickle(raws))
+    job = service.createJob(session=session)
+    bulkInsert = igsn_lib.models.bulkInsertIdentifiers
+    calls = []
+
+    def _failSecond(session, identifiers):
+        calls.append(len(identifiers))
+        if len(calls) == 2:
+            raise sqlalchemy.exc.OperationalError("insert", {}, None)
+        return bulkInsert(session, identifiers)
+
+    monkeypatch.setattr(igsn_lib.models, "bulkInsertIdentifiers", _failSecond)
+    with pytest.raises(sqlalchemy.exc.OperationalError):
+        job.execute(session, batch_size=3)
+    # tlast_record is that of the last batch written
+    assert job.tlast_record.strftime("%Y-%m-%dT%H:%M:%S") == "2013-06-19T17:28:02"
+    assert session.query(igsn_lib.models.Identifier).count() == 3
+
+
+class WindowSickle:
+    """Serves a different set of records per requested time window."""
+
+    def __init__(self, windows, fail=None):
+        self.windows = windows
+        self.fail = fail if fail is not None else set()
+
+    def ListRecords(self, ignore_deleted=True, **kwargs):
+        if kwargs["from"] in self.fail:
+            self.fail.discard(kwargs["from"])
+            raise ConnectionError("provider unavailable")
+        return FakeRecords(self.windows[kwargs["from"]])
+
+
+def test_executeJobPackage(monkeypatch, tmp_path):
+    engine = igsn_lib.models.getEngine(f"sqlite:///{tmp_path / 'harvest.db'}")
+    session_factory = igsn_lib.models.getSession(engine)
+    session = session_factory()
+    svc = igsn_lib.models.Service(
+        url="http://oai.example.org/oai",
+        tearliest=igsn_lib.time.datetimeFromSomething("2013-01-01T00:00:00Z"),
+    )
+    session.add(svc)
+    session.commit()
+    jobs = svc.createJobPackage(
+        session=session,
+        tuntil=igsn_lib.time.datetimeFromSomething("2013-05-01T00:00:00Z"),
+        tdelta=30,
+    )
+    windows = {}
+    for i, job in enumerate(jobs):
+        tfrom = job.tfrom.strftime(igsn_lib.time.OAI_TIME_FORMAT)
+        windows[tfrom] = _records(range(i * 10, i * 10 + 10))
+    failing = list(windows.keys())[1]
+    fake = WindowSickle(windows, fail={failing})
+    monkeypatch.setattr(igsn_lib.oai, "getSickle", lambda url: fake)
+    session.close()
+
+    reported = []
+    results = igsn_lib.models.executeJobPackage(
+        session_factory,
+        jobs,
+        workers=3,
+        batch_size=4,
+        progress=reported.append,
+        engine=igsn_lib.oai.ENGINE_ETREE,
+    )
+    assert len(results) == len(jobs) == len(reported)
+    failed = [r for r in results if r["error"] is not None]
+    assert len(failed) == 1
+    assert failed[0]["tfrom"].startswith(failing[:10])
+    assert sum(r["new"] for r in results) == (len(jobs) - 1) * 10
+
+    # Failed windows can be retried on their own
+    retry = [job for job in jobs if job.id == failed[0]["job_id"]]
+    results = igsn_lib.models.executeJobPackage(session_factory, retry, workers=3)
+    assert results[0]["error"] is None
+    assert results[0]["new"] == 10
+    session = session_factory()
+    assert session.query(igsn_lib.models.Identifier).count() == len(jobs) * 10
+    session.close()
+
+
+class SlowSickle:
+    """Records the running ListRecords calls per service as each one starts."""
+
+    def __init__(self, url, active, starts, lock):
+        self.url = url
+        self.active = active
+        self.starts = starts
+        self.lock = lock
+
+    def ListRecords(self, ignore_deleted=True, **kwargs):
+        import time
+
+        with self.lock:
+            self.active[self.url] += 1
+            self.starts.append(dict(self.active))
+        time.sleep(0.2)
+        with self.lock:
+            self.active[self.url] -= 1
+        return FakeRecords([])
+
+
+def test_executeJobPackage_providerLimit(monkeypatch, tmp_path):
+    import threading
+
+    engine = igsn_lib.models.getEngine(f"sqlite:///{tmp_path / 'harvest.db'}")
+    session_factory = igsn_lib.models.getSession(engine)
+    session = session_factory()
+    t0 = igsn_lib.time.datetimeFromSomething("2013-01-01T00:00:00Z")
+    t1 = igsn_lib.time.datetimeFromSomething("2013-03-01T00:00:00Z")
+    urls = ["http://a.example.org/oai", "http://b.example.org/oai"]
+    for url in urls:
+        svc = igsn_lib.models.Service(url=url, tearliest=t0)
+        session.add(svc)
+        session.commit()
+        svc.createJobPackage(session=session, tuntil=t1, tdelta=20)
+    jobs = session.query(igsn_lib.models.Job).order_by(igsn_lib.models.Job.id).all()
+    session.close()
+    active = {url: 0 for url in urls}
+    starts = []
+    lock = threading.Lock()
+    monkeypatch.setattr(
+        igsn_lib.oai, "getSickle", lambda url: SlowSickle(url, active, starts, lock)
+    )
+    # Windows of the first service are listed first, but with one slot per
+    # service the second worker must pick up the other service meanwhile
+    results = igsn_lib.models.executeJobPackage(
+        session_factory, jobs, workers=2, provider_limit=1
+    )
+    assert len(results) == len(jobs)
+    assert all(r["error"] is None for r in results)
+    assert max(n for start in starts for n in start.values()) == 1
+    assert starts[1] == {urls[0]: 1, urls[1]: 1}
+
+
+def test_createBalancedJobPackage(monkeypatch, session, service):
+    import datetime
+
+    t0 = igsn_lib.time.datetimeFromSomething("2013-01-01T00:00:00Z")
+    # A few sparse years followed by a burst of records in one month
+    stamps = [t0 + datetime.timedelta(days=d) for d in range(0, 700, 7)]
+    stamps += [
+        t0 + datetime.timedelta(days=800, minutes=7 * i + 3) for i in range(4000)
+    ]
+    probes = []
+
+    def _recordCount(svc, tfrom=None, tuntil=None, **kwargs):
+        probes.append((tfrom, tuntil))
+        return sum(1 for t in stamps if tfrom <= t <= tuntil)
+
+    monkeypatch.setattr(igsn_lib.oai, "recordCount", _recordCount)
+    tuntil = t0 + datetime.timedelta(days=1000)
+    counts = {}
+    windows = service.planWindows(
+        tfrom=t0, tuntil=tuntil, max_records=500, counts=counts
+    )
+    assert windows == sorted(windows)
+    sizes = [_recordCount(None, tfrom=a, tuntil=b) for a, b, n in windows]
+    assert sizes == [n for a, b, n in windows]
+    assert max(sizes) <= 500
+    # OAI-PMH bounds are inclusive, so adjacent windows may share a record
+    assert len(stamps) <= sum(sizes) <= len(stamps) + len(windows)
+    assert len(windows) < 15
+    # All probes are cached for reuse
+    n_probes = len(probes)
+    jobs = service.createBalancedJobPackage(
+        session=session, tfrom=t0, tuntil=tuntil, max_records=500, counts=counts
+    )
+    assert len(probes) == n_probes
+    assert len(jobs) == len(windows)
+
+
+def test_planWindows_singlePage(monkeypatch, service):
+    t0 = igsn_lib.time.datetimeFromSomething("2013-01-01T00:00:00Z")
+    t1 = igsn_lib.time.datetimeFromSomething("2013-02-01T00:00:00Z")
+    # Single page responses carry no resumptionToken
+    fake = FakeSickle(_records(range(7)), token=False)
+    monkeypatch.setattr(igsn_lib.oai, "getSickle", lambda url: fake)
+    assert igsn_lib.oai.recordCount(fake, tfrom=t0, tuntil=t1) == 7
+    windows = service.planWindows(tfrom=t0, tuntil=t1, max_records=100)
+    assert len(windows) == 1
+    assert windows[0][2] == 7
+
+
+def test_createJobPackage(session, service):
+    t0 = igsn_lib.time.datetimeFromSomething("2013-01-01T00:00:00Z")
+    t1 = igsn_lib.time.datetimeFromSomething("2013-04-15T00:00:00Z")
+    jobs = service.createJobPackage(session=session, tfrom=t0, tuntil=t1, tdelta=30)
+    assert len(jobs) == 4
+    # sqlite does not retain the timezone
+    assert jobs[0].tfrom == t0.replace(tzinfo=None)
+    assert jobs[-1].tuntil == t1.replace(tzinfo=None)
+
+
+def test_thingColumnsFromHops(session):
+    hops = [
+        igsn_lib.Hop("http://igsn.org/ABC", 302, {"Location": "http://x/ABC"}, 0.25),
+        igsn_lib.Hop(
+            "http://x/ABC",
+            200,
+            {"Content-Type": "application/JSON; charset=utf-8"},
+            0.5,
+            text='{"id": "ABC"}',
+        ),
+    ]
+    columns = igsn_lib.models.thing.thingColumnsFromHops(hops)
+    assert columns["resolved_url"] == "http://x/ABC"
+    assert columns["resolved_status"] == 200
+    assert columns["resolve_elapsed"] == 0.75
+    assert columns["resolved_media_type"] == "application/json"
+    assert columns["resolved_content"]["content"] == '{"id": "ABC"}'
+    thing = igsn_lib.models.thing.Thing(id="ABC")
+    thing.setResolved(hops)
+    session.add(thing)
+    session.commit()
+    assert thing.resolved_status == 200
+    assert thing.tresolved is not None
+
+
+def test_resolveThings(resolver_server, session):
+    Thing = igsn_lib.models.thing.Thing
+    ids = [f"IGSN:ABC{i}" for i in range(7)] + ["IGSN:FAKE1", "IGSN:ABC1", "doi:10.1/x"]
+    for identifier in ids:
+        session.add(Thing(id=identifier))
+    session.commit()
+
+    def _crash(summary):
+        raise KeyboardInterrupt()
+
+    # Interrupted after the first page is written
+    with pytest.raises(KeyboardInterrupt):
+        igsn_lib.models.thing.resolveThings(session, page_size=4, progress=_crash)
+    assert session.query(Thing).filter(Thing.tresolved != None).count() == 4
+    n_requests = len(resolver_server.requests)
+    summary = igsn_lib.models.thing.resolveThings(session, page_size=4, workers=2)
+    assert summary["count"] == 6
+    assert summary["pages"] == 2
+    assert summary["status"] == {200: 4, 404: 1}
+    # Rows of the first page were not resolved again
+    assert len(resolver_server.requests) - n_requests == 3 * 4 + 2
+    rows = session.query(Thing).filter(Thing.id == "IGSN:ABC1").all()
+    assert [r.resolved_status for r in rows] == [200, 200]
+    assert rows[0].resolved_url.endswith("/landing/ABC1")
+    assert session.query(Thing).filter(Thing.id == "doi:10.1/x").one().resolved_status is None
+    summary = igsn_lib.models.thing.resolveThings(session)
+    assert summary["count"] == 0
+    summary = igsn_lib.models.thing.resolveThings(
+        session, stale_before=igsn_lib.time.dtnow(), include_body=True
+    )
+    assert summary["count"] == 10
+    thing = session.query(Thing).filter(Thing.id == "IGSN:ABC2").one()
+    assert thing.resolved_media_type == "application/json"
+
+
+def test_resolveThings_session(monkeypatch, resolver_server, session):
+    Thing = igsn_lib.models.thing.Thing
+    for i in range(6):
+        session.add(Thing(id=f"IGSN:ABC{i}"))
+    session.commit()
+    created = []
+    create = igsn_lib.createHttpSession
+
+    def _create(**kwargs):
+        http_session = create(**kwargs)
+        created.append(http_session)
+        return http_session
+
+    monkeypatch.setattr(igsn_lib, "createHttpSession", _create)
+    workers = igsn_lib.DEFAULT_POOL_MAXSIZE + 2
+    summary = igsn_lib.models.thing.resolveThings(
+        session, page_size=2, workers=workers
+    )
+    assert summary["pages"] == 3
+    # One session serves every page and is closed at the end
+    assert len(created) == 1
+    assert len(created[0].adapters["http://"].poolmanager.pools) == 0
+    # A session passed in is used as is
+    http_session = igsn_lib.createHttpSession()
+    summary = igsn_lib.models.thing.resolveThings(
+        session,
+        stale_before=igsn_lib.time.dtnow(),
+        workers=workers,
+        http_session=http_session,
+    )
+    assert summary["count"] == 6
+    assert len(created) == 2
+    assert len(http_session.adapters["http://"].poolmanager.pools) == 1
+    http_session.close()
+
+
+def test_resolveThings_noResponse(resolver_server, session):
+    Thing = igsn_lib.models.thing.Thing
+    for i in range(3):
+        session.add(Thing(id=f"IGSN:ABC{i}"))
+    session.commit()
+
+    def _failing(value, **kwargs):
+        if value == "ABC1":
+            raise ConnectionError("resolver unavailable")
+        return igsn_lib.resolve(value, **kwargs)
+
+    summary = igsn_lib.models.thing.resolveThings(session, resolver=_failing)
+    assert summary["status"] == {200: 2, 0: 1}
+    thing = session.query(Thing).filter(Thing.id == "IGSN:ABC1").one()
+    assert thing.resolved_status == 0
+    assert thing.resolve_failures == 1
+    # Rows with no response are resolved again
+    summary = igsn_lib.models.thing.resolveThings(session)
+    assert summary["count"] == 1
+    assert summary["status"] == {200: 1}
+    session.expire_all()
+    thing = session.query(Thing).filter(Thing.id == "IGSN:ABC1").one()
+    assert thing.resolved_status == 200
+    assert thing.resolve_failures == 0
+
+
+def test_resolveThing(resolver_server, session):
+    thing = igsn_lib.models.thing.resolveThing(session, "IGSN:ABC9")
+    assert thing._id is not None
+    assert thing.resolved_status == 200
+    assert len(resolver_server.requests) == 3
+
+
+def test_resolveThings_conditional(resolver_server, session):
+    Thing = igsn_lib.models.thing.Thing
+    for i in range(3):
+        session.add(Thing(id=f"IGSN:ABC{i}"))
+    session.commit()
+    # Validators are not kept without the body
+    igsn_lib.models.thing.resolveThings(session)
+    thing = session.query(Thing).filter(Thing.id == "IGSN:ABC1").one()
+    assert thing.resolved_status == 200
+    assert thing.resolved_etag is None
+    igsn_lib.models.thing.resolveThings(
+        session, stale_before=igsn_lib.time.dtnow(), include_body=True
+    )
+    session.expire_all()
+    thing = session.query(Thing).filter(Thing.id == "IGSN:ABC1").one()
+    assert thing.resolved_content["content"] == '{"id": "ABC1"}'
+    assert thing.resolved_etag == '"v1-ABC1"'
+    assert thing.resolved_last_modified == "Wed, 21 Oct 2015 07:28:00 GMT"
+    tresolved = thing.tresolved
+    n_requests = len(resolver_server.requests)
+    summary = igsn_lib.models.thing.resolveThings(
+        session, stale_before=igsn_lib.time.dtnow(), include_body=True
+    )
+    assert summary["status"] == {304: 3}
+    sent = resolver_server.requests[n_requests:]
+    assert all(h["If-None-Match"].startswith('"v1-') for m, p, h in sent)
+    session.expire_all()
+    thing = session.query(Thing).filter(Thing.id == "IGSN:ABC1").one()
+    # Only tresolved changes on 304
+    assert thing.tresolved > tresolved
+    assert thing.resolved_status == 200
+    assert thing.resolved_content["content"] == '{"id": "ABC1"}'
+    hops = thing.resolve(session)
+    assert hops[-1].status_code == 304
+    hops = thing.resolve(session, conditional=False)
+    assert hops[-1].status_code == 200
+
+
+def test_resolveScheduler(resolver_server, session):
+    import datetime
+
+    Thing = igsn_lib.models.thing.Thing
+    now = igsn_lib.time.dtnow()
+
+    def _ago(**kwargs):
+        return now - datetime.timedelta(**kwargs)
+
+    things = [
+        Thing(id="IGSN:ABC3", tresolved=_ago(days=1), resolved_status=200),
+        Thing(id="IGSN:ABC2", tresolved=_ago(days=40), resolved_status=200),
+        Thing(id="IGSN:FAKE3", tresolved=_ago(hours=2), resolved_status=404, resolve_failures=3),
+        Thing(id="IGSN:FAKE2", tresolved=_ago(hours=2), resolved_status=404, resolve_failures=1),
+        Thing(id="IGSN:FAKE1", tresolved=_ago(minutes=10), resolved_status=404, resolve_failures=1),
+        Thing(id="IGSN:ABC1"),
+    ]
+    session.add_all(things)
+    session.commit()
+    clock = [0.0]
+    sleeps = []
+
+    def _sleep(t):
+        sleeps.append(t)
+        clock[0] += t
+
+    scheduler = igsn_lib.models.thing.ResolveScheduler(
+        session,
+        requests_per_hour=3600,
+        batch_size=2,
+        clock=lambda: clock[0],
+        sleep=_sleep,
+    )
+    assert scheduler.backoff(1) == 3600
+    assert scheduler.backoff(3) == 4 * 3600
+    # 3600 * 2**10 is the first backoff of at least 30 days
+    assert scheduler._maxFailures() == 11
+    with pytest.raises(ValueError):
+        igsn_lib.models.thing.ResolveScheduler(session, failure_backoff=0)
+    with pytest.raises(ValueError):
+        igsn_lib.models.thing.ResolveScheduler(
+            session, failure_backoff=10, max_failure_backoff=5
+        )
+    assert [row[1] for row in scheduler.plan(limit=10)] == [
+        "IGSN:ABC1",
+        "IGSN:FAKE2",
+        "IGSN:ABC2",
+    ]
+    summary = scheduler.run()
+    assert summary["count"] == 3
+    assert summary["batches"] == 2
+    assert summary["status"] == {200: 2, 404: 1}
+    # The second batch waited for the budget used by the first
+    assert sleeps == [2.0]
+    assert scheduler.plan() == []
+    failed = session.query(Thing).filter(Thing.id == "IGSN:FAKE2").one()
+    assert failed.resolve_failures == 2
+    ok = session.query(Thing).filter(Thing.id == "IGSN:ABC1").one()
+    assert ok.resolve_failures == 0
+
+
+def test_upgradeTables(tmp_path):
+    Thing = igsn_lib.models.thing.Thing
+    url = f"sqlite:///{tmp_path / 'old.db'}"
+    # A thing table as created before the conditional refresh columns
+    engine = sqlalchemy.create_engine(url)
+    with engine.begin() as connection:
+        connection.execute(
+            sqlalchemy.text(
+                "CREATE TABLE thing (_id INTEGER PRIMARY KEY, id VARCHAR NOT NULL, "
+                "tresolved DATETIME, resolved_status INTEGER)"
+            )
+        )
+        connection.execute(
+            sqlalchemy.text("INSERT INTO thing (id) VALUES ('IGSN:ABC1')")
+        )
+    added = igsn_lib.models.upgradeTables(engine)
+    assert "thing.resolved_etag" in added
+    assert "thing.resolve_failures" in added
+    assert "status_tresolved_idx" in added
+    assert igsn_lib.models.upgradeTables(engine) == []
+    session = igsn_lib.models.getSession(igsn_lib.models.getEngine(url))
+    thing = session.query(Thing).one()
+    assert thing.resolved_etag is None
+    assert thing.resolve_failures is None
+    session.close()
@@ -1,3 +1,4 @@
+import json
 import pytest
 import igsn_lib
 import igsn_lib.oai
@@ -67,9 +68,12 @@ igsn_record_values = [
 
 ]
 
+engines = [igsn_lib.oai.ENGINE_XMLTODICT, igsn_lib.oai.ENGINE_ETREE]
+
+@pytest.mark.parametrize('engine', engines)
 @pytest.mark.parametrize('record,expected', igsn_record_values)
-def test_oaiRecordToDict(record, expected):
-    data = igsn_lib.oai.oaiRecordToDict(record)
+def test_oaiRecordToDict(record, expected, engine):
+    data = igsn_lib.oai.oaiRecordToDict(record, engine=engine)
     assert data['oai_time'].isoformat() == expected['oai_time']
     assert data['igsn_time'].isoformat() == expected['igsn_time']
     assert data['registrant'] == expected['registrant']
@@ -84,3 +88,63 @@ def test_oaiRecordToDict(record, expected):
         if match is None:
             raise(f"Related record {dr['id']} not in expected")
         assert match['id_type'] == dr['id_type']
+
+
+multi_record = """<?xml version="1.0" encoding="UTF-8"?>
+<record xmlns="http://www.openarchives.org/OAI/2.0/" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+<header>
+    <identifier> oai:registry.igsn.org:18210 </identifier>
+    <datestamp>2013-06-19T17:28:22Z</datestamp>
+    <setSpec>IEDA</setSpec>
+</header>
+<metadata>
+    <sample xmlns="http://igsn.org/schema/kernel-v.1.0">
+        <sampleNumber identifierType="igsn">10273/847000107</sampleNumber>
+        <registrant>
+            <registrantName>IEDA</registrantName>
+        </registrant>
+        <log>
+            <logElement event="Registered" timeStamp="2013-06-18T03:28:20Z"/>
+            <logElement event="updated" timeStamp="2014-01-01T00:00:00Z"/>
+        </log>
+        <relatedResourceIdentifiers>
+            <relatedIdentifier relatedIdentifierType="IGSN" relationType="IsPartOf">AU1234</relatedIdentifier>
+            <relatedIdentifier relatedIdentifierType="DOI" relationType="IsCitedBy">10.1234/abc</relatedIdentifier>
+            <relatedIdentifier relatedIdentifierType="URL" relationType="IsDocumentedBy"/>
+        </relatedResourceIdentifiers>
+    </sample>
+</metadata>
+</record>"""
+
+
+@pytest.mark.parametrize('record', [r[0] for r in igsn_record_values] + [multi_record])
+def test_oaiRecordToDict_engines(record):
+    expected = igsn_lib.oai.oaiRecordToDict(record, engine=igsn_lib.oai.ENGINE_XMLTODICT)
+    data = igsn_lib.oai.oaiRecordToDict(record, engine=igsn_lib.oai.ENGINE_ETREE)
+    assert isinstance(data['_source'], igsn_lib.oai.LazySource)
+    assert dict(data.pop('_source')) == expected.pop('_source')
+    assert data == expected
+
+
+def test_oaiRecordToDict_invalid():
+    for engine in engines:
+        assert igsn_lib.oai.oaiRecordToDict("<record>", engine=engine) is None
+
+
+@pytest.mark.parametrize('engine', engines)
+def test_oaiRecordToDict_source(engine):
+    tree = igsn_lib.oai.oaiRecordToDict(multi_record, source=igsn_lib.oai.SOURCE_TREE)['_source']
+    data = igsn_lib.oai.oaiRecordToDict(multi_record, engine=engine, source=igsn_lib.oai.SOURCE_OMIT)
+    assert '_source' not in data
+    data = igsn_lib.oai.oaiRecordToDict(multi_record, engine=engine, source=igsn_lib.oai.SOURCE_LAZY)
+    assert isinstance(data['_source'], igsn_lib.oai.LazySource)
+    assert data['_source']._tree is None
+    assert data['_source']['oai:record'] == tree['oai:record']
+    as_json = json.loads(igsn_lib.oai.oaiDictRecordToJson(data, include_source=True))
+    assert as_json['_source'] == json.loads(json.dumps(tree))
+    as_json = json.loads(
+        igsn_lib.oai.oaiDictRecordToJson(data, include_source=igsn_lib.oai.SOURCE_LAZY)
+    )
+    assert as_json['_source'] == multi_record
+    as_json = json.loads(igsn_lib.oai.oaiDictRecordToJson(data))
+    assert '_source' not in as_json
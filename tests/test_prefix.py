@@ -0,0 +1,54 @@
+import pytest
+import igsn_lib.prefix
+import igsn_lib.models
+
+
+def test_prefixTrie(tmp_path):
+    trie = igsn_lib.prefix.PrefixTrie()
+    trie.insert("IE", "SESAR")
+    trie.insert("ICDP", "ICDP")
+    trie.insert("IEXYZ", "Other")
+    assert len(trie) == 3
+    assert "ie" in trie and "I" not in trie
+    assert trie.lookup("IEEJR000M") == "SESAR"
+    assert trie.longestPrefix("iexyz0001") == ("IEXYZ", "Other")
+    assert trie.lookup("ICD0001", default="none") == "none"
+    assert list(trie.annotate(["ICDP5054", "AU123"])) == [
+        ("ICDP5054", "ICDP"),
+        ("AU123", None),
+    ]
+    path = str(tmp_path / "prefixes.json")
+    trie.save(path)
+    loaded = igsn_lib.prefix.PrefixTrie.load(path)
+    assert len(loaded) == 3
+    assert list(loaded.items()) == [("ICDP", "ICDP"), ("IE", "SESAR"), ("IEXYZ", "Other")]
+    with pytest.raises(ValueError):
+        trie.insert("", "x")
+
+
+def test_fromPairs():
+    pairs = [(f"IE{c}{i:04d}", "SESAR") for c in ("EJR", "ABC") for i in range(50)]
+    pairs += [(f"ICDP{i:05d}", "ICDP") for i in range(20)]
+    pairs += [(f"IC{i:05d}", "Curtin") for i in range(20)]
+    pairs += [(f"AU{i:05d}", "GA") for i in range(99)] + [("AU99999", "CSIRO")]
+    pairs += [("12345", "Nobody"), ("XY1", None)]
+    trie = igsn_lib.prefix.PrefixTrie.fromPairs(pairs)
+    assert dict(trie.items()) == {
+        "AU": "GA",
+        "IC": "Curtin",
+        "ICD": "ICDP",
+        "IE": "SESAR",
+    }
+    assert trie.lookup("ICDP5054EEW1001") == "ICDP"
+    assert trie.lookup("IC0001") == "Curtin"
+
+
+def test_trieFromSession():
+    session = igsn_lib.models.getSession(igsn_lib.models.getEngine("sqlite://"))()
+    for i in range(10):
+        session.add(igsn_lib.models.Identifier(id=f"BSU{i:04d}", registrant="Boise"))
+    session.add(igsn_lib.models.Identifier(id="XYZ0001"))
+    session.commit()
+    trie = igsn_lib.prefix.trieFromSession(session, batch_size=3)
+    assert dict(trie.items()) == {"BS": "Boise"}
+    session.close()
@@ -0,0 +1,106 @@
+import threading
+import time
+import pytest
+import igsn_lib
+import igsn_lib.cache
+import igsn_lib.ratelimit
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    [
+        ("120", 120.0),
+        ("Wed, 21 Oct 2015 07:28:30 GMT", 30.0),
+        ("Wed, 21 Oct 2015 07:27:00 GMT", 0.0),
+        ("soon", None),
+        (None, None),
+    ],
+)
+def test_parseRetryAfter(value, expected):
+    assert igsn_lib.ratelimit.parseRetryAfter(value, now=1445412480) == expected
+
+
+def test_hostLimiter_rate():
+    limiter = igsn_lib.ratelimit.HostLimiter(rate=50, burst=1)
+    t0 = time.monotonic()
+    for i in range(6):
+        assert limiter.acquire()
+        limiter.release(200)
+    assert time.monotonic() - t0 >= 0.09
+
+
+def test_hostLimiter_aimd():
+    limiter = igsn_lib.ratelimit.HostLimiter(concurrency=4, max_concurrency=6)
+    for i in range(4):
+        assert limiter.acquire(timeout=0)
+    # Concurrency limit reached
+    assert not limiter.acquire(timeout=0)
+    limiter.release(503)
+    assert limiter.concurrency == 2
+    for i in range(3):
+        limiter.release(200)
+    assert limiter.in_flight == 0
+    assert 2 < limiter.concurrency < 4
+    for i in range(100):
+        limiter.acquire()
+        limiter.release(200)
+    assert limiter.concurrency == 6
+    for i in range(10):
+        limiter.acquire()
+        limiter.release(0)
+    assert limiter.concurrency == 1
+    assert limiter.stats()["throttled"] == 11
+
+
+def test_hostLimiter_retryAfter():
+    limiter = igsn_lib.ratelimit.HostLimiter()
+    limiter.acquire()
+    limiter.release(429, retry_after="0.3")
+    assert not limiter.acquire(timeout=0.1)
+    assert limiter.acquire(timeout=1)
+
+
+def test_hostLimiter_threads():
+    limiter = igsn_lib.ratelimit.HostLimiter(concurrency=2, increase=0)
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def _work():
+        limiter.acquire()
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        time.sleep(0.01)
+        with lock:
+            active.pop()
+        limiter.release(200)
+
+    threads = [threading.Thread(target=_work) for i in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert max(peak) <= 2
+
+
+def test_resolve_limiter(resolver_server):
+    limiter = igsn_lib.ratelimit.RateLimiter(hosts={"127.0.0.1": {"concurrency": 2}})
+    negative = igsn_lib.cache.NegativeResolveCache()
+    results = dict(
+        igsn_lib.resolveMany(
+            [f"ABC{i}" for i in range(10)], workers=4, limiter=limiter
+        )
+    )
+    assert all(r[-1].status_code == 200 for r in results.values())
+    stats = limiter.stats()["127.0.0.1"]
+    assert stats["requests"] == 30
+    assert stats["concurrency"] > 2
+    responses = igsn_lib.resolve("BUSY1", limiter=limiter, negative_cache=negative)
+    assert responses[-1].status_code == 429
+    # Throttled responses are not cached
+    assert len(negative) == 0
+    t0 = time.monotonic()
+    responses = igsn_lib.resolve("ABC1", limiter=limiter)
+    assert responses[-1].status_code == 200
+    assert time.monotonic() - t0 >= 0.5
@@ -0,0 +1,369 @@
+import hashlib
+import pytest
+import igsn_lib
+
+'''
+Resolver tests against the local stand-in server in conftest.py
+'''
+
+
+@pytest.mark.parametrize("igsn_val,status_code", [("ABC123", 200), ("AU1234IAMFAKE", 404)])
+def test_resolve_local(resolver_server, igsn_val, status_code):
+    responses = igsn_lib.resolve(igsn_val, include_body=True)
+    assert responses[-1].status_code == status_code
+    if status_code == 200:
+        assert len(responses) == 3
+        assert responses[-1].json() == {"id": igsn_val}
+
+
+def test_resolve_session(resolver_server):
+    session = igsn_lib.createHttpSession(pool_maxsize=2)
+    for i in range(5):
+        responses = igsn_lib.resolve(f"ABC{i}", session=session)
+        assert responses[-1].status_code == 200
+    # All 15 hops were made over a single kept-alive connection
+    assert len(resolver_server.requests) == 15
+    assert resolver_server.connections == 1
+
+
+def test_getHttpSession():
+    assert igsn_lib.getHttpSession() is igsn_lib.getHttpSession()
+
+
+def test_resolveMany(resolver_server):
+    consumed = []
+
+    def _identifiers():
+        for i in range(50):
+            consumed.append(i)
+            yield f"ABC{i}" if i % 5 else f"FAKE{i}"
+
+    results = {}
+    for identifier, responses in igsn_lib.resolveMany(
+        _identifiers(), workers=4, max_pending=6
+    ):
+        # Input is only read a bounded distance ahead of the results
+        assert len(consumed) <= len(results) + 6
+        results[identifier] = responses[-1].status_code
+    assert len(results) == 50
+    assert results["ABC1"] == 200
+    assert results["FAKE0"] == 404
+
+
+def test_resolveMany_session(monkeypatch, resolver_server):
+    created = []
+    create = igsn_lib.createHttpSession
+
+    def _create(**kwargs):
+        session = create(**kwargs)
+        session.closed = False
+        close = session.close
+
+        def _close():
+            session.closed = True
+            close()
+
+        session.close = _close
+        created.append(session)
+        return session
+
+    monkeypatch.setattr(igsn_lib, "createHttpSession", _create)
+    ids = [f"ABC{i}" for i in range(5)]
+    workers = igsn_lib.DEFAULT_POOL_MAXSIZE + 2
+    assert len(list(igsn_lib.resolveMany(ids, workers=workers))) == 5
+    assert len(created) == 1 and created[0].closed
+    # Also closed when the results are abandoned
+    results = igsn_lib.resolveMany(ids, workers=workers)
+    next(results)
+    results.close()
+    assert len(created) == 2 and created[1].closed
+    # A session passed in is left open for the caller
+    session = _create()
+    list(igsn_lib.resolveMany(ids, workers=workers, session=session))
+    assert len(created) == 3 and not session.closed
+
+
+def test_resolve_cache(resolver_server):
+    import igsn_lib.cache
+
+    cache = igsn_lib.cache.MemoryResolveCache(maxsize=2)
+    responses = igsn_lib.resolve("ABC1", include_body=True, cache=cache)
+    n_requests = len(resolver_server.requests)
+    cached = igsn_lib.resolve("ABC1", include_body=True, cache=cache)
+    assert len(resolver_server.requests) == n_requests
+    assert [r.url for r in cached] == [r.url for r in responses]
+    assert cached[-1].json() == {"id": "ABC1"}
+    assert cached[-1].content == responses[-1].content
+    assert cached[-1].elapsed == responses[-1].elapsed
+    assert cached[0].headers["location"] == responses[0].headers["Location"]
+    # HEAD and GET are cached separately, failures are not cached
+    igsn_lib.resolve("ABC1", cache=cache)
+    igsn_lib.resolve("FAKE1", cache=cache)
+    igsn_lib.resolve("FAKE1", cache=cache)
+    igsn_lib.resolve("ABC2", cache=cache)
+    assert cache.stats() == {"hits": 1, "misses": 5, "evictions": 1, "size": 2}
+
+
+def test_resolve_cache_ttl(resolver_server):
+    import igsn_lib.cache
+
+    cache = igsn_lib.cache.MemoryResolveCache(ttl=-1)
+    igsn_lib.resolve("ABC1", cache=cache)
+    igsn_lib.resolve("ABC1", cache=cache)
+    assert len(resolver_server.requests) == 6
+    assert cache.stats()["evictions"] == 1
+
+
+def test_sqlite_cache(resolver_server, tmp_path):
+    import igsn_lib.cache
+
+    path = str(tmp_path / "cache.db")
+    cache = igsn_lib.cache.SqliteResolveCache(path, maxsize=2)
+    for i in range(3):
+        igsn_lib.resolve(f"ABC{i}", cache=cache)
+    assert len(cache) == 2
+    cache.close()
+    n_requests = len(resolver_server.requests)
+    cache = igsn_lib.cache.SqliteResolveCache(path)
+    responses = igsn_lib.resolve("ABC2", cache=cache)
+    assert len(resolver_server.requests) == n_requests
+    assert responses[-1].status_code == 200
+    igsn_lib.resolve("ABC0", cache=cache)
+    assert len(resolver_server.requests) == n_requests + 3
+    assert cache.stats()["hits"] == 1
+    # Replacing an entry does not change the count
+    cache.put("replaced", responses)
+    cache.put("replaced", responses)
+    assert len(cache) == 4
+    cache.close()
+    cache = igsn_lib.cache.SqliteResolveCache(path, maxsize=2)
+    assert len(cache) == 4
+    cache.put("new", responses)
+    assert len(cache) == 2
+    assert cache.stats()["evictions"] == 3
+    cache.close()
+
+
+def test_resolveMany_cache(resolver_server):
+    import igsn_lib.cache
+
+    cache = igsn_lib.cache.MemoryResolveCache()
+    ids = [f"ABC{i % 5}" for i in range(20)]
+    results = list(igsn_lib.resolveMany(ids, workers=1, cache=cache))
+    assert len(results) == 20
+    assert len(resolver_server.requests) == 15
+
+
+def test_resolve_negative_cache(resolver_server):
+    import igsn_lib.cache
+
+    cache = igsn_lib.cache.MemoryResolveCache()
+    negative = igsn_lib.cache.NegativeResolveCache(maxsize=2)
+    for i in range(3):
+        responses = igsn_lib.resolve(
+            "AU1234IAMFAKE", cache=cache, negative_cache=negative
+        )
+        assert responses[-1].status_code == 404
+    # Only the first attempt reached the server
+    assert len(resolver_server.requests) == 2
+    assert len(cache) == 0
+    assert negative.stats()["hits"] == 2
+    igsn_lib.resolve("ABC1", cache=cache, negative_cache=negative)
+    assert len(cache) == 1 and len(negative) == 1
+    for i in range(3):
+        igsn_lib.resolve(f"FAKE{i}", negative_cache=negative)
+    assert len(negative) == 2
+    assert negative.stats()["evictions"] == 2
+    # Rate limited resolutions are transient and not cached
+    responses = igsn_lib.resolve("BUSY1", negative_cache=negative)
+    assert responses[-1].status_code == 429
+    assert negative.stats()["evictions"] == 2
+    assert len(negative) == 2
+
+
+def test_igsnPrefix():
+    assert igsn_lib.igsnPrefix("IEEJR000M") == "IEEJR"
+    assert igsn_lib.igsnPrefix("prr047915") == "PRR"
+    assert igsn_lib.igsnPrefix("000fake-id") is None
+
+
+def test_resolve_templates(resolver_server, tmp_path):
+    import igsn_lib.cache
+    import igsn_lib.retry
+    import igsn_lib.templates
+
+    templates = igsn_lib.templates.RedirectTemplates(min_observations=2)
+    igsn_lib.resolve("ABC1", templates=templates, predict=True)
+    assert templates.predict("ABC9") is None
+    igsn_lib.resolve("ABC2", templates=templates, predict=True)
+    assert templates.predict("ABC9") == f"{resolver_server.url}/landing/ABC9"
+    n_requests = len(resolver_server.requests)
+    responses = igsn_lib.resolve("ABC3", include_body=True, templates=templates, predict=True)
+    assert len(resolver_server.requests) == n_requests + 1
+    assert len(responses) == 1
+    assert responses[-1].json() == {"id": "ABC3"}
+    # The prediction is retried like any other step
+    checked = []
+
+    class _Policy(igsn_lib.retry.RetryPolicy):
+        def shouldRetry(self, attempt, response=None):
+            checked.append(response.url)
+            return super().shouldRetry(attempt, response)
+
+    igsn_lib.resolve("ABC7", templates=templates, predict=True, retry=_Policy())
+    assert checked == [f"{resolver_server.url}/landing/ABC7"]
+    # Predicted results are not cached as the chain, nor learnt from
+    cache = igsn_lib.cache.MemoryResolveCache()
+    igsn_lib.resolve("ABC5", templates=templates, predict=True, cache=cache)
+    assert len(cache) == 0
+    assert templates.asDict()["ABC"]["count"] == 2
+
+    # A wrong template falls back to the full chain and is replaced, after
+    # which the prefix is ambiguous and not predicted
+    path = str(tmp_path / "templates.json")
+    templates.save(path)
+    with open(path) as f:
+        wrong = f.read().replace("/landing/", "/missing/")
+    with open(path, "w") as f:
+        f.write(wrong)
+    templates = igsn_lib.templates.RedirectTemplates.load(path)
+    n_requests = len(resolver_server.requests)
+    responses = igsn_lib.resolve("ABC4", templates=templates, predict=True)
+    assert len(resolver_server.requests) == n_requests + 4
+    assert len(responses) == 3
+    assert responses[-1].status_code == 200
+    assert templates.asDict()["ABC"] == {
+        "template": f"{resolver_server.url}/landing/{{igsn}}",
+        "count": 1,
+        "conflicts": 1,
+    }
+    igsn_lib.resolve("ABC5", templates=templates, predict=True)
+    igsn_lib.resolve("ABC6", templates=templates, predict=True)
+    assert templates.predict("ABC9") is None
+
+
+def test_resolve_compact(resolver_server):
+    full = igsn_lib.resolve("ABC1", include_body=True)
+    hops = igsn_lib.resolve("ABC1", include_body=True, compact=True)
+    assert [h.url for h in hops] == [r.url for r in full]
+    assert [h.status_code for h in hops] == [r.status_code for r in full]
+    assert hops[0].headers["Location"].endswith("/hdl/ABC1")
+    assert hops[-1].headers["Content-Type"] == "application/json"
+    assert hops[-1].headers.get("content-type") == "application/json"
+    assert hops[-1].asJsonDict()["headers"]["Content-Type"] == "application/json"
+    assert hops[-1].json() == {"id": "ABC1"}
+    assert hops[-1].elapsed >= 0
+    assert not hasattr(hops[-1], "__dict__")
+    hops = igsn_lib.resolve(
+        "ABC12345",
+        include_body=True,
+        compact={"max_body": 4, "hash_body": True},
+    )
+    assert hops[-1].text == '{"id'
+    assert hops[-1].truncated
+    assert len(hops[-1].sha256) == 64
+    hops = igsn_lib.resolve("ABC1", compact={"keep_body": False})
+    assert hops[-1].text is None
+
+
+def test_resolve_body(resolver_server):
+    responses = igsn_lib.resolve("HTML1", include_body=True)
+    # Only the final response body is read
+    assert [len(r.content) for r in responses] == [0, 0, 100013]
+    responses = igsn_lib.resolve(
+        "HTML1", include_body=True, body_types=igsn_lib.DEFAULT_BODY_MEDIA_TYPES
+    )
+    assert responses[-1].status_code == 200
+    assert responses[-1].text == ""
+    responses = igsn_lib.resolve(
+        "ABC1", include_body=True, body_types=igsn_lib.DEFAULT_BODY_MEDIA_TYPES
+    )
+    assert responses[-1].json() == {"id": "ABC1"}
+    responses = igsn_lib.resolve("HTML1", include_body=True, max_body=100)
+    assert responses[-1].content == b"<html>" + b" " * 94
+    assert responses[-1].truncated
+    assert responses[-1].sha256 == hashlib.sha256(responses[-1].content).hexdigest()
+    hops = igsn_lib.resolve(
+        "HTML1", include_body=True, max_body=100, compact={"hash_body": True}
+    )
+    assert hops[-1].text == "<html>" + " " * 94
+    assert hops[-1].truncated
+    assert hops[-1].sha256 == responses[-1].sha256
+
+
+def test_resolve_follow_links(resolver_server):
+    responses = igsn_lib.resolve("LINKED1", include_body=True, follow_links=True)
+    assert [r.status_code for r in responses] == [302, 302, 200, 200]
+    assert responses[-1].url == f"{resolver_server.url}/meta/LINKED1"
+    assert responses[-1].json() == {"@id": "LINKED1"}
+    assert [(m, p) for m, p, h in resolver_server.requests] == [
+        ("HEAD", "/igsn/LINKED1"),
+        ("HEAD", "/hdl/LINKED1"),
+        ("HEAD", "/landing/LINKED1"),
+        ("GET", "/meta/LINKED1"),
+    ]
+    # The alternate link is followed if XML is accepted
+    responses = igsn_lib.resolve("LINKED1", follow_links=["text/xml"])
+    assert responses[-1].url == f"{resolver_server.url}/alt/LINKED1"
+    # Without a metadata link the final response body is retrieved
+    n_requests = len(resolver_server.requests)
+    responses = igsn_lib.resolve("ABC1", include_body=True, follow_links=True)
+    assert len(responses) == 3
+    assert responses[-1].json() == {"id": "ABC1"}
+    assert [m for m, p, h in resolver_server.requests[n_requests:]] == [
+        "HEAD",
+        "HEAD",
+        "HEAD",
+        "GET",
+    ]
+
+
+def test_resolve_follow_links_cache(resolver_server):
+    import igsn_lib.cache
+    import igsn_lib.templates
+
+    cache = igsn_lib.cache.MemoryResolveCache()
+    templates = igsn_lib.templates.RedirectTemplates(min_observations=1)
+    # Following links and not are cached and learnt separately
+    responses = igsn_lib.resolve(
+        "LINKED1", follow_links=True, cache=cache, templates=templates, predict=True
+    )
+    assert responses[-1].url == f"{resolver_server.url}/meta/LINKED1"
+    assert len(templates) == 0
+    responses = igsn_lib.resolve("LINKED1", cache=cache, templates=templates)
+    assert responses[-1].url == f"{resolver_server.url}/landing/LINKED1"
+    assert len(cache) == 2
+    responses = igsn_lib.resolve("LINKED1", follow_links=True, cache=cache)
+    assert responses[-1].url == f"{resolver_server.url}/meta/LINKED1"
+    assert cache.stats()["hits"] == 1
+    # Predictions are not used when following links
+    responses = igsn_lib.resolve(
+        "LINKED2", follow_links=True, templates=templates, predict=True
+    )
+    assert responses[-1].url == f"{resolver_server.url}/meta/LINKED2"
+
+
+def test_resolve_cache_body_options(resolver_server):
+    import igsn_lib.cache
+
+    cache = igsn_lib.cache.MemoryResolveCache()
+    responses = igsn_lib.resolve("HTML1", include_body=True, max_body=10, cache=cache)
+    assert len(responses[-1].content) == 10
+    responses = igsn_lib.resolve(
+        "HTML1",
+        include_body=True,
+        body_types=igsn_lib.DEFAULT_BODY_MEDIA_TYPES,
+        cache=cache,
+    )
+    assert responses[-1].content == b""
+    # Neither the truncated nor the filtered body is returned for the full body
+    responses = igsn_lib.resolve("HTML1", include_body=True, cache=cache)
+    assert len(responses[-1].content) == 100013
+    assert len(cache) == 3
+    cached = igsn_lib.resolve("HTML1", include_body=True, max_body=10, cache=cache)
+    assert len(cached[-1].content) == 10
+    assert cache.stats()["hits"] == 1
+    assert cached[-1].truncated
+    assert cached[-1].sha256 is not None
+    assert cached[-1].ttfb is not None
+    assert igsn_lib.Hop.fromResponse(cached[-1]).truncated
@@ -0,0 +1,79 @@
+import time
+import pytest
+import igsn_lib
+import igsn_lib.cache
+import igsn_lib.retry
+
+
+class Response:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers if headers is not None else {}
+
+
+def test_retryPolicy():
+    policy = igsn_lib.retry.RetryPolicy(retries=2, backoff=1, max_backoff=3)
+    assert policy.shouldRetry(0)
+    assert policy.shouldRetry(1, Response(503))
+    assert not policy.shouldRetry(0, Response(404))
+    assert not policy.shouldRetry(2, Response(503))
+    for attempt in range(5):
+        assert 0 <= policy.delay(attempt) <= min(3, 2 ** attempt)
+    assert policy.delay(0, Response(429, {"Retry-After": "2"})) == 2
+    # Retry-After longer than max_backoff is ignored
+    assert policy.delay(0, Response(429, {"Retry-After": "60"})) <= 1
+
+
+def test_circuitBreaker():
+    breaker = igsn_lib.retry.CircuitBreaker(threshold=2, cooldown=0.2)
+    url = "http://example.org/x"
+    breaker.check(url)
+    breaker.record(url, Response(503))
+    breaker.record(url, Response(200))
+    breaker.record(url, None)
+    assert breaker.state("example.org") == igsn_lib.retry.STATE_CLOSED
+    breaker.record(url, Response(502))
+    assert breaker.state("example.org") == igsn_lib.retry.STATE_OPEN
+    with pytest.raises(igsn_lib.retry.CircuitOpenError):
+        breaker.check(url)
+    # Other hosts are not affected
+    breaker.check("http://example.com/x")
+    time.sleep(0.25)
+    # One probe after the cooldown
+    breaker.check(url)
+    with pytest.raises(igsn_lib.retry.CircuitOpenError):
+        breaker.check(url)
+    breaker.record(url, None)
+    assert breaker.state("example.org") == igsn_lib.retry.STATE_OPEN
+    time.sleep(0.25)
+    breaker.check(url)
+    breaker.record(url, Response(404))
+    assert breaker.state("example.org") == igsn_lib.retry.STATE_CLOSED
+    assert breaker.rejected == 2
+
+
+def test_resolve_retry(resolver_server):
+    responses = igsn_lib.resolve("FLAKY1")
+    assert responses[-1].status_code == 503
+    policy = igsn_lib.retry.RetryPolicy(retries=2, backoff=0.01)
+    responses = igsn_lib.resolve("FLAKY2", retry=policy)
+    assert responses[-1].status_code == 200
+    assert len(responses) == 3
+    assert len(resolver_server.requests) == 2 + 4
+
+
+def test_resolve_breaker(monkeypatch):
+    # Nothing listens on port 1, so connections are refused
+    monkeypatch.setattr(igsn_lib, "IGSN_RESOLVER_URL", "http://127.0.0.1:1/igsn/")
+    breaker = igsn_lib.retry.CircuitBreaker(threshold=2, cooldown=60)
+    negative = igsn_lib.cache.NegativeResolveCache()
+    for i in range(2):
+        responses = igsn_lib.resolve(f"ABC{i}", breaker=breaker, negative_cache=negative)
+        assert responses[-1].status_code == 0
+        assert not responses[-1].transient
+    responses = igsn_lib.resolve("ABC3", breaker=breaker, negative_cache=negative)
+    assert responses[-1].status_code == 0
+    assert responses[-1].transient
+    assert breaker.rejected == 1
+    # Failures due to the open circuit are not cached
+    assert len(negative) == 2
@@ -1,4 +1,7 @@
+import random
+import datetime
 import pytest
+import astropy.time
 import igsn_lib.time
 import dateparser
 
@@ -19,3 +22,104 @@ def test_dateTimeToJD(jd, tstring):
     if tstring is not None:
         dt = dateparser.parse(tstring)
         assert jd == igsn_lib.time.datetimeToJD(dt)
+
+
+datetime_string_values = [
+    "2019-10-15T06:00:10Z",
+    "2019-10-15T06:00:10",
+    "2019-10-15 06:00:10+00:00",
+    "2019-10-15T06:00:10.25Z",
+    " 2013-06-19T17:28:22Z ",
+    "2013-06-19T17:28:22+02:00",
+    "15 October 2019 06:00",
+    "2020-08-15 16:30:00 ET",
+]
+
+
+@pytest.mark.parametrize("tstr", datetime_string_values)
+def test_datetimeFromString(tstr):
+    expected = dateparser.parse(
+        tstr, settings={"TIMEZONE": "+0000", "RETURN_AS_TIMEZONE_AWARE": True}
+    )
+    dt = igsn_lib.time.datetimeFromString(tstr)
+    assert dt == expected
+    assert dt.utcoffset() == expected.utcoffset()
+
+
+def test_datetimeFromString_invalid():
+    assert igsn_lib.time.datetimeFromString("2019-02-30T06:00:10Z") is None
+    assert igsn_lib.time.datetimeFromString("not a date") is None
+
+
+def _randomDatetimes(n, seed=7):
+    rnd = random.Random(seed)
+    t0 = datetime.datetime(1, 1, 1, tzinfo=datetime.timezone.utc)
+    span = (datetime.datetime.max.replace(tzinfo=datetime.timezone.utc) - t0).total_seconds()
+    res = []
+    for i in range(n):
+        dt = t0 + datetime.timedelta(seconds=rnd.uniform(0, span))
+        res.append(dt.replace(microsecond=rnd.randrange(1000000)))
+    return res
+
+
+@pytest.mark.filterwarnings("ignore::erfa.ErfaWarning")
+def test_datetimeToJD_astropy():
+    """Arithmetic conversion agrees with astropy over the datetime range"""
+    for dt in _randomDatetimes(500):
+        expected = astropy.time.Time(dt).jd
+        jd = igsn_lib.time.datetimeToJD(dt)
+        # float JD resolution is ~40 microseconds for current dates
+        assert abs(jd - expected) < 1.0e-9
+        dt2 = igsn_lib.time.jdToDateTime(jd)
+        assert abs((dt2 - dt).total_seconds()) < 1.0e-4
+        expected_dt = astropy.time.Time(jd, format="jd").to_datetime(
+            datetime.timezone.utc
+        )
+        assert abs((dt2 - expected_dt).total_seconds()) < 1.0e-4
+
+
+def test_jdToDateTime_range():
+    assert igsn_lib.time.jdToDateTime(1721425.5).isoformat() == "0001-01-01T00:00:00+00:00"
+    assert igsn_lib.time.jdToDateTime(1721425.49) is None
+    assert igsn_lib.time.jdToDateTime(5373484.5) is None
+    assert igsn_lib.time.jdToDateTime(float("nan")) is None
+    dt = datetime.datetime(2020, 9, 30, 14, 0, tzinfo=datetime.timezone(datetime.timedelta(hours=2)))
+    assert igsn_lib.time.datetimeToJD(dt) == 2459123.0
+
+
+array_jd_values = [-363521138.0, 0.0, 1721425.5, 2433282.5, 2459123.25, 1.0e9]
+
+
+@pytest.mark.filterwarnings("ignore::erfa.ErfaWarning")
+def test_arrayConversions():
+    jd = array_jd_values + [None, float("nan")]
+    ma = igsn_lib.time.jdToMaArray(jd)
+    bce = igsn_lib.time.jdToBCEArray(jd)
+    assert list(ma.mask) == [False] * len(array_jd_values) + [True, True]
+    assert list(bce.mask) == list(ma.mask)
+    for i, v in enumerate(array_jd_values):
+        assert ma[i] == pytest.approx(igsn_lib.time.jdToMa(v), rel=1e-12)
+        assert bce[i] == pytest.approx(igsn_lib.time.jdToBCE(v), rel=1e-12)
+    jd2 = igsn_lib.time.maToJdArray(ma)
+    jd3 = igsn_lib.time.bceToJdArray(bce)
+    for i, v in enumerate(array_jd_values):
+        assert jd2[i] == pytest.approx(igsn_lib.time.maToJd(ma[i]), rel=1e-12)
+        assert jd2[i] == pytest.approx(v, rel=1e-9)
+        assert jd3[i] == pytest.approx(igsn_lib.time.bceToJd(bce[i]), rel=1e-12)
+    assert list(jd2.mask) == list(ma.mask)
+
+
+def test_datetimeArrayConversions():
+    jd = array_jd_values + [None]
+    dts = igsn_lib.time.jdToDateTimeArray(jd)
+    assert list(dts.mask) == [True, True, False, False, False, True, True]
+    for i in (2, 3, 4):
+        expected = igsn_lib.time.jdToDateTime(array_jd_values[i]).replace(tzinfo=None)
+        assert dts[i].astype(datetime.datetime) == expected
+    jd2 = igsn_lib.time.datetimeToJDArray(dts)
+    assert list(jd2.mask) == list(dts.mask)
+    assert list(jd2.compressed()) == [array_jd_values[i] for i in (2, 3, 4)]
+    now = igsn_lib.time.dtnow()
+    jd3 = igsn_lib.time.datetimeToJDArray([now, None])
+    assert jd3[0] == pytest.approx(igsn_lib.time.datetimeToJD(now), abs=1e-9)
+    assert jd3.mask[1]
@@ -0,0 +1,39 @@
+import pytest
+import igsn_lib
+import igsn_lib.timing
+
+
+def test_latencyHistogram():
+    hist = igsn_lib.timing.LatencyHistogram()
+    assert hist.percentile(50) is None
+    for i in range(1, 101):
+        hist.add(i / 100.0)
+    assert hist.count == 100
+    assert hist.mean() == pytest.approx(0.505)
+    for p in (50, 95, 99):
+        assert hist.percentile(p) == pytest.approx(p / 100.0, rel=0.1)
+    assert hist.percentile(100) == 1.0
+    hist.add(10000)
+    assert hist.percentile(100) == igsn_lib.timing.HISTOGRAM_MAX
+
+
+def test_resolve_collector(resolver_server):
+    collector = igsn_lib.timing.LatencyCollector()
+    results = list(
+        igsn_lib.resolveMany(
+            [f"ABC{i}" for i in range(10)],
+            include_body=True,
+            collector=collector,
+        )
+    )
+    hops = igsn_lib.resolve("ABC1", include_body=True, compact=True)
+    assert hops[-1].ttfb > 0
+    assert hops[-1].elapsed >= hops[-1].ttfb
+    responses = results[0][1]
+    assert all(r.duration >= r.ttfb for r in responses)
+    summary = collector.summary()
+    stats = summary["127.0.0.1"]
+    assert stats["count"] == 30
+    assert stats["errors"] == 0
+    assert 0 < stats["p50"] <= stats["p95"] <= stats["p99"] <= stats["max"] * 1.1
+    assert stats["ttfb"]["p50"] > 0